@@ -1,26 +1,81 @@
 """
 FDA Data Pipeline Runner
 ========================
-Convenience script that executes the complete ETL pipeline in sequence.
-This is optional - you can also run scripts individually following the README.
+Runs the complete ETL pipeline as a task graph:
 
-PREREQUISITE: You must create database tables first!
-Run sql/01_create_tables.sql in MySQL Workbench before running this script.
+    download_ndc       -> process_ndc -------> load_ndc -----------\\
+                                      \\                            \\
+                                       match_ndc -> load_matches ---> transform -> materialize
+                                      /                            /
+    download_shortages -> process_shortages -> load_shortages -----/
+
+The NDC and shortage branches run at the same time; their processing
+stages run in separate worker processes, and --process-workers N also
+shards the NDC stage across N processes. Once both are processed,
+match_ndc matches the shortage NDCs to the NDC catalog
+(scripts/ndc_matching.py). Every task records a fingerprint of its inputs
+(file contents, settings, upstream results) in data/.pipeline_state.json,
+and is skipped on the next run when nothing it depends on changed (see
+scripts/pipeline_dag.py). A rerun with no new data only does the
+conditional download requests and a few stat() calls.
+
+Each run writes a report with per-stage wall/CPU time, peak memory, bytes
+and row counts to data/reports/ (see scripts/instrumentation.py).
+
+Loads use delta mode (scripts/delta_load.py), so rerunning against an
+existing database is safe. With FDA_DB_BACKEND=duckdb (or sqlite) the
+whole pipeline runs on an embedded database file instead of MySQL, and
+loads replace each table's rows (scripts/embedded_load.py). transform refreshes shortages_with_ndc
+(scripts/transform_data.py), and materialize rebuilds the dashboard
+summary tables (sql/02b_summary_tables.sql).
 
 Usage:
-    python run_pipeline.py
+    python run_pipeline.py                   # tables must already exist
+    python run_pipeline.py --create-schema   # create the tables if missing (no prompt)
+    python run_pipeline.py --reset-schema    # drop and recreate all tables first
+    python run_pipeline.py --skip-download   # reuse the JSON files in data/
+    python run_pipeline.py --force           # ignore fingerprints, run every task
 
 Requirements:
-    - MySQL server must be running
-    - Database tables must be created (01_create_tables.sql)
-    - Database credentials must be configured in scripts/load_to_mysql.py
+    - MySQL server must be running (unless FDA_DB_BACKEND=duckdb or sqlite)
+    - Database credentials must be set in the environment (FDA_DB_USER,
+      FDA_DB_PASSWORD, ...; see scripts/database.py)
 """
 
-import subprocess
-import sys
+import argparse
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+from sqlalchemy import inspect
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+
+from bulk_load import DEFAULT_CHUNK_ROWS, DEFAULT_STRATEGY, DEFAULT_WORKERS, STRATEGIES, quote_identifier  # noqa: E402
+from database import DB_BACKEND, DB_NAME, database_label, get_engine, pool_metrics, server_engine  # noqa: E402
+from embedded_load import load_tables_embedded, write_lock  # noqa: E402
+from download_data import DATASETS, fetch_measured  # noqa: E402
+from instrumentation import RunReport  # noqa: E402
+from pipeline_dag import FingerprintStore, Task, run_dag  # noqa: E402
+from sql_runner import run_sql_file  # noqa: E402
+from table_formats import FORMATS, table_path  # noqa: E402
+import delta_load  # noqa: E402
+import ndc_matching  # noqa: E402
+import process_data  # noqa: E402
+import transform_data  # noqa: E402
+
+CREATE_TABLES_SQL = 'sql/01_create_tables.sql'
+
+# Tasks whose results live in the database (forgotten when the schema is recreated)
+DATABASE_TASKS = ('load_ndc', 'load_shortages', 'load_matches', 'transform', 'materialize')
+
+BRANCH_TABLES = {
+    'ndc': {'labelers': 'labelers', 'raw_ndc': 'ndc_core', 'raw_ndc_packaging': 'ndc_packaging'},
+    'shortages': {'raw_drug_shortages': 'drug_shortages_core', 'shortage_contacts': 'shortage_contacts'},
+    'matches': {ndc_matching.MATCH_TABLE: ndc_matching.MATCH_TABLE},
+}
+
 
 def print_header(message):
     """Print a formatted header"""
@@ -29,121 +84,301 @@ def print_header(message):
     print(f"{'='*70}\n")
 
 
-def print_step(step_num, total_steps, description):
-    """Print step information"""
-    print(f"\n[{step_num}/{total_steps}] {description}")
-    print("-" * 70)
+# ============================================
+# Database Schema
+# ============================================
+
+def schema_version(engine):
+    """
+    Creation time of raw_ndc, or None if the schema does not exist
+
+    Part of the database tasks' fingerprints, so recreating the tables
+    outside this script (e.g. in MySQL Workbench) makes them run again.
+    Embedded databases do not record creation times, so their version is
+    the database file; ensure_schema() reports when it (re)created the
+    tables instead.
+    """
+    if engine.dialect.name != 'mysql':
+        return f"{engine.dialect.name}:{engine.url.database}" if inspect(engine).has_table('raw_ndc') else None
+    with engine.connect() as conn:
+        created = conn.exec_driver_sql(
+            f"SELECT CREATE_TIME FROM information_schema.tables "
+            f"WHERE table_schema = '{DB_NAME}' AND table_name = 'raw_ndc'"
+        ).scalar()
+    return None if created is None else str(created)
 
 
-def run_command(command, description):
+def ensure_schema(create=False, reset=False):
     """
-    Execute a command and handle errors
-    
-    Args:
-        command: Shell command to execute
-        description: Human-readable description of the step
-        
+    Make sure the tables from sql/01_create_tables.sql exist
+
     Returns:
-        bool: True if successful, False otherwise
+        tuple: (schema version (see schema_version), whether the tables were created)
     """
+    engine = server_engine()
     try:
-        result = subprocess.run(
-            command,
-            shell=True,
-            check=True,
-            capture_output=False,
-            text=True
-        )
-        print(f"✓ {description} completed successfully")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"\n✗ ERROR: {description} failed!")
-        print(f"Command: {command}")
-        print(f"Exit code: {e.returncode}")
-        return False
-
-
-def check_prerequisites():
-    """Check if user has created database tables"""
-    print("\n" + "="*70)
-    print("PREREQUISITE CHECK")
-    print("="*70)
-    print("\nBefore running this script, you must create the database tables.")
-    print("\nSteps if you haven't done this yet:")
-    print("  1. Open MySQL Workbench")
-    print("  2. File → Open SQL Script → sql/01_create_tables.sql")
-    print("  3. Click the lightning bolt ⚡ to execute")
-    print("  4. Then come back and run this script")
-    print("\n" + "="*70)
-    print("\nHave you already run sql/01_create_tables.sql?")
-    print("  [YES] Press Enter to continue")
-    print("  [NO]  Press Ctrl+C to exit and create tables first")
-    print("="*70 + "\n")
-    
-    try:
-        input()  # Wait for user confirmation
-    except KeyboardInterrupt:
-        print("\n\n✗ Exiting. Please create database tables first.")
-        print("   Run sql/01_create_tables.sql in MySQL Workbench")
-        sys.exit(0)
+        version = schema_version(engine)
+        if version is not None and not reset:
+            if not inspect(engine).has_table(ndc_matching.MATCH_TABLE,
+                                             schema=DB_NAME if engine.dialect.name == 'mysql' else None):
+                print(f"✗ ERROR: The database tables predate {ndc_matching.MATCH_TABLE}.")
+                print("   Rerun with --reset-schema to recreate them.")
+                sys.exit(1)
+            return version, False
+        if version is None and not (create or reset):
+            print("✗ ERROR: The database tables do not exist yet.")
+            print("   Rerun with --create-schema to create them, or run sql/01_create_tables.sql")
+            print("   in MySQL Workbench first.")
+            sys.exit(1)
+
+        print(f"Creating database schema with {CREATE_TABLES_SQL}...")
+        if engine.dialect.name != 'mysql':
+            run_sql_file(engine, CREATE_TABLES_SQL)
+            return schema_version(engine), True
+
+        # The script's CREATE DATABASE / USE name the default database; create
+        # the tables in the configured one (FDA_DB_NAME) instead
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"CREATE DATABASE IF NOT EXISTS {quote_identifier(DB_NAME)}")
+        schema_engine = get_engine(pool_size=1, max_overflow=0)
+        try:
+            run_sql_file(schema_engine, CREATE_TABLES_SQL, skip=('CREATE DATABASE', 'USE '))
+        finally:
+            schema_engine.dispose()
+        return schema_version(engine), True
+    finally:
+        engine.dispose()
+
+
+# ============================================
+# Task Graph
+# ============================================
+
+def build_tasks(args, engine, version, stage_pool, report):
+    """Define the pipeline tasks (processing stages run on stage_pool, metrics go to report)"""
+    fmt = args.format
+
+    def code(*names):
+        return [os.path.join('scripts', name) for name in names]
+
+    def outputs(branch):
+        return [table_path(name, fmt) for name in BRANCH_TABLES[branch].values()]
+
+    def download(name):
+        def run():
+            return fetch_measured(report, name, DATASETS[name])
+        return run
+
+    def process(stage):
+        def run():
+            result, metrics = stage_pool.submit(process_data.run_stage_measured, stage, fmt, args.streaming,
+                                                args.batch_size, args.process_workers).result()
+            report.add(metrics)
+            return ', '.join(f"{name} {count}" for name, count in result['tables'].items())
+        return run
+
+    def match():
+        result, metrics = stage_pool.submit(ndc_matching.run_matching_measured, fmt).result()
+        report.add(metrics)
+        return ', '.join(f"{rows} {method}" for method, rows in result['methods'].items())
+
+    def load(branch):
+        def run():
+            with report.stage(f"load_{branch}", inputs=outputs(branch)) as stage:
+                if DB_BACKEND != 'mysql':
+                    return load_embedded(branch, stage)
+                results = delta_load.load_delta(engine, BRANCH_TABLES[branch], fmt, args.strategy,
+                                                workers=args.workers, chunk_rows=args.chunk_rows)
+                stage.rows_in = sum(result.staged for result in results.values())
+                stage.rows_out = sum(result.inserted + result.updated + result.deleted
+                                     for result in results.values())
+                stage.extra['tables'] = {name: vars(result) for name, result in results.items()}
+            return '; '.join(str(result) for result in results.values())
+        return run
+
+    def load_embedded(branch, stage):
+        # Embedded databases reload the branch's tables in full
+        results = load_tables_embedded(engine, BRANCH_TABLES[branch], fmt, replace=True)
+        failed = {name: outcome for name, outcome in results.items() if isinstance(outcome, Exception)}
+        if failed:
+            raise RuntimeError('; '.join(f"{name}: {error}" for name, error in failed.items()))
+        # The other branch may be loading: wait for the database's single writer
+        with write_lock:
+            delta_load.record_reload(engine, list(results))
+        stage.rows_out = sum(result.rows for result in results.values())
+        stage.extra['tables'] = {name: {'rows': result.rows, 'seconds': round(result.seconds, 4)}
+                                 for name, result in results.items()}
+        return '; '.join(str(result) for result in results.values())
+
+    transformed = {}
+
+    def transform():
+        with report.stage('transform') as stage:
+            result = transform_data.refresh(engine)
+            stage.rows_out = result['rows']
+            stage.extra['mode'] = result['mode']
+        transformed.update(result)
+        return f"{result['mode']}, {result['rows']} rows"
+
+    def materialize():
+        # Nothing reached shortages_with_ndc, so the summaries cannot change
+        if transformed.get('mode') == 'up-to-date':
+            return "summaries already up to date"
+        with report.stage('materialize') as stage:
+            counts = transform_data.refresh_summaries(engine)
+            version = transform_data.publish_data_version(engine, counts)
+            stage.rows_out = sum(counts.values())
+            stage.extra['tables'] = counts
+            stage.extra['data_version'] = version
+        published = "unchanged" if version is None else f"data version {version}"
+        return ', '.join(f"{table} {rows}" for table, rows in counts.items()) + f"; {published}"
+
+    # Sharding and streaming produce the same files, so only the format matters
+    processing = {'format': fmt}
+    database = {'format': fmt, 'schema': version, 'backend': DB_BACKEND}
+    process_code = code('process_data.py', 'table_formats.py')
+    load_code = code('bulk_load.py', 'delta_load.py', 'embedded_load.py', 'table_formats.py')
+
+    tasks = [
+        Task('process_ndc', process('ndc'),
+             deps=[] if args.skip_download else ['download_ndc'],
+             inputs=[process_data.NDC_FILE] + process_code, outputs=outputs('ndc'), params=processing),
+        Task('process_shortages', process('shortages'),
+             deps=[] if args.skip_download else ['download_shortages'],
+             inputs=[process_data.SHORTAGES_FILE] + process_code, outputs=outputs('shortages'),
+             params=processing),
+        Task('load_ndc', load('ndc'), deps=['process_ndc'],
+             inputs=outputs('ndc') + load_code, params=database),
+        Task('load_shortages', load('shortages'), deps=['process_shortages'],
+             inputs=outputs('shortages') + load_code, params=database),
+        Task('match_ndc', match, deps=['process_ndc', 'process_shortages'],
+             inputs=outputs('ndc') + outputs('shortages') + code('ndc_matching.py', 'table_formats.py'),
+             outputs=outputs('matches'), params=processing),
+        Task('load_matches', load('matches'), deps=['match_ndc'],
+             inputs=outputs('matches') + load_code, params=database),
+        Task('transform', transform, deps=['load_ndc', 'load_shortages', 'load_matches'],
+             inputs=[transform_data.TRANSFORMATIONS_SQL] + code('transform_data.py', 'sql_runner.py'),
+             params=database),
+        Task('materialize', materialize, deps=['transform'],
+             inputs=[transform_data.SUMMARY_SQL] + code('transform_data.py'), params=database),
+    ]
+    if not args.skip_download:
+        tasks[:0] = [
+            Task('download_ndc', download('NDC'), inputs=None, outputs=[process_data.NDC_FILE]),
+            Task('download_shortages', download('Drug Shortages'), inputs=None,
+                 outputs=[process_data.SHORTAGES_FILE]),
+        ]
+    return tasks
 
 
 def main():
     """Execute the complete pipeline"""
-    
+    parser = argparse.ArgumentParser(description="Run the FDA drug shortage pipeline")
+    parser.add_argument('--create-schema', action='store_true',
+                        help="create the database tables if they do not exist (no prompt)")
+    parser.add_argument('--reset-schema', action='store_true',
+                        help="drop and recreate all database tables before loading")
+    parser.add_argument('--skip-download', action='store_true',
+                        help="use the JSON files already in data/")
+    parser.add_argument('--force', action='store_true',
+                        help="run every task even if its inputs did not change")
+    parser.add_argument('--format', choices=FORMATS, default='csv',
+                        help="intermediate file format (default: csv)")
+    parser.add_argument('--streaming', action='store_true',
+                        help="process the NDC file incrementally (see process_data.py)")
+    parser.add_argument('--batch-size', type=int, default=process_data.DEFAULT_BATCH_SIZE,
+                        help=f"NDC records per batch/shard (default: {process_data.DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--process-workers', type=int, default=1,
+                        help="processes sharing the NDC processing stage (default: 1)")
+    parser.add_argument('--strategy', choices=STRATEGIES, default=DEFAULT_STRATEGY,
+                        help=f"bulk load strategy (default: {DEFAULT_STRATEGY})")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"concurrent chunk loads per branch (default: {DEFAULT_WORKERS})")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f"rows per concurrently loaded chunk (default: {DEFAULT_CHUNK_ROWS})")
+    args = parser.parse_args()
+
     start_time = datetime.now()
-    
+
     print_header("FDA Drug Shortage Analysis Pipeline")
     print(f"Started at: {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
-    
+
     # Check if we're in the right directory
     if not os.path.exists("scripts/download_data.py"):
         print("✗ ERROR: Must run from project root directory")
         print("Current directory:", os.getcwd())
         sys.exit(1)
-    
-    # Check prerequisites
-    check_prerequisites()
-    
-    total_steps = 3
-    
-    # Step 1: Download data
-    print_step(1, total_steps, "Downloading FDA datasets")
-    if not run_command("python scripts/download_data.py", "Data download"):
-        sys.exit(1)
-    
-    # Step 2: Process data
-    print_step(2, total_steps, "Processing and cleaning data")
-    if not run_command("python scripts/process_data.py", "Data processing"):
-        sys.exit(1)
-    
-    # Step 3: Load to MySQL
-    print_step(3, total_steps, "Loading data to MySQL")
-    print("Note: Ensure MySQL is running and credentials are configured")
-    if not run_command("python scripts/load_to_mysql.py", "Data loading"):
+
+    os.makedirs('data', exist_ok=True)
+    store = FingerprintStore()
+
+    try:
+        version, created = ensure_schema(create=args.create_schema, reset=args.reset_schema)
+    except Exception as e:
+        print(f"✗ Error connecting to {database_label()}: {e}")
+        print("\nTroubleshooting:")
+        print("1. Make sure MySQL is running")
+        print("2. Set FDA_DB_PASSWORD (and FDA_DB_USER etc.; see scripts/database.py)")
         sys.exit(1)
-    
+    if created:
+        store.forget(DATABASE_TASKS)
+
+    # Both branches load at the same time, each on up to --workers connections
+    engine = get_engine(pool_size=2 * args.workers + 2, max_overflow=0, local_infile=True)
+
+    report = RunReport('run_pipeline', vars(args))
+
+    def on_event(event, name, result):
+        if event == 'start':
+            print(f"\n▶ {name} started")
+            return
+        if result.status != 'ran':
+            # Tasks that ran measured themselves; note the others so the report covers every task
+            report.add_status(name, result.status, result.seconds, result.detail)
+        if result.status in ('ran', 'skipped'):
+            print(f"✓ {result}")
+        else:
+            print(f"✗ {result}")
+
+    # One process per processing stage, so the NDC and shortage stages do not share a GIL
+    stage_pool = ProcessPoolExecutor(max_workers=len(process_data.STAGES))
+
+    try:
+        results = run_dag(build_tasks(args, engine, version, stage_pool, report), store,
+                          force=args.force, on_event=on_event)
+    finally:
+        stage_pool.shutdown()
+        report.extra['connections'] = pool_metrics(engine)
+        engine.dispose()
+        print(f"\nRun report: {report.write()}")
+
     # Calculate duration
     end_time = datetime.now()
     duration = end_time - start_time
-    
+
+    failed = [result for result in results.values() if result.status in ('failed', 'blocked')]
+    if failed:
+        print_header("Pipeline Failed")
+        for result in failed:
+            print(f"  ✗ {result}")
+        sys.exit(1)
+
+    skipped = sum(1 for result in results.values() if result.status == 'skipped')
+
     # Success message
     print_header("Pipeline Completed Successfully!")
     print(f"Finished at: {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"Total duration: {duration.seconds // 60} minutes {duration.seconds % 60} seconds")
-    
+    print(f"Total duration: {duration.total_seconds():.1f} seconds "
+          f"({len(results) - skipped} tasks ran, {skipped} unchanged and skipped)")
+
     # Next steps
     print("\n" + "="*70)
-    print("NEXT STEPS - Complete these manually:")
+    print("NEXT STEPS:")
     print("="*70)
-    print("\n1. Open MySQL Workbench and run SQL transformations:")
-    print("   File → Open SQL Script → sql/02_transformations.sql")
-    print("   Click the lightning bolt ⚡ to execute")
-    print("\n2. Run analysis queries:")
+    print("\n1. Run analysis queries (optional):")
     print("   File → Open SQL Script → sql/03_analysis_queries.sql")
     print("   Click the lightning bolt ⚡ to execute")
-    print("   Click through Result tabs to view query outputs")
-    print("\n3. Launch the interactive dashboard:")
+    print("\n2. Launch the interactive dashboard:")
     print("   python -m streamlit run scripts/dashboard.py")
     print("   Dashboard opens at http://localhost:8501")
     print("\n" + "="*70 + "\n")
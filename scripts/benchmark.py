@@ -0,0 +1,365 @@
+"""
+Pipeline Benchmark
+Times the pipeline on synthetic openFDA-shaped data (see synthetic_data.py)
+at several multiples of the current real data size, so we can check that it
+scales before the real FDA data grows.
+
+For every scale it times:
+  - processing (process_data.py stages and the shortage/NDC matching of
+    ndc_matching.py, each in a fresh worker process so peak memory is per
+    stage)
+  - loading the processed tables into the database
+  - the 02_transformations.sql join and the 02b_summary_tables.sql refresh
+  - each query in 03_analysis_queries.sql (--repeat runs; the median is the
+    number to compare)
+Afterwards the plans of the analysis and dashboard queries are checked
+against sql/query_plan_baseline.json (see query_plans.py); a plan that
+regressed fails the run.
+
+The database is a SQLite file standing in for MySQL by default (the SQL
+scripts are translated on the fly, see sql_dialects.py), a DuckDB file
+with --backend duckdb (the embedded production backend, see database.py),
+or a separate MySQL database (fda_shortage_bench) with --backend mysql.
+SQLite numbers show how the work grows with the data; MySQL and DuckDB
+numbers say how fast production will be on that backend.
+
+Generated data is kept in data/benchmarks/<scale>x/ and reused while the
+scale, seed and generator version stay the same. Results are written as a
+run report (see instrumentation.py), so every benchmark run is also a line
+in data/reports/history.jsonl. Each run is compared with the previous run
+that used the same settings.
+
+Usage:
+    python scripts/benchmark.py                           # 1x, SQLite
+    python scripts/benchmark.py --scales 1 10 100
+    python scripts/benchmark.py --scales 0.01 --repeat 1  # quick smoke test
+    python scripts/benchmark.py --backend duckdb --scales 1 10 --format parquet
+    python scripts/benchmark.py --backend mysql --scales 1 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from bulk_load import DEFAULT_CHUNK_ROWS, DEFAULT_STRATEGY, DEFAULT_WORKERS, STRATEGIES, load_tables
+from database import duckdb_file_engine, get_engine, server_engine, sqlite_engine
+from embedded_load import load_tables_embedded
+from instrumentation import HISTORY_FILE, RunReport
+from sql_dialects import translate
+from sql_runner import named_queries, run_sql_file
+from table_formats import FORMATS, TABLE_FILES, table_path
+import ndc_matching
+import process_data
+import query_plans
+import synthetic_data
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CREATE_TABLES_SQL = os.path.join(ROOT_DIR, 'sql', '01_create_tables.sql')
+TRANSFORMATIONS_SQL = os.path.join(ROOT_DIR, 'sql', '02_transformations.sql')
+SUMMARY_SQL = os.path.join(ROOT_DIR, 'sql', '02b_summary_tables.sql')
+ANALYSIS_SQL = os.path.join(ROOT_DIR, 'sql', '03_analysis_queries.sql')
+
+BENCH_DIR = os.path.join('data', 'benchmarks')
+BENCH_DB_NAME = 'fda_shortage_bench'
+
+BACKENDS = ('sqlite', 'duckdb', 'mysql')
+DEFAULT_SCALES = (1,)
+DEFAULT_REPEAT = 3
+
+
+def scale_label(scale):
+    """1 -> '1x', 0.05 -> '0.05x'"""
+    return f"{scale:g}x"
+
+
+@contextmanager
+def working_directory(path):
+    """Run the block with path as the current directory (the pipeline uses data/ paths)"""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+# ============================================
+# Data
+# ============================================
+
+def prepare_dataset(scale, seed, report):
+    """
+    Generate the synthetic files for a scale unless the same ones already exist
+
+    Returns:
+        str: Working directory of the scale (its data/ holds the files)
+    """
+    label = scale_label(scale)
+    work_dir = os.path.join(BENCH_DIR, label)
+    data_dir = os.path.join(work_dir, 'data')
+    info_file = os.path.join(work_dir, 'dataset.json')
+    wanted = {'scale': scale, 'seed': seed, 'generator_version': synthetic_data.GENERATOR_VERSION}
+
+    try:
+        with open(info_file, 'r') as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        info = {}
+    files = [os.path.join(data_dir, os.path.basename(path))
+             for path in (process_data.NDC_FILE, process_data.SHORTAGES_FILE)]
+    if all(info.get(key) == value for key, value in wanted.items()) and all(map(os.path.exists, files)):
+        print(f"  Reusing {label} dataset ({info['ndc_records']} NDC, {info['shortage_records']} shortage records)")
+        report.add_status(f"{label}/generate", 'skipped', detail='dataset unchanged')
+        return work_dir
+
+    print(f"  Generating {label} dataset...")
+    with report.stage(f"{label}/generate", outputs=files) as stage:
+        info = synthetic_data.generate(scale, data_dir, seed)
+        stage.rows_out = info['ndc_records'] + info['shortage_records']
+        stage.extra.update(info)
+    with open(info_file, 'w') as f:
+        json.dump(info, f, indent=2)
+    return work_dir
+
+
+def process(label, fmt, report):
+    """Run both processing stages, then the matching, each in a fresh process (call inside the work dir)"""
+    calls = [(process_data.run_stage_measured, stage, fmt) for stage in process_data.STAGES]
+    calls.append((ndc_matching.run_matching_measured, fmt))
+    for func, *args in calls:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            _, metrics = pool.submit(func, *args).result()
+        metrics['name'] = f"{label}/{metrics['name']}"
+        report.add(metrics)
+
+
+# ============================================
+# Database
+# ============================================
+
+def bench_engine(backend, work_dir, workers):
+    """Fresh benchmark database with the tables from sql/01_create_tables.sql"""
+    if backend in ('sqlite', 'duckdb'):
+        path = os.path.join(work_dir, f'bench.{backend}')
+        if os.path.exists(path):
+            os.remove(path)
+        engine = sqlite_engine(path) if backend == 'sqlite' else duckdb_file_engine(path)
+    else:
+        server = server_engine()
+        try:
+            with server.begin() as conn:
+                conn.exec_driver_sql(f"CREATE DATABASE IF NOT EXISTS {BENCH_DB_NAME}")
+        finally:
+            server.dispose()
+        engine = get_engine(BENCH_DB_NAME, pool_size=workers + 1, max_overflow=0, local_infile=True)
+    run_sql_file(engine, CREATE_TABLES_SQL, skip=('CREATE DATABASE', 'USE '))
+    return engine
+
+
+def load(engine, label, fmt, args, report):
+    """Load the processed tables (call inside the work dir)"""
+    inputs = [table_path(file_name, fmt) for file_name in TABLE_FILES.values()]
+    with report.stage(f"{label}/load", inputs=inputs) as stage:
+        if engine.dialect.name == 'mysql':
+            results = load_tables(engine, TABLE_FILES, fmt, args.strategy,
+                                  workers=args.workers, chunk_rows=args.chunk_rows)
+        else:
+            results = load_tables_embedded(engine, TABLE_FILES, fmt)
+        failed = {name: outcome for name, outcome in results.items() if isinstance(outcome, Exception)}
+        if failed:
+            raise RuntimeError('; '.join(f"{name}: {error}" for name, error in failed.items()))
+        tables = {name: {'rows': result.rows, 'seconds': round(result.seconds, 4)}
+                  for name, result in results.items()}
+        stage.rows_out = sum(table['rows'] for table in tables.values())
+        stage.extra['tables'] = tables
+
+
+def transform(engine, label, report):
+    """Run the 02 join and the 02b summary refresh"""
+    with report.stage(f"{label}/transform") as stage:
+        run_sql_file(engine, TRANSFORMATIONS_SQL, skip=('USE ',))
+        with engine.connect() as conn:
+            stage.rows_out = conn.exec_driver_sql("SELECT COUNT(*) FROM shortages_with_ndc").scalar()
+
+    with report.stage(f"{label}/materialize") as stage:
+        run_sql_file(engine, SUMMARY_SQL, skip=('USE ',))
+
+
+def run_queries(engine, label, repeat, report):
+    """Time every query of 03_analysis_queries.sql"""
+    with engine.connect() as conn:
+        for number, title, statement in named_queries(ANALYSIS_SQL):
+            (query,) = translate(statement, engine.dialect.name)
+            with report.stage(f"{label}/query_{number:02d}") as stage:
+                runs = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    rows = conn.exec_driver_sql(query).fetchall()
+                    runs.append(time.perf_counter() - start)
+                stage.rows_out = len(rows)
+                stage.extra.update({
+                    'title': title,
+                    'median_seconds': round(statistics.median(runs), 6),
+                    'min_seconds': round(min(runs), 6),
+                    'runs': len(runs),
+                })
+
+
+def check_plans(engine, label, report):
+    """Capture the query plans; the stage fails if one regressed against the baseline"""
+    with report.stage(f"{label}/plans") as stage:
+        results = query_plans.capture(engine)
+        comparison = query_plans.compare(engine.dialect.name, results)
+        stage.rows_out = len(results)
+        stage.extra['flags'] = {name: result['flags'] for name, result in results.items()}
+        stage.extra['comparison'] = comparison
+        if not query_plans.print_comparison(comparison):
+            stage.status = 'failed'
+            stage.error = f"query plans regressed: {', '.join(comparison['regressed'])}"
+
+
+def benchmark_scale(scale, args, report):
+    """Benchmark the whole pipeline at one scale"""
+    label = scale_label(scale)
+    print(f"\n{label}:")
+    work_dir = prepare_dataset(scale, args.seed, report)
+
+    with working_directory(work_dir):
+        print("  Processing...")
+        process(label, args.format, report)
+
+        print(f"  Loading into {args.backend}...")
+        engine = bench_engine(args.backend, '.', args.workers)
+        try:
+            load(engine, label, args.format, args, report)
+            print("  Transforming...")
+            transform(engine, label, report)
+            print(f"  Running analysis queries ({args.repeat} runs each)...")
+            run_queries(engine, label, args.repeat, report)
+            if not args.skip_plans:
+                print("  Checking query plans...")
+                check_plans(engine, label, report)
+        finally:
+            engine.dispose()
+
+
+# ============================================
+# Results
+# ============================================
+
+def stage_seconds(stage):
+    """The comparable time of a stage: median run for queries, wall time otherwise"""
+    return stage['extra'].get('median_seconds', stage['wall_seconds'])
+
+
+def previous_run(params, history_file=HISTORY_FILE):
+    """
+    Stages of the last successful benchmark run with the same settings
+
+    Returns:
+        dict: Stage name -> stage (from that run's report), or None
+    """
+    try:
+        with open(history_file, 'r') as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    for line in reversed(lines):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if entry.get('run') == 'benchmark' and entry.get('params') == params and entry.get('status') == 'ok':
+            try:
+                with open(entry['report'], 'r') as f:
+                    return {stage['name']: stage for stage in json.load(f)['stages']}
+            except (OSError, ValueError, KeyError):
+                return None
+    return None
+
+
+def print_results(report, scales, previous):
+    """Step x scale table of milliseconds, with growth vs the smallest scale and change vs the previous run"""
+    stages = {stage['name']: stage for stage in report.stages if stage['status'] == 'ok'}
+    labels = [scale_label(scale) for scale in scales]
+    steps = []
+    for name in stages:
+        step = name.split('/', 1)[1]
+        if step not in ('generate', 'plans') and step not in steps:
+            steps.append(step)
+
+    print(f"\n{'step (ms)':<20}" + ''.join(f"{label:>12}" for label in labels)
+          + (f"{'growth':>10}" if len(labels) > 1 else '') + (f"{'vs last':>10}" if previous else ''))
+    for step in steps:
+        times = [stages.get(f"{label}/{step}") for label in labels]
+        cells = ''.join(f"{stage_seconds(stage) * 1000:>12.1f}" if stage else f"{'-':>12}" for stage in times)
+        growth = ''
+        if len(labels) > 1 and times[0] and times[-1] and stage_seconds(times[0]) > 0:
+            growth = f"{stage_seconds(times[-1]) / stage_seconds(times[0]):>9.1f}x"
+        change = ''
+        if previous and times[-1]:
+            before = previous.get(f"{labels[-1]}/{step}")
+            if before and before['status'] == 'ok' and stage_seconds(before) > 0:
+                change = f"{(stage_seconds(times[-1]) / stage_seconds(before) - 1) * 100:>+9.0f}%"
+        print(f"{step:<20}{cells}{growth:>10}{change}")
+    if len(labels) > 1:
+        print(f"\n(growth = {labels[-1]} time / {labels[0]} time; linear scaling would be "
+              f"{scales[-1] / scales[0]:g}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic openFDA data")
+    parser.add_argument('--scales', type=float, nargs='+', default=list(DEFAULT_SCALES),
+                        help="multiples of the current real data size (default: 1)")
+    parser.add_argument('--backend', choices=BACKENDS, default='sqlite',
+                        help="database to load and query (default: sqlite stand-in)")
+    parser.add_argument('--format', choices=FORMATS, default='csv',
+                        help="intermediate file format (default: csv)")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f"runs per analysis query (default: {DEFAULT_REPEAT})")
+    parser.add_argument('--skip-plans', action='store_true',
+                        help="do not check the query plans against sql/query_plan_baseline.json")
+    parser.add_argument('--seed', type=int, default=synthetic_data.DEFAULT_SEED,
+                        help=f"random seed of the generated data (default: {synthetic_data.DEFAULT_SEED})")
+    parser.add_argument('--strategy', choices=STRATEGIES, default=DEFAULT_STRATEGY,
+                        help=f"MySQL bulk load strategy (default: {DEFAULT_STRATEGY})")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"concurrent MySQL chunk loads (default: {DEFAULT_WORKERS})")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f"rows per concurrently loaded MySQL chunk (default: {DEFAULT_CHUNK_ROWS})")
+    args = parser.parse_args()
+
+    scales = sorted(set(args.scales))
+    params = {
+        'scales': scales, 'backend': args.backend, 'format': args.format, 'repeat': args.repeat,
+        'seed': args.seed, 'generator_version': synthetic_data.GENERATOR_VERSION,
+    }
+    if args.backend == 'mysql':
+        params.update({'strategy': args.strategy, 'workers': args.workers, 'chunk_rows': args.chunk_rows})
+    previous = previous_run(params)
+
+    print(f"Benchmarking the pipeline at {', '.join(scale_label(scale) for scale in scales)} "
+          f"on {args.backend}...")
+    report = RunReport('benchmark', params)
+    try:
+        for scale in scales:
+            benchmark_scale(scale, args, report)
+    except Exception as e:
+        print(f"  ✗ Benchmark failed: {e}")
+        report.add_status('benchmark', 'failed', detail=e)
+    finally:
+        path = report.write()
+
+    print_results(report, scales, previous)
+    print(f"\nRun report: {path}")
+    if report.to_dict()['status'] != 'ok':
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
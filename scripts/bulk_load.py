@@ -0,0 +1,468 @@
+"""
+Bulk Loading Strategies for MySQL
+Used by load_to_mysql.py to move the processed tables into MySQL quickly.
+
+Strategies (fastest first):
+  - load-data: LOAD DATA LOCAL INFILE straight from the processed CSV file
+               (columnar formats are first dumped to a temporary CSV).
+               Needs local_infile enabled on the server; if the server
+               refuses, the table is loaded with 'insert' instead.
+  - insert:    multi-row INSERT statements of --batch-size rows each
+               (mysql-connector turns executemany into multi-row INSERTs)
+  - to-sql:    plain pandas DataFrame.to_sql, the original behaviour
+
+Foreign key and unique checks are switched off for the loading session and
+switched back on afterwards, whatever happens.
+
+load_tables() runs several tables, and chunks of each large table, at the
+same time on a bounded thread pool while keeping foreign key order. The
+chunks of a table go into a staging copy (stg_load_<table>) that is copied
+into the table in one statement once every chunk has loaded, so a failed
+chunk leaves the table as it was. Processed CSV files are split into
+chunks by byte offset and streamed, never read into pandas.
+"""
+
+import csv
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from sqlalchemy.exc import DBAPIError
+
+from table_formats import TABLE_COLUMNS, read_csv, read_table, table_path
+
+STRATEGIES = ('load-data', 'insert', 'to-sql')
+
+DEFAULT_STRATEGY = 'load-data'
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_WORKERS = 4
+DEFAULT_CHUNK_ROWS = 50000
+
+# Bytes read at a time when splitting and copying CSV files (1 MB)
+COPY_BYTES = 1024 * 1024
+
+# Chunks of a table are loaded into <prefix><table> before the table itself
+LOAD_STAGING_PREFIX = 'stg_load_'
+
+# Tables that must be fully loaded before another table starts
+# (raw_ndc_packaging.product_ndc is a foreign key to raw_ndc)
+TABLE_DEPENDENCIES = {
+    'raw_ndc_packaging': ['raw_ndc'],
+}
+
+
+class LoadResult:
+    """Outcome of loading one table"""
+
+    def __init__(self, table_name, rows, seconds, strategy):
+        self.table_name = table_name
+        self.rows = rows
+        self.seconds = seconds
+        self.strategy = strategy
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds > 0 else float('inf')
+
+    def __str__(self):
+        return (f"{self.table_name}: {self.rows} rows in {self.seconds:.2f}s "
+                f"({self.rows_per_second:,.0f} rows/sec, {self.strategy})")
+
+
+@contextmanager
+def relaxed_checks(conn, unique=True):
+    """
+    Disable foreign key (and, unless unique=False, unique) checks on this
+    connection while loading
+    """
+    conn.exec_driver_sql("SET FOREIGN_KEY_CHECKS = 0")
+    if unique:
+        conn.exec_driver_sql("SET UNIQUE_CHECKS = 0")
+    try:
+        yield conn
+    finally:
+        if unique:
+            conn.exec_driver_sql("SET UNIQUE_CHECKS = 1")
+        conn.exec_driver_sql("SET FOREIGN_KEY_CHECKS = 1")
+
+
+def quote_identifier(name):
+    """Quote a MySQL identifier with backticks"""
+    return '`' + name.replace('`', '``') + '`'
+
+
+def dataframe_rows(df):
+    """Yield the rows of a DataFrame as tuples with missing values as None"""
+    df = df.astype(object).where(df.notna(), None)
+    return df.itertuples(index=False, name=None)
+
+
+def iter_chunks(rows, size):
+    """Group an iterator of rows into lists of at most size rows"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def csv_pieces(csv_path, chunk_rows, block_size=COPY_BYTES):
+    """
+    Split a CSV file into byte ranges of chunk_rows rows each
+
+    The file is scanned in blocks without being parsed. A newline ends a
+    row only outside a quoted field, which is the case when an even number
+    of quote characters precede it (doubled quotes inside a field count
+    twice), so values with embedded newlines are never cut in two.
+
+    Returns:
+        list: (start, end) byte ranges of the rows after the header line
+    """
+    bounds = []
+    with open(csv_path, 'rb') as f:
+        f.readline()
+        position = f.tell()
+        bounds.append(position)
+        rows = 0
+        in_quotes = False
+        for block in iter(lambda: f.read(block_size), b''):
+            if not in_quotes and b'"' not in block and rows + block.count(b'\n') < chunk_rows:
+                rows += block.count(b'\n')
+                position += len(block)
+                continue
+            previous = 0
+            index = block.find(b'\n')
+            while index != -1:
+                if block.count(b'"', previous, index) % 2:
+                    in_quotes = not in_quotes
+                previous = index + 1
+                if not in_quotes:
+                    rows += 1
+                    if rows == chunk_rows:
+                        bounds.append(position + previous)
+                        rows = 0
+                index = block.find(b'\n', previous)
+            if block.count(b'"', previous) % 2:
+                in_quotes = not in_quotes
+            position += len(block)
+    if position > bounds[-1]:
+        bounds.append(position)
+    return list(zip(bounds, bounds[1:]))
+
+
+@contextmanager
+def csv_piece(csv_path, byte_range, chunk_size=COPY_BYTES):
+    """Temporary CSV file holding the header and one byte range of csv_path"""
+    start, end = byte_range
+    tmp = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+    try:
+        with open(csv_path, 'rb') as src, tmp:
+            tmp.write(src.readline())
+            src.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                data = src.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                tmp.write(data)
+                remaining -= len(data)
+        yield tmp.name
+    finally:
+        os.remove(tmp.name)
+
+
+# ============================================
+# Strategies
+# ============================================
+
+def load_data_infile(conn, table_name, file_name, csv_path):
+    """
+    Load a processed CSV file with LOAD DATA LOCAL INFILE
+
+    The file is read exactly as pandas wrote it: comma separated, fields
+    optionally quoted with doubled quotes inside, header on the first line.
+    Empty fields become NULL and 'True'/'False' become 1/0 for BOOLEAN
+    columns, matching what to_sql would have stored.
+
+    Returns:
+        int: Number of rows loaded
+    """
+    with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+        columns = next(csv.reader(f))
+        f.seek(0)
+        first_line = f.readline()
+    line_end = '\\r\\n' if first_line.endswith('\r\n') else '\\n'
+
+    kinds = TABLE_COLUMNS[file_name]
+    variables = [f"@v{i}" for i in range(len(columns))]
+    assignments = []
+    for column, variable in zip(columns, variables):
+        if kinds.get(column) == 'bool':
+            value = (f"CASE {variable} WHEN 'True' THEN 1 WHEN 'False' THEN 0 "
+                     f"ELSE NULLIF({variable}, '') END")
+        else:
+            value = f"NULLIF({variable}, '')"
+        assignments.append(f"{quote_identifier(column)} = {value}")
+
+    path = os.path.abspath(csv_path).replace('\\', '/').replace("'", "\\'")
+    sql = (
+        f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {quote_identifier(table_name)} "
+        f"CHARACTER SET utf8mb4 "
+        f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+        f"LINES TERMINATED BY '{line_end}' IGNORE 1 LINES "
+        f"({', '.join(variables)}) SET {', '.join(assignments)}"
+    )
+    return conn.exec_driver_sql(sql).rowcount
+
+
+def insert_batches(conn, table_name, df, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Load a DataFrame with multi-row INSERT statements of batch_size rows
+
+    Returns:
+        int: Number of rows loaded
+    """
+    columns = ', '.join(quote_identifier(col) for col in df.columns)
+    placeholders = ', '.join(['%s'] * len(df.columns))
+    sql = f"INSERT INTO {quote_identifier(table_name)} ({columns}) VALUES ({placeholders})"
+
+    rows = 0
+    for chunk in iter_chunks(dataframe_rows(df), batch_size):
+        conn.exec_driver_sql(sql, chunk)
+        rows += len(chunk)
+    return rows
+
+
+def to_sql_plain(conn, table_name, df):
+    """Load a DataFrame with plain DataFrame.to_sql (one statement per row)"""
+    df.to_sql(name=table_name, con=conn, if_exists='append', index=False)
+    return len(df)
+
+
+# ============================================
+# Table Loader
+# ============================================
+
+def load_table(engine, table_name, file_name, fmt='csv', strategy=DEFAULT_STRATEGY,
+               batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Load one processed table into MySQL with the chosen strategy
+
+    Args:
+        engine: SQLAlchemy engine
+        table_name: MySQL table to load into
+        file_name: Processed table name (see table_formats.TABLE_FILES)
+        fmt: Format of the processed file ('csv', 'parquet' or 'feather')
+        strategy: One of STRATEGIES
+        batch_size: Rows per INSERT statement for the 'insert' strategy
+
+    Returns:
+        LoadResult: Rows loaded, elapsed time and the strategy actually used
+    """
+    _check_strategy(strategy)
+    start = time.perf_counter()
+
+    if strategy == 'load-data' and fmt == 'csv':
+        # Load the processed file as-is without reading it into pandas
+        source = (None, table_path(file_name, fmt), None)
+    else:
+        source = (read_table(file_name, fmt), None, None)
+    rows, used = _load_chunk(engine, table_name, file_name, source, strategy, batch_size)
+
+    return LoadResult(table_name, rows, time.perf_counter() - start, used)
+
+
+def load_tables(engine, tables, fmt='csv', strategy=DEFAULT_STRATEGY,
+                batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS,
+                chunk_rows=DEFAULT_CHUNK_ROWS, on_done=None, staged=True):
+    """
+    Load several tables concurrently on a bounded thread pool
+
+    Each table is split into chunks of chunk_rows rows and every chunk is
+    loaded on its own pooled connection, so one large table can use all the
+    workers. A table only starts once every table it depends on (see
+    TABLE_DEPENDENCIES) has finished loading.
+
+    Each chunk commits on its own, so with staged=True a table of several
+    chunks is loaded into an empty stg_load_<table> copy first and then
+    inserted into the table in a single transaction. If any chunk fails the
+    table is not touched and a rerun does not load rows twice.
+
+    Args:
+        engine: SQLAlchemy engine with a pool of at least `workers` connections
+        tables: Dict of MySQL table -> processed table name
+        fmt: Format of the processed files
+        strategy: One of STRATEGIES
+        batch_size: Rows per INSERT statement for the 'insert' strategy
+        workers: Maximum number of chunks loading at the same time
+        chunk_rows: Rows per concurrently loaded chunk (0 = whole table)
+        on_done: Optional callback(table_name, LoadResult or exception),
+                 called in the caller's thread as each table finishes
+        staged: Load multi-chunk tables through a staging copy (False when
+                the tables are themselves throwaway staging tables)
+
+    Returns:
+        dict: Table name -> LoadResult, or the exception that stopped it
+    """
+    _check_strategy(strategy)
+    results = {}
+    pending = dict(tables)
+    running = {}  # table -> (futures, start time, table the chunks load into)
+
+    def finish(table_name, outcome):
+        results[table_name] = outcome
+        if on_done:
+            on_done(table_name, outcome)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            # Start every table whose dependencies are done
+            for table_name in list(pending):
+                deps = TABLE_DEPENDENCIES.get(table_name, [])
+                if any(dep in pending or dep in running for dep in deps if dep in tables):
+                    continue
+                failed = [dep for dep in deps if isinstance(results.get(dep), Exception)]
+                file_name = pending.pop(table_name)
+                if failed:
+                    finish(table_name, RuntimeError(f"not loaded because {', '.join(failed)} failed"))
+                    continue
+                start = time.perf_counter()
+                try:
+                    sources = _chunk_sources(file_name, fmt, strategy, chunk_rows)
+                    target = table_name
+                    if staged and len(sources) > 1:
+                        target = LOAD_STAGING_PREFIX + table_name
+                        with engine.begin() as conn:
+                            _create_load_staging(conn, table_name, target)
+                    futures = [pool.submit(_load_chunk, engine, target, file_name, source, strategy, batch_size)
+                               for source in sources]
+                except Exception as e:
+                    finish(table_name, e)
+                    continue
+                running[table_name] = (futures, start, target)
+
+            if not running:
+                continue
+
+            # Wait for any chunk, then collect the tables that are complete
+            all_futures = [f for futures, _, _ in running.values() for f in futures]
+            wait(all_futures, return_when=FIRST_COMPLETED)
+            for table_name, (futures, start, target) in list(running.items()):
+                if not all(f.done() for f in futures):
+                    continue
+                del running[table_name]
+                errors = [f.exception() for f in futures if f.exception()]
+                if target != table_name:
+                    try:
+                        if not errors:
+                            _publish_load_staging(engine, table_name, target, tables[table_name])
+                    except Exception as e:
+                        errors.append(e)
+                    finally:
+                        with engine.begin() as conn:
+                            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {quote_identifier(target)}")
+                if errors:
+                    finish(table_name, errors[0])
+                    continue
+                rows = sum(f.result()[0] for f in futures)
+                used = '/'.join(sorted({f.result()[1] for f in futures}))
+                finish(table_name, LoadResult(table_name, rows, time.perf_counter() - start, used))
+
+    return results
+
+
+def _check_strategy(strategy):
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy '{strategy}'. Choose from: {', '.join(STRATEGIES)}")
+
+
+def _chunk_sources(file_name, fmt, strategy, chunk_rows):
+    """
+    Split a processed table into the chunks loaded concurrently
+
+    Returns:
+        list: (DataFrame, CSV path, byte range) sources for _load_chunk(),
+              with only the DataFrame or the CSV path set
+    """
+    if strategy == 'load-data' and fmt == 'csv':
+        # LOAD DATA reads CSV directly: split the file, don't parse it
+        path = table_path(file_name, fmt)
+        pieces = csv_pieces(path, chunk_rows) if chunk_rows else []
+        if len(pieces) <= 1:
+            return [(None, path, None)]
+        return [(None, path, piece) for piece in pieces]
+
+    df = read_table(file_name, fmt)
+    size = chunk_rows or max(len(df), 1)
+    chunks = [df.iloc[i:i + size] for i in range(0, len(df), size)] or [df]
+    return [(chunk, None, None) for chunk in chunks]
+
+
+def _create_load_staging(conn, table_name, staging):
+    """(Re)create the empty table that the chunks of table_name load into"""
+    conn.exec_driver_sql(f"DROP TABLE IF EXISTS {quote_identifier(staging)}")
+    conn.exec_driver_sql(f"CREATE TABLE {quote_identifier(staging)} LIKE {quote_identifier(table_name)}")
+
+
+def _publish_load_staging(engine, table_name, staging, file_name):
+    """Copy every loaded chunk from the staging table into table_name in one transaction"""
+    columns = ', '.join(quote_identifier(col) for col in TABLE_COLUMNS[file_name])
+    with engine.begin() as conn, relaxed_checks(conn):
+        conn.exec_driver_sql(
+            f"INSERT INTO {quote_identifier(table_name)} ({columns}) "
+            f"SELECT {columns} FROM {quote_identifier(staging)}"
+        )
+
+
+def _load_chunk(engine, table_name, file_name, source, strategy, batch_size):
+    """
+    Load one chunk in its own transaction
+
+    source is (DataFrame, None, None), (None, CSV path, None) for a whole
+    processed CSV file, or (None, CSV path, byte range) for part of one. If
+    LOAD DATA is refused, the chunk is loaded with batched INSERTs instead.
+
+    Returns:
+        tuple: (rows loaded, strategy actually used)
+    """
+    df, csv_path, byte_range = source
+    if byte_range is not None:
+        with csv_piece(csv_path, byte_range) as piece_path:
+            return _load_chunk(engine, table_name, file_name, (None, piece_path, None), strategy, batch_size)
+
+    if strategy == 'load-data':
+        try:
+            return _load_data_chunk(engine, table_name, file_name, df, csv_path), strategy
+        except DBAPIError as e:
+            # Typically local_infile disabled on the server or client
+            print(f"  ⚠ LOAD DATA LOCAL INFILE failed for {table_name} ({e.orig}). "
+                  f"Falling back to batched INSERT.")
+            strategy = 'insert'
+            if df is None:
+                df = read_csv(csv_path, file_name)
+
+    with engine.begin() as conn, relaxed_checks(conn):
+        if strategy == 'insert':
+            return insert_batches(conn, table_name, df, batch_size), strategy
+        return to_sql_plain(conn, table_name, df), strategy
+
+
+def _load_data_chunk(engine, table_name, file_name, df, csv_path):
+    """Run LOAD DATA on a processed CSV, or on a temporary CSV dump of df"""
+    if csv_path is not None:
+        with engine.begin() as conn, relaxed_checks(conn):
+            return load_data_infile(conn, table_name, file_name, csv_path)
+
+    tmp = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+    tmp.close()
+    try:
+        df.to_csv(tmp.name, index=False, lineterminator='\n')
+        with engine.begin() as conn, relaxed_checks(conn):
+            return load_data_infile(conn, table_name, file_name, tmp.name)
+    finally:
+        os.remove(tmp.name)
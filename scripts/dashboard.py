@@ -3,12 +3,21 @@ FDA Drug Shortage Analysis Dashboard
 Interactive dashboard displaying shortage metrics and insights
 """
 
+import os
+import re
+from urllib.parse import urlencode
+
 import streamlit as st
 import pandas as pd
-from sqlalchemy import create_engine
 import plotly.express as px
 import plotly.graph_objects as go
 
+from sqlalchemy import text
+
+from database import get_engine, pool_metrics
+from export_data import EXPORT_FORMATS
+from sql_dialects import translate
+
 # ============================================
 # Page Configuration
 # ============================================
@@ -26,19 +35,18 @@ st.set_page_config(
 
 @st.cache_resource
 def get_database_connection():
-    """Create cached database connection"""
-    
-    # Database credentials - UPDATE THESE
-    DB_USER = 'root'
-    DB_PASSWORD = '5791216sS$'  # CHANGE THIS!
-    DB_HOST = 'localhost'
-    DB_PORT = '3306'
-    DB_NAME = 'fda_shortage_db'
-    
-    connection_string = f'mysql+mysqlconnector://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
-    
+    """
+    Create the database engine shared by every dashboard session
+
+    Credentials and pool sizing come from the environment (FDA_DB_USER,
+    FDA_DB_PASSWORD, FDA_DB_POOL_SIZE, ...; see database.py), as does the
+    backend (FDA_DB_BACKEND=duckdb serves the dashboard from an embedded
+    database file). Sessions run
+    on separate threads, so the pool should be sized for the expected
+    number of concurrent users.
+    """
     try:
-        engine = create_engine(connection_string)
+        engine = get_engine(read_only=True)
         return engine
     except Exception as e:
         st.error(f"Database connection error: {e}")
@@ -48,103 +56,249 @@ def get_database_connection():
 # Data Loading Functions
 # ============================================
 
-@st.cache_data(ttl=600)
-def load_manufacturer_risk(_engine):
-    """Load top manufacturers by current shortage risk"""
+def read_query(query, engine, params=None):
+    """Run a dashboard query with :name parameters, translated from MySQL when the backend is DuckDB or SQLite"""
+    (query,) = translate(query, engine.dialect.name)
+    return pd.read_sql(text(query), engine, params=params)
+
+# The panels are computed from one snapshot of the current shortages, read
+# with a single query. A pipeline refresh publishes a new data version
+# whenever it changes the summary tables (see transform_data.py); the
+# dashboard polls the latest version and keys its caches on it, so the data
+# is fetched once per real change and shared by every session.
+
+# How often the data version is polled (one query for all sessions)
+DATA_VERSION_POLL_SECONDS = 30
+
+# Low-cardinality snapshot columns, stored as categoricals to keep the cached
+# snapshot compact and its group-bys fast
+SNAPSHOT_CATEGORIES = ['company_name', 'drug_type', 'route_group', 'product_type', 'therapeutic_category',
+                       'shortage_dosage_form']
+
+
+@st.cache_data(ttl=DATA_VERSION_POLL_SECONDS)
+def load_data_version(_engine):
+    """Load the latest data version: (refresh_id, refreshed_at), or (0, None) before the first refresh"""
     query = """
-    SELECT 
-        company_name,
-        current_affected_packages,
-        current_affected_products
-    FROM current_manufacturer_risk
-    LIMIT 15
+    SELECT refresh_id, refreshed_at
+    FROM pipeline_data_version
+    ORDER BY refresh_id DESC
+    LIMIT 1
     """
-    return pd.read_sql(query, _engine)
+    version = read_query(query, _engine)
+    if version.empty:
+        return 0, None
+    return int(version['refresh_id'].iloc[0]), pd.Timestamp(version['refreshed_at'].iloc[0])
 
-@st.cache_data(ttl=600)
-def load_shortage_overview(_engine):
-    """Load overall shortage statistics"""
+# Data caches keep the current and the previous version, so sessions still
+# rendering the previous version do not refetch it
+@st.cache_data(max_entries=2)
+def load_shortage_overview(_engine, data_version):
+    """Load overall shortage statistics (all statuses, so from the one-row summary table)"""
     query = """
     SELECT 
-        COUNT(*) as total_shortages,
-        COUNT(DISTINCT company_name) as affected_manufacturers,
-        COUNT(DISTINCT product_ndc) as affected_products,
-        SUM(CASE WHEN status = 'Current' THEN 1 ELSE 0 END) as current_shortages
-    FROM shortages_with_ndc
+        total_shortages,
+        affected_manufacturers,
+        affected_products,
+        current_shortages
+    FROM shortage_overview
+    WHERE overview_id = 1
     """
-    return pd.read_sql(query, _engine)
+    return read_query(query, _engine)
 
-@st.cache_data(ttl=600)
-def load_brand_vs_generic(_engine):
-    """Load brand name vs generic comparison"""
+@st.cache_data(max_entries=2)
+def load_current_snapshot(_engine, data_version):
+    """Load every current shortage once, with just the columns the panels use (an idx_status range scan)"""
     query = """
     SELECT 
-        CASE 
-            WHEN brand_name IS NOT NULL AND brand_name != '' THEN 'Branded Drug'
-            ELSE 'Generic/Unbranded'
-        END AS drug_type,
-        COUNT(*) AS shortage_count
+        company_name,
+        product_ndc,
+        package_ndc,
+        drug_type,
+        route_group,
+        product_type,
+        therapeutic_category,
+        shortage_generic_name,
+        brand_name,
+        shortage_dosage_form,
+        package_description,
+        shortage_start_date
     FROM shortages_with_ndc
     WHERE status = 'Current'
-    GROUP BY drug_type
     """
-    return pd.read_sql(query, _engine)
+    snapshot = read_query(query, _engine)
+    snapshot[SNAPSHOT_CATEGORIES] = snapshot[SNAPSHOT_CATEGORIES].astype('category')
+    snapshot['shortage_start_date'] = pd.to_datetime(snapshot['shortage_start_date'])
+    return snapshot
 
-@st.cache_data(ttl=600)
-def load_route_analysis(_engine):
-    """Load shortage analysis by route of administration"""
-    query = """
-    SELECT 
-        CASE 
-            WHEN route LIKE '%ORAL%' THEN 'Oral'
-            WHEN route LIKE '%INTRAVENOUS%' OR route LIKE '%IV%' THEN 'Intravenous'
-            WHEN route LIKE '%INJECTION%' THEN 'Injection'
-            WHEN route LIKE '%TOPICAL%' THEN 'Topical'
-            WHEN route LIKE '%INHALATION%' THEN 'Inhalation'
-            ELSE 'Other'
-        END AS administration_route,
-        COUNT(*) AS shortage_count
-    FROM shortages_with_ndc
-    WHERE status = 'Current' AND route IS NOT NULL
-    GROUP BY administration_route
-    ORDER BY shortage_count DESC
-    LIMIT 10
+# ============================================
+# Panels (computed from the snapshot)
+# ============================================
+
+def count_by(snapshot, column, count_name='shortage_count'):
+    """Rows per value of column (NULLs left out), largest first"""
+    counts = snapshot.groupby(column, observed=True).size().rename(count_name).reset_index()
+    return counts.sort_values([count_name, column], ascending=[False, True], ignore_index=True)
+
+def manufacturer_risk(snapshot, top=15):
+    """Top manufacturers by current shortage risk (as in current_manufacturer_risk)"""
+    risk = snapshot.groupby('company_name', observed=True).agg(
+        current_affected_packages=('package_ndc', 'nunique'),
+        current_affected_products=('product_ndc', 'nunique'),
+    ).reset_index()
+    risk = risk.sort_values(['current_affected_packages', 'company_name'], ascending=[False, True])
+    return risk.head(top).reset_index(drop=True)
+
+def brand_vs_generic(snapshot):
+    """Brand name vs generic comparison (pre-classified drug_type, see 01_create_tables.sql)"""
+    return count_by(snapshot, 'drug_type')
+
+def route_analysis(snapshot, top=10):
+    """Shortage analysis by route of administration (pre-classified route_group)"""
+    routes = count_by(snapshot, 'route_group').head(top)
+    return routes.rename(columns={'route_group': 'administration_route'})
+
+def product_type_analysis(snapshot):
+    """Shortage analysis by product type"""
+    counts = count_by(snapshot, 'product_type')
+    manufacturers = snapshot.groupby('product_type', observed=True)['company_name'].nunique()
+    counts['manufacturers'] = counts['product_type'].map(manufacturers).astype(int)
+    return counts
+
+def filter_options(snapshot, column):
+    """Values of a snapshot column to offer as a filter, sorted"""
+    return sorted(str(value) for value in snapshot[column].dropna().unique())
+
+# ============================================
+# Shortage Explorer (server-side pages)
+# ============================================
+
+# The explorer pages through every current shortage in the database with
+# keyset pagination: each page continues after the last row of the previous
+# one, (shortage_start_date, shortage_id), so every page is an index range
+# scan of idx_status_start or idx_status_company_start, however deep.
+# Shortages without a start date (no initial posting date) come after all
+# dated ones, as a second keyset range on shortage_id alone.
+
+PAGE_SIZES = [25, 50, 100]
+
+# Set when the dashboard is served by dashboard_app.py, which streams full exports
+EXPORT_URL = os.environ.get('FDA_EXPORT_URL')
+
+# Filters: explorer argument -> shortages_with_ndc column
+EXPLORER_FILTERS = {
+    'manufacturer': 'company_name',
+    'route': 'route_group',
+    'product_type': 'product_type',
+    'category': 'therapeutic_category',
+}
+
+# InnoDB full-text search ignores shorter words (innodb_ft_min_token_size)
+FULLTEXT_MIN_WORD = 3
+
+
+def explorer_where(filters, search='', after=None, dialect='mysql', undated=False):
     """
-    return pd.read_sql(query, _engine)
+    WHERE clause and parameters of one explorer page
 
-@st.cache_data(ttl=600)
-def load_product_type_analysis(_engine):
-    """Load shortage analysis by product type"""
-    query = """
-    SELECT 
-        product_type,
-        COUNT(*) AS shortage_count,
-        COUNT(DISTINCT company_name) AS manufacturers
-    FROM shortages_with_ndc
-    WHERE status = 'Current' AND product_type IS NOT NULL
-    GROUP BY product_type
-    ORDER BY shortage_count DESC
+    The clause is built from fixed SQL fragments only; every filter value,
+    search word and cursor value is a bound parameter.
+
+    Args:
+        filters: Dict of EXPLORER_FILTERS key -> selected value (None = all)
+        search: Words to find in the generic or brand name
+        after: (shortage_start_date, shortage_id) of the previous page's last row
+        dialect: Database dialect; MySQL searches the ft_names full-text index,
+            the embedded backends match LIKE patterns
+        undated: Select the shortages without a start date instead of those with one
+
+    Returns:
+        tuple: (WHERE clause, dict of parameters)
     """
-    return pd.read_sql(query, _engine)
+    conditions = ["status = 'Current'",
+                  "shortage_start_date IS NULL" if undated else "shortage_start_date IS NOT NULL"]
+    params = {}
+    for name, column in EXPLORER_FILTERS.items():
+        if filters.get(name) is not None:
+            conditions.append(f"{column} = :{name}")
+            params[name] = filters[name]
+
+    words = re.findall(r'\w+', search or '')
+    if words and dialect == 'mysql' and min(len(word) for word in words) >= FULLTEXT_MIN_WORD:
+        # Every word must match, as a prefix
+        conditions.append("MATCH (shortage_generic_name, brand_name) AGAINST (:search IN BOOLEAN MODE)")
+        params['search'] = ' '.join(f"+{word}*" for word in words)
+    else:
+        for i, word in enumerate(words):
+            conditions.append(f"(shortage_generic_name LIKE :word_{i} OR brand_name LIKE :word_{i})")
+            params[f'word_{i}'] = f"%{word}%"
 
-@st.cache_data(ttl=600)
-def load_detailed_shortages(_engine, limit=50):
-    """Load detailed shortage list"""
+    if after is not None and undated:
+        conditions.append("shortage_id > :after_id")
+        params['after_id'] = after[1]
+    elif after is not None:
+        conditions.append("(shortage_start_date > :after_start "
+                          "OR (shortage_start_date = :after_start AND shortage_id > :after_id))")
+        params['after_start'], params['after_id'] = after
+    return ' AND '.join(conditions), params
+
+@st.cache_data(max_entries=500)
+def load_shortage_page(_engine, data_version, where="status = 'Current'", params=None, page_size=25):
+    """Load one explorer page, longest active first, plus one row that tells whether a next page exists"""
     query = f"""
     SELECT 
+        shortage_id,
         company_name AS manufacturer,
         shortage_generic_name AS drug_name,
         brand_name,
         shortage_dosage_form AS dosage_form,
         package_description,
+        route_group AS route,
         product_type,
-        DATEDIFF(CURDATE(), STR_TO_DATE(initial_posting_date, '%Y%m%d')) AS days_active
+        therapeutic_category,
+        shortage_start_date
     FROM shortages_with_ndc
-    WHERE status = 'Current' AND product_ndc IS NOT NULL
-    ORDER BY days_active DESC
-    LIMIT {limit}
+    WHERE {where}
+    ORDER BY shortage_start_date, shortage_id
+    LIMIT :page_size
+    """
+    return read_query(query, _engine, {**(params or {}), 'page_size': page_size + 1})
+
+def explorer_page(engine, data_version, filters, search, cursor, page_size):
+    """
+    One explorer page after cursor, dated shortages first, and whether another page follows
+
+    When the dated shortages run out part way through a page, the page is
+    filled from the start of the undated ones.
+    """
+    dialect = engine.dialect.name
+    page = None
+    if cursor is None or cursor[0] is not None:
+        where, params = explorer_where(filters, search, cursor, dialect)
+        page = load_shortage_page(engine, data_version, where, params, page_size)
+        cursor = None
+    if page is None or len(page) <= page_size:
+        # One row past the page still tells whether a next page exists
+        remaining = page_size - (0 if page is None else len(page))
+        where, params = explorer_where(filters, search, cursor, dialect, undated=True)
+        undated = load_shortage_page(engine, data_version, where, params, remaining)
+        page = undated if page is None or page.empty else pd.concat([page, undated], ignore_index=True)
+    return page.head(page_size), len(page) > page_size
+
+def page_cursor(page):
+    """
+    Keyset cursor after the last row of a page: (shortage_start_date as
+    'YYYY-MM-DD', or None in the undated shortages, shortage_id)
     """
-    return pd.read_sql(query, _engine)
+    last = page.iloc[-1]
+    start = None if pd.isna(last['shortage_start_date']) else str(pd.Timestamp(last['shortage_start_date']).date())
+    return start, int(last['shortage_id'])
+
+def explorer_display(page):
+    """Explorer page as shown: days active instead of the start date and row ID"""
+    start = pd.to_datetime(page['shortage_start_date'])
+    days_active = (pd.Timestamp.today().normalize() - start).dt.days
+    return page.drop(columns=['shortage_id', 'shortage_start_date']).assign(days_active=days_active)
 
 # ============================================
 # Dashboard Layout
@@ -168,17 +322,25 @@ def main():
     refresh_button = st.sidebar.button("🔄 Refresh Data", use_container_width=True)
     
     if refresh_button:
-        st.cache_data.clear()
+        # Poll the data version now; the data is refetched only if it changed
+        load_data_version.clear()
         st.rerun()
     
     st.sidebar.markdown("---")
-    st.sidebar.info("""
+    data_version = load_data_version(engine)
+    last_refreshed = data_version[1]
+    snapshot = load_current_snapshot(engine, data_version)
+    last_updated = last_refreshed.strftime('%Y-%m-%d %H:%M') if pd.notna(last_refreshed) else 'Never'
+    st.sidebar.info(f"""
     **Data Sources:**
     - FDA National Drug Code Database
     - FDA Drug Shortages Database
     
-    **Last Updated:** Real-time
+    **Last Updated:** {last_updated} (data version {data_version[0]})
     """)
+
+    with st.sidebar.expander("Database connections"):
+        st.json(pool_metrics(engine))
     
     # ============================================
     # Key Metrics Row
@@ -186,7 +348,7 @@ def main():
     
     st.header("📊 Key Metrics")
     
-    overview = load_shortage_overview(engine)
+    overview = load_shortage_overview(engine, data_version)
     
     col1, col2, col3, col4 = st.columns(4)
     
@@ -222,7 +384,7 @@ def main():
     
     st.header("🏭 Top Manufacturers by Shortage Risk")
     
-    manufacturer_data = load_manufacturer_risk(engine)
+    manufacturer_data = manufacturer_risk(snapshot)
     
     col1, col2 = st.columns([2, 1])
     
@@ -256,7 +418,7 @@ def main():
     
     st.header("💊 Brand Name vs Generic Drug Shortages")
     
-    brand_data = load_brand_vs_generic(engine)
+    brand_data = brand_vs_generic(snapshot)
     
     col1, col2 = st.columns(2)
     
@@ -298,7 +460,7 @@ def main():
     
     st.header("💉 Shortages by Route of Administration")
     
-    route_data = load_route_analysis(engine)
+    route_data = route_analysis(snapshot)
     
     fig = px.bar(
         route_data,
@@ -325,7 +487,7 @@ def main():
     
     st.header("📋 Prescription vs OTC Drug Shortages")
     
-    product_type_data = load_product_type_analysis(engine)
+    product_type_data = product_type_analysis(snapshot)
     
     col1, col2 = st.columns([2, 1])
     
@@ -351,31 +513,72 @@ def main():
     st.markdown("---")
     
     # ============================================
-    # Detailed Shortage Table
+    # Shortage Explorer
     # ============================================
     
-    st.header("📑 Detailed Current Shortage List")
+    st.header("📑 Current Shortage Explorer")
     
-    num_records = st.slider("Number of records to display:", 10, 100, 50, 10)
-    
-    detailed_data = load_detailed_shortages(engine, num_records)
+    col1, col2, col3, col4 = st.columns(4)
+    filter_columns = dict(zip(EXPLORER_FILTERS, (col1, col2, col3, col4)))
+    labels = {'manufacturer': "Manufacturer", 'route': "Route", 'product_type': "Product type",
+              'category': "Therapeutic category"}
+    filters = {
+        name: filter_columns[name].selectbox(labels[name], filter_options(snapshot, column),
+                                             index=None, placeholder="All")
+        for name, column in EXPLORER_FILTERS.items()
+    }
+    col1, col2 = st.columns([3, 1])
+    search = col1.text_input("Search generic or brand name", placeholder="e.g. amoxicillin").strip()
+    page_size = col2.selectbox("Rows per page", PAGE_SIZES)
+    
+    # Start over from the first page when the filters or the data change
+    selection = (tuple(filters.values()), search, page_size, data_version)
+    if st.session_state.get('explorer_selection') != selection:
+        st.session_state.explorer_selection = selection
+        st.session_state.explorer_cursors = [None]
+    cursors = st.session_state.explorer_cursors
+    
+    page, has_next = explorer_page(engine, data_version, filters, search, cursors[-1], page_size)
     
     st.dataframe(
-        detailed_data,
+        explorer_display(page),
         hide_index=True,
         use_container_width=True,
         height=400
     )
     
+    col1, col2, col3 = st.columns([1, 2, 1])
+    if col1.button("◀ Previous", disabled=len(cursors) == 1, use_container_width=True):
+        cursors.pop()
+        st.rerun()
+    col2.caption(f"Page {len(cursors)}" + ("" if has_next else " (last page)"))
+    if col3.button("Next ▶", disabled=not has_next, use_container_width=True):
+        cursors.append(page_cursor(page))
+        st.rerun()
+    
     # Download button
-    csv = detailed_data.to_csv(index=False)
+    csv = explorer_display(page).to_csv(index=False)
     st.download_button(
-        label="📥 Download CSV",
+        label="📥 Download page (CSV)",
         data=csv,
         file_name="fda_drug_shortages.csv",
         mime="text/csv"
     )
     
+    # Full export, streamed by the export endpoint rather than built here in memory
+    st.subheader("📦 Export the Full Dataset")
+    col1, col2 = st.columns([1, 3])
+    export_format = col1.radio("Format", EXPORT_FORMATS, horizontal=True)
+    filtered = col2.checkbox("Only current shortages matching the explorer filters (not the name search)")
+    export_filters = {'status': 'Current', **{name: value for name, value in filters.items() if value is not None}}
+    if EXPORT_URL:
+        query_string = urlencode(export_filters) if filtered else ''
+        st.link_button(f"📥 Export shortages_with_ndc ({export_format})",
+                       f"{EXPORT_URL}.{export_format}" + (f"?{query_string}" if query_string else ''))
+    else:
+        st.caption("Full exports are streamed by an export endpoint: launch the dashboard with "
+                   "`python -m streamlit run scripts/dashboard_app.py`, or run `scripts/export_data.py`.")
+    
     st.markdown("---")
     
     # Footer
@@ -0,0 +1,75 @@
+"""
+Dashboard Server with Data Export
+Serves scripts/dashboard.py together with an HTTP endpoint that streams
+the full enriched table (see export_data.py):
+
+    /export/shortages_with_ndc.csv
+    /export/shortages_with_ndc.parquet?status=Current&manufacturer=...
+
+The response is sent chunk by chunk as rows come off the database cursor,
+so memory on the dashboard host stays bounded however large the export.
+The URL parameters are the export filters (status, manufacturer, route,
+product_type, category); the dashboard's export button links here with
+the explorer's filters filled in.
+
+Needs Streamlit 1.59 or later, the first release with st.App (custom
+routes on Streamlit's Starlette server); see requirements.txt.
+
+Usage:
+    python -m streamlit run scripts/dashboard_app.py
+"""
+
+import os
+import sys
+import threading
+
+import streamlit as st
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import get_engine  # noqa: E402
+from export_data import EXPORT_FILTERS, EXPORT_FORMATS, EXPORT_TABLE, MEDIA_TYPES, iter_export  # noqa: E402
+
+EXPORT_URL = f"/export/{EXPORT_TABLE}"
+
+# Tells dashboard.py (run by this server) that the export endpoint exists
+os.environ['FDA_EXPORT_URL'] = EXPORT_URL
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def export_engine():
+    """Engine shared by all export requests"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = get_engine(read_only=True)
+        return _engine
+
+
+def export(request):
+    """Stream shortages_with_ndc in the requested format, filtered by the URL parameters"""
+    fmt = request.path_params['fmt']
+    if fmt not in EXPORT_FORMATS:
+        return PlainTextResponse(f"Unknown format '{fmt}'. Choose from: {', '.join(EXPORT_FORMATS)}",
+                                 status_code=404)
+    unknown = [name for name in request.query_params if name not in EXPORT_FILTERS]
+    if unknown:
+        return PlainTextResponse(f"Unknown filters: {', '.join(unknown)}. Choose from: {', '.join(EXPORT_FILTERS)}",
+                                 status_code=400)
+
+    filters = dict(request.query_params)
+    return StreamingResponse(
+        iter_export(export_engine(), fmt, filters),
+        media_type=MEDIA_TYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{EXPORT_TABLE}.{fmt}"'},
+    )
+
+
+app = st.App(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard.py'),
+    routes=[Route(EXPORT_URL + '.{fmt}', export)],
+)
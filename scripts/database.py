@@ -0,0 +1,332 @@
+"""
+Database Access
+Creates every SQLAlchemy engine the pipeline and the dashboard use, from
+one environment-driven configuration, with a tuned connection pool and
+connection metrics.
+
+The backend is MySQL by default. FDA_DB_BACKEND=duckdb (or sqlite) runs
+the whole pipeline and the dashboard on an embedded database file instead,
+with no server to install: the SQL in sql/ is translated on the fly (see
+sql_dialects.py) and the processed files are loaded directly (see
+embedded_load.py). DuckDB executes the GROUP BY-heavy analyses on columns
+and is the recommended embedded backend; it needs
+pip install duckdb duckdb-engine. SQLite needs nothing beyond Python.
+
+Configuration (environment variables, defaults in parentheses):
+  FDA_DB_BACKEND (mysql)      mysql, duckdb or sqlite
+  FDA_DB_PATH (data/<FDA_DB_NAME>.<backend>)  database file of an embedded backend
+  FDA_DB_USER (root), FDA_DB_PASSWORD (empty), FDA_DB_HOST (localhost),
+  FDA_DB_PORT (3306), FDA_DB_NAME (fda_shortage_db),
+  FDA_DB_DRIVER (mysqlconnector)
+  FDA_DB_POOL_SIZE (5)        connections kept open per engine
+  FDA_DB_MAX_OVERFLOW (10)    extra connections allowed under bursts
+  FDA_DB_POOL_TIMEOUT (30)    seconds to wait for a free connection
+  FDA_DB_POOL_RECYCLE (1800)  seconds before a connection is replaced, well
+                              under MySQL's wait_timeout so the server never
+                              drops a pooled connection first
+
+Every pool pings a connection before handing it out (pre-ping), so a
+connection dropped by the server is replaced instead of failing a query,
+and hands out the most recently used connection first (LIFO), so idle
+overflow connections age out instead of being kept warm by round-robin.
+
+Large reads go through read_sql_chunks(), which streams rows from a
+server-side (unbuffered) cursor instead of buffering the whole result.
+
+pool_metrics(engine) reports connection churn and pool usage: new
+connections, checkouts, invalidations, the peak number of connections in
+use and how long they were held.
+
+Example:
+    engine = get_engine()
+    for chunk in read_sql_chunks(engine, "SELECT * FROM shortages_with_ndc"):
+        ...
+    print(pool_metrics(engine))
+"""
+
+import hashlib
+import os
+import threading
+import time
+import weakref
+
+import pandas as pd
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import URL
+
+try:
+    import duckdb_engine as duckdb_dialect  # SQLAlchemy dialect for DuckDB
+except ImportError:
+    duckdb_dialect = None
+
+BACKENDS = ('mysql', 'duckdb', 'sqlite')
+
+DB_USER = os.environ.get('FDA_DB_USER', 'root')
+DB_PASSWORD = os.environ.get('FDA_DB_PASSWORD', '')
+DB_HOST = os.environ.get('FDA_DB_HOST', 'localhost')
+DB_PORT = int(os.environ.get('FDA_DB_PORT', '3306'))
+DB_NAME = os.environ.get('FDA_DB_NAME', 'fda_shortage_db')
+DB_DRIVER = os.environ.get('FDA_DB_DRIVER', 'mysqlconnector')
+DB_BACKEND = os.environ.get('FDA_DB_BACKEND', 'mysql')
+DB_PATH = os.environ.get('FDA_DB_PATH') or os.path.join('data', f"{DB_NAME}.{DB_BACKEND}")
+
+POOL_SIZE = int(os.environ.get('FDA_DB_POOL_SIZE', '5'))
+MAX_OVERFLOW = int(os.environ.get('FDA_DB_MAX_OVERFLOW', '10'))
+POOL_TIMEOUT = int(os.environ.get('FDA_DB_POOL_TIMEOUT', '30'))
+POOL_RECYCLE = int(os.environ.get('FDA_DB_POOL_RECYCLE', '1800'))
+
+DEFAULT_CHUNK_ROWS = 10000
+
+
+def database_url(database=DB_NAME):
+    """
+    URL of the configured MySQL server
+
+    Args:
+        database: Database to select, or None to connect to the server only
+    """
+    return URL.create(f"mysql+{DB_DRIVER}", username=DB_USER, password=DB_PASSWORD,
+                      host=DB_HOST, port=DB_PORT, database=database)
+
+
+def get_engine(database=DB_NAME, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, local_infile=False,
+               read_only=False):
+    """
+    Pooled engine for the configured backend
+
+    With an embedded backend (FDA_DB_BACKEND=duckdb or sqlite) this is the
+    engine of the database file FDA_DB_PATH, and the MySQL arguments are
+    ignored.
+
+    Args:
+        database: Database to select, or None to connect to the server only
+        pool_size: Connections kept open (e.g. one per load worker)
+        max_overflow: Extra connections allowed beyond pool_size
+        local_infile: Allow LOAD DATA LOCAL INFILE (used by bulk_load.py)
+        read_only: Open a DuckDB database read-only, so several processes can read it (ignored otherwise)
+    """
+    if DB_BACKEND != 'mysql':
+        return embedded_engine(DB_BACKEND, DB_PATH, read_only)
+    connect_args = {'allow_local_infile': True} if local_infile else {}
+    engine = create_engine(
+        database_url(database),
+        connect_args=connect_args,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=True,
+        pool_use_lifo=True,
+    )
+    track_pool(engine)
+    return engine
+
+
+def database_label():
+    """Where the configured database lives, for messages (e.g. 'MySQL database fda_shortage_db')"""
+    if DB_BACKEND == 'mysql':
+        return f"MySQL database {DB_NAME}"
+    return f"{DB_BACKEND} database {DB_PATH}"
+
+
+def server_engine():
+    """Engine connected to the MySQL server without selecting a database (or the embedded database)"""
+    return get_engine(database=None, pool_size=1, max_overflow=0)
+
+
+# ============================================
+# Embedded Backends
+# ============================================
+
+def _md5(value):
+    return None if value is None else hashlib.md5(str(value).encode('utf-8')).hexdigest()
+
+
+def sqlite_engine(path):
+    """
+    SQLAlchemy engine for a SQLite database file that can run translated scripts
+
+    Registers MD5() (used by the row_hash generated columns) and keeps
+    table renames from rewriting views, as RENAME TABLE does in MySQL.
+    """
+    engine = create_engine(f'sqlite:///{path}')
+
+    @event.listens_for(engine, 'connect')
+    def configure(dbapi_connection, connection_record):
+        dbapi_connection.create_function('MD5', 1, _md5, deterministic=True)
+        dbapi_connection.execute('PRAGMA legacy_alter_table = ON')
+
+    track_pool(engine)
+    return engine
+
+
+def duckdb_file_engine(path, read_only=False):
+    """
+    SQLAlchemy engine for a DuckDB database file
+
+    Connections of one process share the database. A process that opens
+    the file for writing locks out every other process; any number of
+    processes can open it read-only at the same time.
+    """
+    if duckdb_dialect is None:
+        raise ImportError("The duckdb backend requires duckdb-engine. "
+                          "Install it with: pip install duckdb duckdb-engine")
+    engine = create_engine(f'duckdb:///{path}', connect_args={'read_only': read_only})
+    track_pool(engine)
+    return engine
+
+
+def embedded_engine(backend, path, read_only=False):
+    """Engine of an embedded database file ('duckdb' or 'sqlite'), creating its directory"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if backend == 'duckdb':
+        return duckdb_file_engine(path, read_only)
+    if backend == 'sqlite':
+        return sqlite_engine(path)
+    raise ValueError(f"Unknown backend '{backend}'. Choose from: {', '.join(BACKENDS)}")
+
+
+# ============================================
+# Connection Metrics
+# ============================================
+
+class PoolMetrics:
+    """Counts of one engine's pool events (updated by the pool's event listeners)"""
+
+    def __init__(self):
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.hold_seconds = 0.0
+        self.max_hold_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'invalidations': self.invalidations,
+                'checked_out': self.checked_out,
+                'peak_checked_out': self.peak_checked_out,
+                'hold_seconds': round(self.hold_seconds, 4),
+                'max_hold_seconds': round(self.max_hold_seconds, 4),
+            }
+
+
+_metrics = weakref.WeakKeyDictionary()
+
+
+def track_pool(engine):
+    """Start collecting PoolMetrics for an engine (done by get_engine)"""
+    if engine in _metrics:
+        return _metrics[engine]
+    metrics = _metrics[engine] = PoolMetrics()
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        with metrics._lock:
+            metrics.connects += 1
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info['checked_out_at'] = time.perf_counter()
+        with metrics._lock:
+            metrics.checkouts += 1
+            metrics.checked_out += 1
+            metrics.peak_checked_out = max(metrics.peak_checked_out, metrics.checked_out)
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop('checked_out_at', None)
+        with metrics._lock:
+            metrics.checkins += 1
+            metrics.checked_out = max(metrics.checked_out - 1, 0)
+            if started is not None:
+                held = time.perf_counter() - started
+                metrics.hold_seconds += held
+                metrics.max_hold_seconds = max(metrics.max_hold_seconds, held)
+
+    @event.listens_for(engine, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        with metrics._lock:
+            metrics.invalidations += 1
+
+    return metrics
+
+
+def pool_metrics(engine):
+    """
+    Connection metrics of an engine, plus the pool's current state
+
+    Returns:
+        dict: PoolMetrics counts and 'pool' (e.g. 'Pool size: 5  Connections in pool: 2 ...')
+    """
+    metrics = _metrics[engine].to_dict() if engine in _metrics else {}
+    metrics['pool'] = engine.pool.status()
+    return metrics
+
+
+# ============================================
+# Streaming Reads
+# ============================================
+
+def _positional(engine, sql, params):
+    """Compile a text() query for the driver: (SQL string, driver parameters)"""
+    compiled = text(sql).compile(dialect=engine.dialect)
+    values = compiled.construct_params(params or {})
+    if compiled.positiontup is not None:
+        return compiled.string, tuple(values[name] for name in compiled.positiontup)
+    return compiled.string, values
+
+
+def read_sql_chunks(engine, sql, params=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Yield the result of a query as DataFrames of at most chunk_rows rows
+
+    Rows are read from a server-side (unbuffered) cursor, so memory depends
+    on chunk_rows rather than on the size of the result. The connection is
+    held until the generator is exhausted or closed; a MySQL connection
+    left with unread rows is discarded rather than returned to the pool.
+
+    Args:
+        engine: SQLAlchemy engine
+        sql: Query text with :name placeholders
+        params: Dict of placeholder values
+        chunk_rows: Rows per DataFrame
+    """
+    if engine.dialect.supports_server_side_cursors or engine.dialect.name != 'mysql':
+        with engine.connect() as conn:
+            conn = conn.execution_options(stream_results=True, yield_per=chunk_rows)
+            result = conn.execute(text(sql), params or {})
+            columns = list(result.keys())
+            for rows in result.partitions(chunk_rows):
+                yield pd.DataFrame(rows, columns=columns)
+        return
+
+    # mysql-connector: SQLAlchemy always uses buffered cursors, so use an
+    # unbuffered driver cursor directly
+    statement, values = _positional(engine, sql, params)
+    raw = engine.raw_connection()
+    finished = False
+    try:
+        cursor = raw.driver_connection.cursor(buffered=False)
+        cursor.execute(statement, values)
+        columns = [column[0] for column in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield pd.DataFrame(rows, columns=columns)
+        cursor.close()
+        finished = True
+    finally:
+        if not finished:
+            raw.invalidate()
+        raw.close()
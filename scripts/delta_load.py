@@ -0,0 +1,222 @@
+"""
+Incremental (Delta) Loading for MySQL
+Used by load_to_mysql.py --mode delta to refresh the raw tables without a
+full drop and reload.
+
+For each table:
+  1. The processed file is bulk loaded into a staging table created with
+     CREATE TABLE stg_<table> LIKE <table> (same columns, keys and row_hash).
+  2. Rows are matched to the live table by natural key, and changed rows
+     are found by comparing the generated row_hash columns.
+  3. Only the differences are applied: live rows missing from the new data
+     are deleted, and new or changed rows are written with
+     INSERT ... ON DUPLICATE KEY UPDATE. Unchanged rows are never touched.
+
+Rows with a NULL natural key cannot be matched by key, so they are matched
+on their row_hash instead (they are deleted and re-inserted if changed).
+
+Every inserted, updated and deleted key is written to pipeline_change_log,
+which transform_data.py uses to refresh only the affected enriched rows.
+Once every consumer's watermark has moved past a change it is pruned (see
+prune_change_log).
+"""
+
+import time
+
+from bulk_load import (DEFAULT_BATCH_SIZE, DEFAULT_CHUNK_ROWS, DEFAULT_STRATEGY,
+                       DEFAULT_WORKERS, TABLE_DEPENDENCIES, load_tables,
+                       quote_identifier, relaxed_checks)
+from table_formats import TABLE_COLUMNS
+
+# Natural key of each raw table
+TABLE_KEYS = {
+    'labelers': 'labeler_id',
+    'raw_ndc': 'product_ndc',
+    'raw_ndc_packaging': 'package_ndc',
+    'raw_drug_shortages': 'package_ndc',
+    'shortage_contacts': 'package_ndc',
+    'shortage_ndc_matches': 'package_ndc',
+}
+
+STAGING_PREFIX = 'stg_'
+
+
+class DeltaResult:
+    """Row counts of one table's delta refresh"""
+
+    def __init__(self, table_name, staged, inserted, updated, deleted, seconds):
+        self.table_name = table_name
+        self.staged = staged
+        self.inserted = inserted
+        self.updated = updated
+        self.deleted = deleted
+        self.seconds = seconds
+
+    @property
+    def unchanged(self):
+        return self.staged - self.inserted - self.updated
+
+    def __str__(self):
+        return (f"{self.table_name}: +{self.inserted} inserted, ~{self.updated} updated, "
+                f"-{self.deleted} deleted, {self.unchanged} unchanged ({self.seconds:.2f}s)")
+
+
+def staging_name(table_name):
+    return STAGING_PREFIX + table_name
+
+
+def create_staging_tables(conn, tables):
+    """(Re)create an empty staging copy of each live table"""
+    for table_name in tables:
+        staging = quote_identifier(staging_name(table_name))
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {staging}")
+        conn.exec_driver_sql(f"CREATE TABLE {staging} LIKE {quote_identifier(table_name)}")
+
+
+def drop_staging_tables(conn, tables):
+    for table_name in tables:
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {quote_identifier(staging_name(table_name))}")
+
+
+def apply_table_delta(conn, table_name, file_name):
+    """
+    Apply the differences between stg_<table> and <table>
+
+    Returns:
+        DeltaResult: Counts of inserted, updated and deleted rows
+    """
+    start = time.perf_counter()
+    live = quote_identifier(table_name)
+    stage = quote_identifier(staging_name(table_name))
+    key = quote_identifier(TABLE_KEYS[table_name])
+    columns = [quote_identifier(col) for col in TABLE_COLUMNS[file_name]]
+    column_list = ', '.join(columns)
+    select_list = ', '.join(f"s.{col}" for col in columns)
+    # The new rows are the derived table `new` (the row alias form of VALUES(),
+    # which MySQL 8.0.20 deprecated); target columns are qualified to tell them apart
+    updates = ', '.join(f"{live}.{col} = new.{col}" for col in columns if col != key)
+
+    # A live row matches a staged row with the same key, or (for NULL keys) the same hash
+    match = f"s.{key} <=> l.{key} AND (s.{key} IS NOT NULL OR s.row_hash = l.row_hash)"
+
+    def scalar(sql):
+        return conn.exec_driver_sql(sql).scalar() or 0
+
+    staged = scalar(f"SELECT COUNT(*) FROM {stage}")
+    inserted = scalar(
+        f"SELECT COUNT(*) FROM {stage} s LEFT JOIN {live} l ON {match} WHERE l.row_hash IS NULL"
+    )
+    updated = scalar(
+        f"SELECT COUNT(*) FROM {stage} s JOIN {live} l ON l.{key} = s.{key} "
+        f"WHERE l.row_hash <> s.row_hash"
+    )
+
+    # Record which keys change so downstream tables can refresh only those
+    conn.exec_driver_sql(
+        f"INSERT INTO pipeline_change_log (table_name, natural_key, change_type) "
+        f"SELECT '{table_name}', s.{key}, IF(l.row_hash IS NULL, 'insert', 'update') "
+        f"FROM {stage} s LEFT JOIN {live} l ON {match} "
+        f"WHERE l.row_hash IS NULL OR l.row_hash <> s.row_hash"
+    )
+    conn.exec_driver_sql(
+        f"INSERT INTO pipeline_change_log (table_name, natural_key, change_type) "
+        f"SELECT '{table_name}', l.{key}, 'delete' "
+        f"FROM {live} l LEFT JOIN {stage} s ON {match} WHERE s.row_hash IS NULL"
+    )
+
+    # Rows that disappeared from the source data
+    deleted = conn.exec_driver_sql(
+        f"DELETE l FROM {live} l LEFT JOIN {stage} s ON {match} WHERE s.row_hash IS NULL"
+    ).rowcount
+
+    # New and changed rows with a natural key
+    conn.exec_driver_sql(
+        f"INSERT INTO {live} ({column_list}) "
+        f"SELECT * FROM (SELECT {select_list} FROM {stage} s LEFT JOIN {live} l ON l.{key} = s.{key} "
+        f"WHERE s.{key} IS NOT NULL AND (l.row_hash IS NULL OR l.row_hash <> s.row_hash)) AS new "
+        f"ON DUPLICATE KEY UPDATE {updates}"
+    )
+
+    # New rows without a natural key (matched on content only)
+    conn.exec_driver_sql(
+        f"INSERT INTO {live} ({column_list}) "
+        f"SELECT {select_list} FROM {stage} s LEFT JOIN {live} l "
+        f"ON l.{key} IS NULL AND l.row_hash = s.row_hash "
+        f"WHERE s.{key} IS NULL AND l.row_hash IS NULL"
+    )
+
+    return DeltaResult(table_name, staged, inserted, updated, deleted, time.perf_counter() - start)
+
+
+def record_reload(engine, tables):
+    """
+    Log a 'reload' for tables loaded in full (append mode), which tells the
+    transformation step that it has to rebuild rather than refresh
+    """
+    with engine.begin() as conn:
+        for table_name in tables:
+            conn.exec_driver_sql(
+                f"INSERT INTO pipeline_change_log (table_name, change_type) "
+                f"VALUES ('{table_name}', 'reload')"
+            )
+
+
+def prune_change_log(conn):
+    """
+    Delete the pipeline_change_log rows every consumer has been refreshed past
+
+    Rows below the lowest pipeline_watermarks.last_change_id are removed.
+    The row at the watermark itself is kept, so MAX(change_id) never falls
+    behind a watermark. Nothing is removed before a first watermark exists.
+
+    Returns:
+        int: Number of rows deleted
+    """
+    return conn.exec_driver_sql(
+        "DELETE FROM pipeline_change_log "
+        "WHERE change_id < (SELECT MIN(last_change_id) FROM pipeline_watermarks)"
+    ).rowcount
+
+
+def load_delta(engine, tables, fmt='csv', strategy=DEFAULT_STRATEGY,
+               batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS,
+               chunk_rows=DEFAULT_CHUNK_ROWS, on_done=None):
+    """
+    Refresh the live tables from the processed files, touching only changed rows
+
+    Staging tables are bulk loaded in parallel (see bulk_load.load_tables),
+    then all deltas are applied in a single transaction so readers never see
+    a partly refreshed set of tables.
+
+    Args:
+        engine: SQLAlchemy engine
+        tables: Dict of MySQL table -> processed table name
+        fmt, strategy, batch_size, workers, chunk_rows: As for bulk_load.load_tables
+        on_done: Optional callback(table_name, LoadResult or exception) for the staging loads
+
+    Returns:
+        dict: Table name -> DeltaResult
+    """
+    with engine.begin() as conn:
+        create_staging_tables(conn, tables)
+
+    try:
+        # The staging tables are dropped on failure, so chunks load into them directly
+        staged = load_tables(engine, {staging_name(t): f for t, f in tables.items()}, fmt,
+                             strategy, batch_size, workers, chunk_rows, on_done, staged=False)
+        failed = {t: r for t, r in staged.items() if isinstance(r, Exception)}
+        if failed:
+            raise RuntimeError("Staging load failed: " + "; ".join(f"{t}: {e}" for t, e in failed.items()))
+
+        # Parents before children, so new packages always find their product.
+        # Unique checks stay on: ON DUPLICATE KEY UPDATE relies on them.
+        order = sorted(tables, key=lambda t: t in TABLE_DEPENDENCIES)
+        results = {}
+        with engine.begin() as conn, relaxed_checks(conn, unique=False):
+            for table_name in order:
+                results[table_name] = apply_table_delta(conn, table_name, tables[table_name])
+        return results
+
+    finally:
+        with engine.begin() as conn:
+            drop_staging_tables(conn, tables)
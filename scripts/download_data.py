@@ -1,65 +1,330 @@
 """
 FDA Data Download Script
 Downloads NDC and Drug Shortage datasets from FDA's official sources
+
+Archives are streamed to a partial file in fixed-size chunks and extracted
+from disk, so peak memory stays flat regardless of archive size.
+
+A small cache (data/.download_cache.json) keyed by URL remembers each
+archive's ETag, Last-Modified and SHA-256. Reruns send conditional requests
+and skip the download on a 304, skip extraction when the content hash is
+unchanged, and resume interrupted downloads with HTTP Range requests
+(If-Range carries the validator of the interrupted response, saved next to
+the partial file). Both archives are fetched at the same time.
+
+Usage:
+    python scripts/download_data.py           # use the cache
+    python scripts/download_data.py --force   # ignore the cache
 """
 
-import pandas as pd
-import requests
-import zipfile
-import io
+import argparse
+import hashlib
 import json
 import os
+import sys
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from instrumentation import RunReport
 
-print("Starting FDA data download...")
+# Size of each chunk read from the network and written to disk (1 MB)
+CHUNK_SIZE = 1024 * 1024
+
+DATA_DIR = 'data'
+CACHE_FILE = os.path.join(DATA_DIR, '.download_cache.json')
+
+DATASETS = {
+    'NDC': "https://download.open.fda.gov/drug/ndc/drug-ndc-0001-of-0001.json.zip",
+    'Drug Shortages': "https://download.open.fda.gov/drug/shortages/drug-shortages-0001-of-0001.json.zip",
+}
+
+_cache_lock = threading.Lock()
 
-# Create data directory if it doesn't exist
-os.makedirs('data', exist_ok=True)
 
 # ============================================
-# Download NDC Dataset
+# Download Cache
 # ============================================
-print("\n1. Downloading NDC dataset (this may take a few minutes, ~119MB)...")
-
-ndc_url = "https://download.open.fda.gov/drug/ndc/drug-ndc-0001-of-0001.json.zip"
-
-try:
-    response = requests.get(ndc_url)
-    response.raise_for_status()
-    
-    print("   Download complete. Extracting...")
-    
-    # Extract zip file
-    zip_bytes = io.BytesIO(response.content)
-    with zipfile.ZipFile(zip_bytes) as z:
-        z.extractall("data")
-    
-    print("   ✓ NDC dataset downloaded and extracted to data/")
-    
-except Exception as e:
-    print(f"   ✗ Error downloading NDC dataset: {e}")
+
+def load_cache(cache_file=CACHE_FILE):
+    """Load the download cache, returning an empty cache if missing or corrupt"""
+    try:
+        with open(cache_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_cache(url, entry, cache_file=CACHE_FILE):
+    """Store the cache entry for a URL (safe to call from several threads)"""
+    with _cache_lock:
+        cache = load_cache(cache_file)
+        cache[url] = entry
+        tmp_file = cache_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_file, cache_file)
+
+
+def partial_path(url, dest_dir=DATA_DIR):
+    """Stable path of the partial download for a URL, so it can be resumed"""
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(dest_dir, f'.{key}.zip.part')
+
+
+def validator_path(part_file):
+    """Path of the file holding the validator of a partial download"""
+    return part_file + '.validator'
+
+
+def load_validator(part_file):
+    """
+    If-Range value for resuming a partial download
+
+    Taken from the response that started the partial body: its ETag if
+    strong (weak ETags are not allowed in If-Range), else its Last-Modified.
+
+    Returns:
+        str: The validator, or None if there is none
+    """
+    try:
+        with open(validator_path(part_file), 'r') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return None
+    etag = saved.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return saved.get('last_modified')
+
+
+def save_validator(part_file, response):
+    """Remember the validators of the response a partial download is written from"""
+    with open(validator_path(part_file), 'w') as f:
+        json.dump({
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }, f)
+
+
+def discard_partial(part_file):
+    """Remove a partial download and its validator"""
+    for path in (part_file, validator_path(part_file)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def files_present(entry, dest_dir=DATA_DIR):
+    """Check that every file extracted from a cached archive still exists"""
+    files = entry.get('files') or []
+    return bool(files) and all(os.path.exists(os.path.join(dest_dir, name)) for name in files)
+
+
+def sha256_file(path, chunk_size=CHUNK_SIZE):
+    """Hash a file in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 
 # ============================================
-# Download Drug Shortages Dataset
+# Download and Extract
 # ============================================
-print("\n2. Downloading Drug Shortages dataset...")
-
-shortages_url = "https://download.open.fda.gov/drug/shortages/drug-shortages-0001-of-0001.json.zip"
-
-try:
-    response = requests.get(shortages_url)
-    response.raise_for_status()
-    
-    print("   Download complete. Extracting...")
-    
-    # Extract zip file
-    zip_bytes = io.BytesIO(response.content)
-    with zipfile.ZipFile(zip_bytes) as z:
-        z.extractall("data")
-    
-    print("   ✓ Drug Shortages dataset downloaded and extracted to data/")
-    
-except Exception as e:
-    print(f"   ✗ Error downloading Drug Shortages dataset: {e}")
-
-print("\n✓ All downloads complete!")
-print("\nNext step: Run process_data.py to clean and prepare the data for MySQL")
+
+def download_to_file(url, dest_path, headers=None, chunk_size=CHUNK_SIZE):
+    """
+    Stream a URL to a local file without holding the body in memory
+
+    If dest_path already holds part of the body, a Range request resumes
+    from where it stopped. If-Range carries the ETag/Last-Modified of the
+    response the partial body came from (saved next to it), so the server
+    sends the full body instead when the remote file changed in between.
+    A partial body with no saved validator is discarded, not resumed.
+
+    Args:
+        url: URL to download
+        dest_path: Path of the file to write (may hold a partial download)
+        headers: Extra request headers (e.g. conditional headers)
+        chunk_size: Number of bytes to read per chunk
+
+    Returns:
+        requests.Response: The response, with its body already written to dest_path
+    """
+    request_headers = dict(headers or {})
+    resume_from = os.path.getsize(dest_path) if os.path.exists(dest_path) else 0
+    if resume_from:
+        validator = load_validator(dest_path)
+        if validator:
+            request_headers['Range'] = f'bytes={resume_from}-'
+            request_headers['If-Range'] = validator
+        else:
+            # Cannot tell whether the partial body is still current
+            discard_partial(dest_path)
+
+    with requests.get(url, stream=True, headers=request_headers, timeout=60) as response:
+        if response.status_code == 304:
+            return response
+        if response.status_code == 416:
+            # Partial file is already complete (or invalid): start over
+            discard_partial(dest_path)
+            return download_to_file(url, dest_path, headers, chunk_size)
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            mode = 'ab'
+        else:
+            # Full body: saved before writing so an interrupted download can resume
+            mode = 'wb'
+            save_validator(dest_path, response)
+        with open(dest_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    f.write(chunk)
+    return response
+
+
+def fetch_dataset(name, url, dest_dir=DATA_DIR, cache_file=CACHE_FILE, force=False,
+                  chunk_size=CHUNK_SIZE):
+    """
+    Download and extract one archive, using the cache to skip unchanged data
+
+    Args:
+        name: Human-readable dataset name (used in progress messages)
+        url: URL of the zip archive
+        dest_dir: Directory to extract into
+        cache_file: Path of the download cache
+        force: Ignore the cache and download everything again
+        chunk_size: Number of bytes to read per chunk
+
+    Returns:
+        str: 'not-modified', 'unchanged' or 'downloaded'
+    """
+    entry = {} if force else load_cache(cache_file).get(url, {})
+    part_file = partial_path(url, dest_dir)
+    if force:
+        discard_partial(part_file)
+
+    # Only ask for a 304 if the extracted files are still on disk
+    headers = {}
+    if files_present(entry, dest_dir):
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    if os.path.exists(part_file):
+        print(f"   [{name}] Resuming download at {os.path.getsize(part_file) / 1024 / 1024:.1f} MB...")
+    response = download_to_file(url, part_file, headers, chunk_size)
+
+    if response.status_code == 304:
+        print(f"   [{name}] Not modified upstream. Skipping download.")
+        return 'not-modified'
+
+    content_hash = sha256_file(part_file, chunk_size)
+    size = os.path.getsize(part_file)
+    print(f"   [{name}] Download complete ({size / 1024 / 1024:.1f} MB).")
+
+    try:
+        if content_hash == entry.get('sha256') and files_present(entry, dest_dir):
+            print(f"   [{name}] Content unchanged. Skipping extraction.")
+            status = 'unchanged'
+            names = entry['files']
+        else:
+            print(f"   [{name}] Extracting...")
+            # extractall copies each member from the file on disk in chunks
+            with zipfile.ZipFile(part_file) as z:
+                names = z.namelist()
+                z.extractall(dest_dir)
+            status = 'downloaded'
+    finally:
+        discard_partial(part_file)
+
+    update_cache(url, {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'sha256': content_hash,
+        'size': size,
+        'files': names,
+        'fetched_at': datetime.now().isoformat(timespec='seconds'),
+    }, cache_file)
+    return status
+
+
+def fetch_measured(report, name, url, dest_dir=DATA_DIR, cache_file=CACHE_FILE, force=False):
+    """
+    fetch_dataset() recorded as a 'download <name>' stage of a RunReport
+
+    bytes_in is the archive size when it was transferred (0 on a 304) and
+    bytes_out the size of the extracted files.
+    """
+    with report.stage(f"download {name}") as stage:
+        status = fetch_dataset(name, url, dest_dir, cache_file, force)
+        entry = load_cache(cache_file).get(url, {})
+        stage.bytes_in = 0 if status == 'not-modified' else entry.get('size', 0)
+        stage.outputs = [os.path.join(dest_dir, file_name) for file_name in entry.get('files', [])]
+        stage.extra['status'] = status
+    return status
+
+
+def download_all(datasets=DATASETS, dest_dir=DATA_DIR, cache_file=CACHE_FILE, force=False, report=None):
+    """
+    Fetch every dataset concurrently
+
+    Args:
+        report: Optional instrumentation.RunReport to record each download in
+
+    Returns:
+        dict: Dataset name -> status string, or the exception raised
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(datasets)) as pool:
+        futures = {
+            name: (pool.submit(fetch_measured, report, name, url, dest_dir, cache_file, force) if report
+                   else pool.submit(fetch_dataset, name, url, dest_dir, cache_file, force))
+            for name, url in datasets.items()
+        }
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download FDA NDC and Drug Shortage datasets")
+    parser.add_argument('--force', action='store_true',
+                        help="ignore the download cache and fetch everything again")
+    args = parser.parse_args()
+
+    print("Starting FDA data download...")
+    print("\nDownloading NDC (~119MB) and Drug Shortages datasets in parallel...")
+
+    report = RunReport('download_data', {'force': args.force})
+    results = download_all(force=args.force, report=report)
+
+    failed = False
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            print(f"   ✗ Error downloading {name} dataset: {result}")
+            failed = True
+        else:
+            print(f"   ✓ {name} dataset ready in data/ ({result})")
+
+    print(f"   Run report: {report.write()}")
+
+    if failed:
+        sys.exit(1)
+
+    print("\n✓ All downloads complete!")
+    print("\nNext step: Run process_data.py to clean and prepare the data for MySQL")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Loading for the Embedded Backends
+Used by load_to_mysql.py, run_pipeline.py and benchmark.py to load the
+processed tables into an embedded database (FDA_DB_BACKEND=duckdb or
+sqlite; see database.py) instead of MySQL.
+
+  - DuckDB reads the processed files itself, with one
+    INSERT ... SELECT per table: CSV through read_csv and Parquet through
+    read_parquet, with no pandas in between. Feather (Arrow IPC) files are
+    memory-mapped with pyarrow and DuckDB scans the Arrow buffers.
+  - SQLite loads each table from a DataFrame with batched INSERTs
+    (DataFrame.to_sql).
+
+An embedded database has a single writer, so tables load one at a time.
+With replace=True the existing rows are deleted first in the same
+transaction: the embedded backends reload tables in full rather than
+applying deltas (see delta_load.py, which is MySQL only).
+"""
+
+import csv
+import threading
+import time
+
+from bulk_load import LoadResult
+from table_formats import TABLE_COLUMNS, read_arrow, read_schema, read_table, require_pyarrow, table_path
+
+SQLITE_CHUNK_ROWS = 5000
+
+# Column types of TABLE_COLUMNS kinds in DuckDB's read_csv
+DUCKDB_TYPES = {'string': 'VARCHAR', 'int': 'BIGINT', 'bool': 'BOOLEAN', 'date': 'DATE'}
+
+# Held by every write to an embedded database from this process, so
+# concurrent pipeline tasks never wait out SQLite's busy timeout
+write_lock = threading.Lock()
+
+
+def file_columns(file_name, fmt='csv'):
+    """Columns of a processed file that belong to its table, in table order"""
+    path = table_path(file_name, fmt)
+    if fmt == 'csv':
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            present = set(next(csv.reader(f), []))
+    else:
+        present = set(read_schema(file_name, fmt).names)
+    return [col for col in TABLE_COLUMNS[file_name] if col in present]
+
+
+def quote_identifier(name):
+    """Quote an identifier the standard SQL way (DuckDB does not accept MySQL's backticks)"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def load_table_duckdb(conn, table_name, file_name, fmt='csv'):
+    """
+    Insert a processed file into a DuckDB table with a scan of the file
+
+    Returns:
+        int: Number of rows loaded
+    """
+    columns = file_columns(file_name, fmt)
+    column_list = ', '.join(quote_identifier(col) for col in columns)
+    path = _sql_string(table_path(file_name, fmt).replace('\\', '/'))
+    view = None
+
+    if fmt == 'csv':
+        # pandas quotes fields with doubled quotes; empty fields are NULL
+        types = ', '.join(f"{_sql_string(col)}: '{DUCKDB_TYPES[TABLE_COLUMNS[file_name][col]]}'"
+                          for col in columns)
+        source = f"read_csv({path}, header = true, quote = '\"', escape = '\"', types = {{{types}}})"
+    elif fmt == 'parquet':
+        source = f"read_parquet({path})"
+    else:
+        require_pyarrow(fmt)
+        view = f"src_{file_name}"
+        conn.connection.driver_connection.register(view, read_arrow(file_name, fmt))
+        source = view
+
+    table = quote_identifier(table_name)
+    try:
+        before = conn.exec_driver_sql(f"SELECT COUNT(*) FROM {table}").scalar()
+        conn.exec_driver_sql(f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {source}")
+        return conn.exec_driver_sql(f"SELECT COUNT(*) FROM {table}").scalar() - before
+    finally:
+        if view is not None:
+            conn.connection.driver_connection.unregister(view)
+
+
+def load_table_sqlite(conn, table_name, file_name, fmt='csv'):
+    """
+    Insert a processed file into a SQLite table from a DataFrame
+
+    Returns:
+        int: Number of rows loaded
+    """
+    df = read_table(file_name, fmt)
+    df.to_sql(table_name, conn, if_exists='append', index=False, chunksize=SQLITE_CHUNK_ROWS)
+    return len(df)
+
+
+def load_tables_embedded(engine, tables, fmt='csv', replace=False, on_done=None):
+    """
+    Load processed tables into an embedded database, one table per transaction
+
+    Args:
+        engine: SQLAlchemy engine of a DuckDB or SQLite database
+        tables: Dict of table name -> processed table name, in load order
+        fmt: Format of the processed files
+        replace: Delete the table's existing rows first
+        on_done: Optional callback(table_name, LoadResult or exception)
+
+    Returns:
+        dict: Table name -> LoadResult, or the exception that stopped it
+    """
+    dialect = engine.dialect.name
+    if dialect == 'duckdb':
+        load_table, strategy = load_table_duckdb, 'duckdb-scan'
+    elif dialect == 'sqlite':
+        load_table, strategy = load_table_sqlite, 'to-sql'
+    else:
+        raise ValueError(f"load_tables_embedded() does not support '{dialect}'; use bulk_load.load_tables")
+
+    results = {}
+    for table_name, file_name in tables.items():
+        start = time.perf_counter()
+        try:
+            with write_lock, engine.begin() as conn:
+                if replace:
+                    conn.exec_driver_sql(f"DELETE FROM {quote_identifier(table_name)}")
+                rows = load_table(conn, table_name, file_name, fmt)
+            results[table_name] = LoadResult(table_name, rows, time.perf_counter() - start, strategy)
+        except Exception as e:
+            results[table_name] = e
+        if on_done is not None:
+            on_done(table_name, results[table_name])
+    return results
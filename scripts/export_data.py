@@ -0,0 +1,214 @@
+"""
+Full Data Export
+Streams the enriched shortages_with_ndc table, or the part of it matching
+some filters, as CSV or Parquet.
+
+Rows are read from a server-side cursor in chunks (see
+database.read_sql_chunks), and every chunk is encoded and handed on
+before the next one is read: CSV text with the header on the first chunk,
+or one Parquet row group per chunk. Memory therefore depends on
+--chunk-rows, not on the size of the export. Filters are pushed down into
+the query's WHERE clause as bound parameters.
+
+Used by the dashboard's export endpoint (scripts/dashboard_app.py) and
+from the command line. Connection settings come from the environment
+(FDA_DB_*; see database.py).
+
+Usage:
+    python scripts/export_data.py -o shortages_with_ndc.csv
+    python scripts/export_data.py --format parquet -o shortages_with_ndc.parquet
+    python scripts/export_data.py --status Current --manufacturer "Pfizer Inc." -o pfizer.csv
+"""
+
+import argparse
+import os
+import sys
+
+import pandas as pd
+from sqlalchemy import text
+
+from database import DEFAULT_CHUNK_ROWS, database_label, get_engine, read_sql_chunks
+from instrumentation import RunReport
+from table_formats import pa, pq, require_pyarrow
+
+EXPORT_TABLE = 'shortages_with_ndc'
+EXPORT_FORMATS = ('csv', 'parquet')
+MEDIA_TYPES = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+# Filters: name (command line option / URL parameter) -> column
+EXPORT_FILTERS = {
+    'status': 'status',
+    'manufacturer': 'company_name',
+    'route': 'route_group',
+    'product_type': 'product_type',
+    'category': 'therapeutic_category',
+}
+
+
+def export_query(filters=None):
+    """
+    Query of an export, with every filter value as a bound parameter
+
+    Args:
+        filters: Dict of EXPORT_FILTERS name -> value (equality; None or '' = no filter)
+
+    Returns:
+        tuple: (SQL text, dict of parameters)
+    """
+    conditions = []
+    params = {}
+    for name, value in (filters or {}).items():
+        if name not in EXPORT_FILTERS:
+            raise ValueError(f"Unknown export filter '{name}'. Choose from: {', '.join(EXPORT_FILTERS)}")
+        if value is None or value == '':
+            continue
+        conditions.append(f"{EXPORT_FILTERS[name]} = :{name}")
+        params[name] = value
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f"SELECT * FROM {EXPORT_TABLE}{where}", params
+
+
+def _columns(engine, sql, params):
+    """Column names of a query's result (for exports with no rows)"""
+    with engine.connect() as conn:
+        return list(conn.execute(text(sql), params).keys())
+
+
+def iter_csv(engine, filters=None, chunk_rows=DEFAULT_CHUNK_ROWS, on_chunk=None):
+    """Yield an export as UTF-8 CSV, one block of bytes per chunk of rows"""
+    sql, params = export_query(filters)
+    header = True
+    for chunk in read_sql_chunks(engine, sql, params, chunk_rows):
+        yield chunk.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+        if on_chunk is not None:
+            on_chunk(len(chunk))
+    if header:
+        # No rows: just the header
+        yield pd.DataFrame(columns=_columns(engine, sql, params)).to_csv(index=False).encode('utf-8')
+
+
+class _DrainableSink:
+    """Write-only file object whose contents are taken out as they are written"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _arrow_schema(table):
+    """Schema for a whole export from its first chunk: columns with no values yet become strings"""
+    fields = [field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in table.schema]
+    return pa.schema(fields)
+
+
+def iter_parquet(engine, filters=None, chunk_rows=DEFAULT_CHUNK_ROWS, on_chunk=None):
+    """Yield an export as a Parquet file, one row group per chunk of rows"""
+    require_pyarrow('parquet')
+    sql, params = export_query(filters)
+    sink = _DrainableSink()
+    writer = None
+    try:
+        for chunk in read_sql_chunks(engine, sql, params, chunk_rows):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                schema = _arrow_schema(table)
+                writer = pq.ParquetWriter(sink, schema)
+            # Later chunks take the first chunk's types (e.g. dates read as strings on SQLite)
+            writer.write_table(table.select(schema.names).cast(schema))
+            yield sink.drain()
+            if on_chunk is not None:
+                on_chunk(len(chunk))
+        if writer is None:
+            # No rows: an empty file with the table's columns
+            columns = _columns(engine, sql, params)
+            writer = pq.ParquetWriter(sink, pa.schema([(column, pa.string()) for column in columns]))
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.drain()
+
+
+def iter_export(engine, fmt='csv', filters=None, chunk_rows=DEFAULT_CHUNK_ROWS, on_chunk=None):
+    """
+    Yield an export as blocks of bytes, for a file or an HTTP response
+
+    Args:
+        engine: SQLAlchemy engine
+        fmt: 'csv' or 'parquet'
+        filters: Dict of EXPORT_FILTERS name -> value
+        chunk_rows: Rows read and encoded at a time
+        on_chunk: Optional callback(rows) after every chunk
+    """
+    if fmt == 'csv':
+        return iter_csv(engine, filters, chunk_rows, on_chunk)
+    if fmt == 'parquet':
+        return iter_parquet(engine, filters, chunk_rows, on_chunk)
+    raise ValueError(f"Unknown export format '{fmt}'. Choose from: {', '.join(EXPORT_FORMATS)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Export {EXPORT_TABLE} as CSV or Parquet")
+    parser.add_argument('-o', '--output', required=True, help="file to write")
+    parser.add_argument('--format', choices=EXPORT_FORMATS,
+                        help="export format (default: from the output file extension, else csv)")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f"rows read and written at a time (default: {DEFAULT_CHUNK_ROWS})")
+    for name, column in EXPORT_FILTERS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, help=f"only rows with this {column}")
+    args = parser.parse_args()
+
+    fmt = args.format or ('parquet' if args.output.endswith('.parquet') else 'csv')
+    filters = {name: getattr(args, name) for name in EXPORT_FILTERS if getattr(args, name) is not None}
+
+    engine = get_engine(pool_size=1, read_only=True)
+    print(f"Exporting {EXPORT_TABLE} from {database_label()} to {args.output} ({fmt})...")
+
+    report = RunReport('export_data', {'format': fmt, 'filters': filters, 'chunk_rows': args.chunk_rows})
+    rows = 0
+
+    def count(chunk_rows):
+        nonlocal rows
+        rows += chunk_rows
+
+    try:
+        with report.stage('export', outputs=[args.output]) as stage:
+            with open(args.output, 'wb') as f:
+                for block in iter_export(engine, fmt, filters, args.chunk_rows, on_chunk=count):
+                    f.write(block)
+            stage.rows_out = rows
+        print(f"  ✓ Exported {rows:,} rows ({os.path.getsize(args.output) / 1024 / 1024:.1f} MB)")
+    except Exception as e:
+        print(f"  ✗ Error exporting {EXPORT_TABLE}: {e}")
+        sys.exit(1)
+    finally:
+        engine.dispose()
+        print(f"Run report: {report.write()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Pipeline Instrumentation
+Measures each pipeline stage and writes a machine-readable run report.
+
+For every stage we record:
+  - wall time and CPU time (user + system of this process and of finished
+    child processes),
+  - peak RSS (the process's resident memory high-water mark at the end of
+    the stage),
+  - bytes in/out (sizes of the stage's input and output files),
+  - rows in/out (set by the stage itself),
+  - any stage-specific extras (e.g. per-table load throughput).
+
+CPU time and peak RSS are per process. When stages run concurrently in
+one process (e.g. the parallel loads in run_pipeline.py), their CPU times
+overlap, and peak RSS is the process high-water mark.
+
+Each run is written to data/reports/<run>-<timestamp>.json. One summary
+line per run is appended to data/reports/history.jsonl, so regressions show
+up across runs (e.g. with pandas.read_json(..., lines=True)).
+
+Example:
+    report = RunReport('process_data')
+    with report.stage('process_ndc', inputs=[NDC_FILE]) as stage:
+        counts = process_ndc(...)
+        stage.rows_in = counts['records']
+        stage.outputs = [table_path('ndc_core')]
+    report.write()
+"""
+
+import json
+import os
+import platform
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+REPORT_DIR = os.path.join('data', 'reports')
+HISTORY_FILE = os.path.join(REPORT_DIR, 'history.jsonl')
+
+
+def peak_rss_mb():
+    """Return this process's peak resident memory in MB (None if unsupported)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def cpu_seconds():
+    """User + system CPU time of this process and its finished children"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def total_bytes(paths):
+    """Total size of the files that exist among paths"""
+    return sum(os.path.getsize(path) for path in paths if path and os.path.isfile(path))
+
+
+class StageMetrics:
+    """Measurements of one stage (fill rows_in/rows_out/outputs/extra while it runs)"""
+
+    def __init__(self, name, inputs=(), outputs=()):
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.status = 'ok'
+        self.error = None
+        self.started_at = None
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.peak_rss_mb = None
+        self.bytes_in = None
+        self.bytes_out = None
+        self.rows_in = None
+        self.rows_out = None
+        self.extra = {}
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'status': self.status,
+            'error': self.error,
+            'started_at': self.started_at,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'peak_rss_mb': self.peak_rss_mb,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'extra': self.extra,
+        }
+
+    def __str__(self):
+        parts = [f"{self.wall_seconds:.2f}s wall", f"{self.cpu_seconds:.2f}s CPU"]
+        if self.peak_rss_mb is not None:
+            parts.append(f"{self.peak_rss_mb:.0f} MB peak RSS")
+        if self.rows_out is not None:
+            parts.append(f"{self.rows_out:,} rows out")
+        if self.bytes_out:
+            parts.append(f"{self.bytes_out / 1024 / 1024:.1f} MB out")
+        return f"{self.name} [{self.status}]: " + ", ".join(parts)
+
+
+@contextmanager
+def measure(name, inputs=(), outputs=()):
+    """
+    Measure the enclosed block as one stage
+
+    bytes_in is taken from the input files when the stage starts and
+    bytes_out from the output files when it ends (outputs may be assigned
+    while the stage runs). An exception marks the stage as failed and is
+    re-raised.
+    """
+    metrics = StageMetrics(name, inputs, outputs)
+    metrics.started_at = datetime.now().isoformat(timespec='seconds')
+    metrics.bytes_in = total_bytes(metrics.inputs)
+    wall_start = time.perf_counter()
+    cpu_start = cpu_seconds()
+    try:
+        yield metrics
+    except BaseException as e:
+        metrics.status = 'failed'
+        metrics.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        metrics.wall_seconds = round(time.perf_counter() - wall_start, 4)
+        metrics.cpu_seconds = round(cpu_seconds() - cpu_start, 4)
+        peak = peak_rss_mb()
+        metrics.peak_rss_mb = None if peak is None else round(peak, 1)
+        metrics.bytes_out = total_bytes(metrics.outputs)
+
+
+class RunReport:
+    """Collects the stage metrics of one run and writes the report and history"""
+
+    def __init__(self, run_name, params=None):
+        self.run_name = run_name
+        self.params = params or {}
+        self.extra = {}  # Run-level details, e.g. connection pool metrics
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        self._stages = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, inputs=(), outputs=()):
+        """measure() a stage and add it to this report"""
+        metrics = None
+        try:
+            with measure(name, inputs, outputs) as metrics:
+                yield metrics
+        finally:
+            if metrics is not None:
+                self.add(metrics)
+
+    def add(self, metrics):
+        """Add a StageMetrics (or its to_dict(), e.g. from a worker process)"""
+        record = metrics.to_dict() if isinstance(metrics, StageMetrics) else dict(metrics)
+        with self._lock:
+            self._stages.append(record)
+
+    def add_status(self, name, status, wall_seconds=0.0, detail=None):
+        """Record a stage that did not run (e.g. skipped because its inputs are unchanged)"""
+        metrics = StageMetrics(name)
+        metrics.status = status
+        metrics.wall_seconds = round(wall_seconds, 4)
+        if detail is not None:
+            metrics.extra['detail'] = str(detail)
+        self.add(metrics)
+
+    @property
+    def stages(self):
+        with self._lock:
+            return list(self._stages)
+
+    def to_dict(self):
+        stages = self.stages
+        failed = [stage['name'] for stage in stages if stage['status'] == 'failed']
+        return {
+            'run': self.run_name,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'wall_seconds': round(time.perf_counter() - self._start, 4),
+            'status': 'failed' if failed else 'ok',
+            'host': socket.gethostname(),
+            'python': platform.python_version(),
+            'params': self.params,
+            'stages': stages,
+            'extra': self.extra,
+        }
+
+    def write(self, report_dir=REPORT_DIR, history_file=HISTORY_FILE):
+        """
+        Write the full report as JSON and append a summary line to the history
+
+        Returns:
+            str: Path of the report file
+        """
+        report = self.to_dict()
+        os.makedirs(report_dir, exist_ok=True)
+        stamp = self.started_at.strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(report_dir, f"{self.run_name}-{stamp}.json")
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+
+        summary = {key: report[key] for key in ('run', 'started_at', 'wall_seconds', 'status', 'params')}
+        summary['report'] = path
+        summary['stages'] = {
+            stage['name']: {key: stage[key] for key in
+                            ('status', 'wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'rows_out')}
+            for stage in report['stages']
+        }
+        history_dir = os.path.dirname(history_file)
+        if history_dir:
+            os.makedirs(history_dir, exist_ok=True)
+        with open(history_file, 'a') as f:
+            f.write(json.dumps(summary, default=str) + '\n')
+        return path
+
+
+def measured_call(name, func, args=(), kwargs=None, inputs=(), outputs=()):
+    """
+    Run func(*args, **kwargs) under measure() and return (result, metrics dict)
+
+    Module-level so it can run in a worker process; the metrics then describe
+    the worker. If the result is a dict with 'rows_in' / 'rows_out' keys,
+    those become the stage's row counts.
+    """
+    with measure(name, inputs, outputs) as metrics:
+        result = func(*args, **(kwargs or {}))
+        if isinstance(result, dict):
+            metrics.rows_in = result.get('rows_in', metrics.rows_in)
+            metrics.rows_out = result.get('rows_out', metrics.rows_out)
+    return result, metrics.to_dict()
@@ -1,113 +1,191 @@
 """
 Load Processed Data to MySQL
-Loads cleaned CSV files into MySQL database tables
+Loads the processed tables (CSV, Parquet or Feather) into MySQL database tables
+
+Tables are bulk loaded (see bulk_load.py) with LOAD DATA LOCAL INFILE by
+default, falling back to multi-row INSERT batches when the server does not
+allow local infile. Tables, and chunks of large tables, load in parallel on
+--workers pooled connections; raw_ndc always finishes before
+raw_ndc_packaging starts. Rows/sec is reported for every table.
+
+--mode delta refreshes existing tables instead of appending (see
+delta_load.py): only new, changed and removed rows are written, so the
+script can be rerun without recreating the schema first.
+
+Connection settings come from the environment (FDA_DB_USER,
+FDA_DB_PASSWORD, ...; see database.py). With FDA_DB_BACKEND=duckdb (or
+sqlite) the tables are loaded into the embedded database file instead (see
+embedded_load.py): existing rows are replaced rather than appended to, and
+--mode delta and the MySQL load options do not apply.
+
+Usage:
+    python scripts/load_to_mysql.py
+    python scripts/load_to_mysql.py --format parquet
+    python scripts/load_to_mysql.py --strategy insert --batch-size 10000
+    python scripts/load_to_mysql.py --workers 8 --chunk-rows 25000
+    python scripts/load_to_mysql.py --mode delta
+    FDA_DB_BACKEND=duckdb python scripts/load_to_mysql.py --format parquet
 """
 
 import pandas as pd
-from sqlalchemy import create_engine
+import argparse
 import os
+import sys
+
+from bulk_load import (DEFAULT_BATCH_SIZE, DEFAULT_CHUNK_ROWS, DEFAULT_STRATEGY,
+                       DEFAULT_WORKERS, STRATEGIES, load_tables)
+from database import DB_BACKEND, DB_NAME, database_label, get_engine, pool_metrics
+from delta_load import load_delta, record_reload
+from embedded_load import load_tables_embedded
+from instrumentation import RunReport
+from table_formats import FORMATS, TABLE_FILES, table_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the processed FDA tables into MySQL")
+    parser.add_argument('--format', choices=FORMATS, default='csv',
+                        help="file format written by process_data.py (default: csv)")
+    parser.add_argument('--mode', choices=('append', 'delta'), default='append',
+                        help="append to the tables, or apply only the changes (default: append)")
+    parser.add_argument('--strategy', choices=STRATEGIES, default=DEFAULT_STRATEGY,
+                        help=f"bulk load strategy (default: {DEFAULT_STRATEGY})")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"rows per INSERT for the 'insert' strategy (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"chunks loaded at the same time (default: {DEFAULT_WORKERS})")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f"rows per concurrently loaded chunk, 0 = whole table (default: {DEFAULT_CHUNK_ROWS})")
+    args = parser.parse_args()
+
+    print(f"Starting data load to {database_label()}...")
+
+    if DB_BACKEND != 'mysql' and args.mode == 'delta':
+        print(f"✗ --mode delta is only supported on MySQL; the {DB_BACKEND} backend reloads tables in full")
+        sys.exit(1)
 
-print("Starting data load to MySQL...")
-
-# ============================================
-# Database Connection Configuration
-# ============================================
-
-# MySQL connection parameters
-# Update these with your actual MySQL credentials
-DB_USER = 'root'  # Change if different
-DB_PASSWORD = '5791216sS$'  # CHANGE THIS to your MySQL password
-DB_HOST = 'localhost'
-DB_PORT = '3306'
-DB_NAME = 'fda_shortage_db'
-
-# Create connection string
-connection_string = f'mysql+mysqlconnector://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
-
-try:
-    # Create database engine
-    engine = create_engine(connection_string)
-    print(f"✓ Connected to MySQL database: {DB_NAME}")
-    
-except Exception as e:
-    print(f"✗ Error connecting to MySQL: {e}")
-    print("\nTroubleshooting:")
-    print("1. Make sure MySQL is running")
-    print("2. Update DB_PASSWORD in this script")
-    print("3. Ensure database 'fda_shortage_db' exists (run 01_create_tables.sql first)")
-    exit(1)
-
-# ============================================
-# Load CSV Files into MySQL Tables
-# ============================================
-
-# Define CSV files and their corresponding MySQL tables
-csv_table_mapping = {
-    'data/ndc_core.csv': 'raw_ndc',
-    'data/ndc_packaging.csv': 'raw_ndc_packaging',
-    'data/drug_shortages_core.csv': 'raw_drug_shortages',
-    'data/shortage_contacts.csv': 'shortage_contacts'
-}
-
-# Load each CSV into its table
-for csv_file, table_name in csv_table_mapping.items():
-    
-    print(f"\nLoading {csv_file} into {table_name}...")
-    
     try:
-        # Check if CSV file exists
-        if not os.path.exists(csv_file):
-            print(f"  ⚠ Warning: {csv_file} not found. Skipping.")
-            print(f"     Run process_data.py first to create this file.")
+        # Create database engine
+        # allow_local_infile lets the client send files for LOAD DATA LOCAL INFILE.
+        # One pooled connection per worker, plus one for the verification queries.
+        engine = get_engine(pool_size=args.workers + 1, max_overflow=0, local_infile=True)
+        print(f"✓ Connected to {database_label()}")
+
+    except Exception as e:
+        print(f"✗ Error connecting to {database_label()}: {e}")
+        print("\nTroubleshooting:")
+        print("1. Make sure MySQL is running")
+        print("2. Set FDA_DB_PASSWORD (and FDA_DB_USER etc.; see scripts/database.py)")
+        print(f"3. Ensure database '{DB_NAME}' exists with its tables "
+              f"(python run_pipeline.py --create-schema, or run 01_create_tables.sql first)")
+        sys.exit(1)
+
+    # ============================================
+    # Load Processed Files into MySQL Tables
+    # ============================================
+
+    # Only load tables whose processed file exists
+    tables = {}
+    for table_name, file_name in TABLE_FILES.items():
+        data_file = table_path(file_name, args.format)
+        if not os.path.exists(data_file):
+            print(f"\n  ⚠ Warning: {data_file} not found. Skipping {table_name}.")
+            print(f"     Run process_data.py --format {args.format} first to create this file.")
             continue
-        
-        # Read CSV file
-        df = pd.read_csv(csv_file)
-        print(f"  - Read {len(df)} rows from CSV")
-        
-        # Load into MySQL
-        # if_exists='append' will add to existing data
-        df.to_sql(
-            name=table_name,
-            con=engine,
-            if_exists='append',
-            index=False
-        )
-        
-        print(f"  ✓ Loaded {len(df)} rows into {table_name}")
-        
+        tables[table_name] = file_name
+
+    if DB_BACKEND == 'mysql':
+        print(f"\nLoading {len(tables)} tables with {args.workers} workers ({args.strategy})...")
+    else:
+        print(f"\nLoading {len(tables)} tables into {DB_BACKEND} (replacing existing rows)...")
+
+    report = RunReport('load_to_mysql', {'format': args.format, 'mode': args.mode, 'strategy': args.strategy,
+                                         'workers': args.workers, 'chunk_rows': args.chunk_rows})
+    input_files = [table_path(file_name, args.format) for file_name in tables.values()]
+
+    def print_result(table_name, outcome):
+        if isinstance(outcome, Exception):
+            print(f"  ✗ Error loading {table_name}: {outcome}")
+        else:
+            print(f"  ✓ Loaded {outcome.rows} rows into {table_name} "
+                  f"in {outcome.seconds:.2f}s ({outcome.rows_per_second:,.0f} rows/sec, {outcome.strategy})")
+
+    if args.mode == 'delta':
+        # Stage every table, then apply only the differences
+        try:
+            with report.stage('load_delta', inputs=input_files) as stage:
+                deltas = load_delta(engine, tables, args.format, args.strategy, args.batch_size,
+                                    args.workers, args.chunk_rows, on_done=print_result)
+                stage.rows_in = sum(delta.staged for delta in deltas.values())
+                stage.rows_out = sum(delta.inserted + delta.updated + delta.deleted for delta in deltas.values())
+                stage.extra['tables'] = {name: vars(delta) for name, delta in deltas.items()}
+                stage.extra['connections'] = pool_metrics(engine)
+        except Exception as e:
+            print(f"  ✗ Error applying delta: {e}")
+            deltas = {}
+
+        if deltas:
+            print("\nChanges applied:")
+            for delta in deltas.values():
+                print(f"  {delta}")
+    else:
+        # Load every table (appends to existing data on MySQL, replaces it on an embedded backend)
+        with report.stage('load', inputs=input_files) as stage:
+            if DB_BACKEND == 'mysql':
+                results = load_tables(engine, tables, args.format, args.strategy, args.batch_size,
+                                      args.workers, args.chunk_rows, on_done=print_result)
+            else:
+                results = load_tables_embedded(engine, tables, args.format, replace=True, on_done=print_result)
+            loaded = [outcome for outcome in results.values() if not isinstance(outcome, Exception)]
+            stage.rows_out = sum(result.rows for result in loaded)
+            stage.extra['tables'] = {
+                result.table_name: {'rows': result.rows, 'seconds': round(result.seconds, 4),
+                                    'rows_per_second': round(result.rows_per_second), 'strategy': result.strategy}
+                for result in loaded
+            }
+            stage.extra['connections'] = pool_metrics(engine)
+            if len(loaded) < len(results):
+                stage.status = 'failed'
+                stage.error = '; '.join(f"{name}: {outcome}" for name, outcome in results.items()
+                                        if isinstance(outcome, Exception))
+        try:
+            record_reload(engine, [result.table_name for result in loaded])
+        except Exception as e:
+            print(f"  ⚠ Could not record the load in pipeline_change_log: {e}")
+
+        if loaded:
+            print("\nLoad throughput:")
+            for result in loaded:
+                print(f"  {result}")
+
+    # ============================================
+    # Verify Data Load
+    # ============================================
+
+    print("\n" + "="*50)
+    print("Data Load Verification")
+    print("="*50)
+
+    try:
+        # Check row counts in each table
+        for table_name in TABLE_FILES:
+            query = f"SELECT COUNT(*) as count FROM {table_name}"
+            result = pd.read_sql(query, engine)
+            count = result['count'][0]
+            print(f"{table_name}: {count} rows")
+
+        print("\n✓ All data loaded successfully!")
+        print("\nNext steps:")
+        print("1. Run scripts/transform_data.py (or sql/02_transformations.sql) to create enriched tables")
+        print("2. Run sql/03_analysis_queries.sql to analyze the data")
+
     except Exception as e:
-        print(f"  ✗ Error loading {csv_file}: {e}")
-        print(f"  Full error details:")
-        import traceback
-        traceback.print_exc()
-        continue
-
-# ============================================
-# Verify Data Load
-# ============================================
-
-print("\n" + "="*50)
-print("Data Load Verification")
-print("="*50)
-
-try:
-    # Check row counts in each table
-    for table_name in csv_table_mapping.values():
-        query = f"SELECT COUNT(*) as count FROM {table_name}"
-        result = pd.read_sql(query, engine)
-        count = result['count'][0]
-        print(f"{table_name}: {count} rows")
-    
-    print("\n✓ All data loaded successfully!")
-    print("\nNext steps:")
-    print("1. Run sql/02_transformations.sql to create enriched tables")
-    print("2. Run sql/03_analysis_queries.sql to analyze the data")
-    
-except Exception as e:
-    print(f"\n✗ Error during verification: {e}")
-
-finally:
-    # Close the database connection
-    engine.dispose()
-    print("\nDatabase connection closed.")
+        print(f"\n✗ Error during verification: {e}")
+
+    finally:
+        # Close the database connection
+        engine.dispose()
+        print("\nDatabase connection closed.")
+        print(f"Run report: {report.write()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Shortage to NDC Matching
+Matches every drug shortage record to the NDC catalog and writes the
+shortage_ndc_matches table, which sql/02_transformations.sql joins through
+instead of comparing package_ndc strings.
+
+The shortage data and the NDC directory do not always write the same
+package NDC the same way: the three 10-digit layouts (4-4-2, 5-3-2 and
+5-4-1) appear hyphenated or run together, and leading zeros get dropped.
+Each shortage is matched by the first of these that finds a package or
+product:
+
+  1. exact:      the same package_ndc string
+  2. normalized: the same 11-digit (5-4-2) NDC. The catalog packages are
+                 canonicalized once into a hash index (a pandas Index), so
+                 a lookup costs the same however large the catalog is. A
+                 10-digit NDC without hyphens matches when exactly one of
+                 the three 11-digit NDCs it can stand for is in the index.
+  3. fuzzy:      for the rest, a product of the same company whose generic
+                 name is covered by the shortage's generic name. Matching
+                 is blocked: only labelers sharing a distinctive name token
+                 with the company are scored, and of their products only
+                 those whose generic name starts with the same word. A
+                 fuzzy match names a product, not a package.
+
+Every step is a hash lookup or a join, never a comparison of each shortage
+with each catalog entry, so the full catalog is matched in seconds.
+Shortages that match nothing are left out of the table; Query 7 in
+sql/03_analysis_queries.sql reports them.
+
+Runs after both processing stages: process_data.py runs it last, and
+run_pipeline.py as the match_ndc task.
+
+Usage:
+    python scripts/ndc_matching.py
+    python scripts/ndc_matching.py --format parquet
+"""
+
+import argparse
+import os
+import re
+import sys
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import RunReport, measured_call
+from table_formats import FORMATS, TABLE_COLUMNS, read_table, table_path, write_table
+
+MATCH_TABLE = 'shortage_ndc_matches'
+MATCH_COLUMNS = list(TABLE_COLUMNS[MATCH_TABLE])
+MATCH_METHODS = ('exact', 'normalized', 'fuzzy')
+
+# Processed tables read by the matching
+MATCH_INPUTS = ('ndc_core', 'ndc_packaging', 'drug_shortages_core')
+
+# Fuzzy matches need this share of the shorter company name's tokens in
+# common, and this share of the product's generic name tokens in the
+# shortage's generic name (which often adds the dosage form)
+MIN_COMPANY_SCORE = 0.6
+MIN_GENERIC_SCORE = 0.5
+
+# A company name token found in more labeler names than this is too
+# common to block on (e.g. PHARMA, LABORATORIES in a long name)
+MAX_BLOCK_LABELERS = 500
+
+# Words that only say what kind of company it is
+COMPANY_STOP_WORDS = frozenset({
+    'AG', 'AND', 'CO', 'COMPANY', 'CORP', 'CORPORATION', 'DIV', 'DIVISION', 'GMBH', 'INC',
+    'INCORPORATED', 'LABORATORIES', 'LABS', 'LLC', 'LP', 'LTD', 'LIMITED', 'OF', 'PHARMA',
+    'PHARMACEUTICAL', 'PHARMACEUTICALS', 'PLC', 'SA', 'THE', 'US', 'USA',
+})
+GENERIC_STOP_WORDS = frozenset({'AND', 'FOR', 'IN', 'OF', 'USP', 'WITH'})
+
+_HYPHENATED_NDC = r'^(\d{1,5})-(\d{1,4})-(\d{1,2})$'
+_WORD = re.compile(r'[A-Z0-9]+')
+
+
+# ============================================
+# NDC Normalization
+# ============================================
+
+def canonical_ndcs(values):
+    """
+    11-digit (5-4-2) form of each package NDC, e.g. '0409-4888-02' -> '00409488802'
+
+    Every segment of a hyphenated NDC is padded with leading zeros, which
+    covers the 4-4-2, 5-3-2 and 5-4-1 layouts and dropped zeros alike; 11
+    digits without hyphens are kept. Anything else, including 10 digits
+    without hyphens (whose layout is unknown, see ndc10_forms), is missing.
+
+    Returns:
+        Series: Canonical NDC strings with the same index
+    """
+    text = pd.Series(values, dtype=object).str.strip()
+    segments = text.str.extract(_HYPHENATED_NDC)
+    hyphenated = segments[0].str.zfill(5) + segments[1].str.zfill(4) + segments[2].str.zfill(2)
+    return hyphenated.fillna(text.where(text.str.fullmatch(r'\d{11}', na=False)))
+
+
+def ndc10_forms(digits):
+    """The three 11-digit NDCs that 10 digits without hyphens can stand for (4-4-2, 5-3-2, 5-4-1)"""
+    digits = pd.Series(digits, dtype=object)
+    return ['0' + digits,
+            digits.str[:5] + '0' + digits.str[5:],
+            digits.str[:9] + '0' + digits.str[9:]]
+
+
+class NdcIndex:
+    """Hash indexes of the catalog packages by package_ndc and by canonical NDC"""
+
+    def __init__(self, package_ndcs):
+        package_ndcs = pd.Series(package_ndcs, dtype=object).reset_index(drop=True)
+        self.exact = self._build(package_ndcs)
+        self.canonical = self._build(canonical_ndcs(package_ndcs))
+
+    @staticmethod
+    def _build(keys):
+        # The first package wins when two share a key
+        keep = (keys.notna() & ~keys.duplicated()).to_numpy()
+        return pd.Index(keys[keep].to_numpy()), np.flatnonzero(keep)
+
+    @staticmethod
+    def _find(index, keys):
+        hash_index, positions = index
+        found = hash_index.get_indexer(pd.Index(pd.Series(keys, dtype=object).to_numpy()))
+        return np.where(found >= 0, positions[found], -1)
+
+    def find_exact(self, package_ndcs):
+        """Catalog position of each package_ndc string (-1 if not found)"""
+        return self._find(self.exact, package_ndcs)
+
+    def find(self, ndc11s):
+        """Catalog position of each canonical NDC (-1 if not found or missing)"""
+        return self._find(self.canonical, ndc11s)
+
+
+# ============================================
+# Fuzzy Matching
+# ============================================
+
+def name_words(name, stop_words=frozenset()):
+    """Upper-cased words of a name, in order and without stop words"""
+    if not isinstance(name, str):
+        return ()
+    return tuple(word for word in _WORD.findall(name.upper()) if word not in stop_words)
+
+
+def company_words(name):
+    """Distinctive words of a company name (all of them if only stop words are left)"""
+    return frozenset(name_words(name, COMPANY_STOP_WORDS) or name_words(name))
+
+
+def labeler_candidates(words, postings):
+    """
+    Labelers sharing a distinctive word with a company name
+
+    Blocks on the words found in at most MAX_BLOCK_LABELERS labeler names,
+    or on the rarest word if all of them are more common.
+    """
+    ranked = sorted(words, key=lambda word: len(postings.get(word, ())))
+    rare = [word for word in ranked if len(postings.get(word, ())) <= MAX_BLOCK_LABELERS] or ranked[:1]
+    return set().union(*(postings.get(word, ()) for word in rare))
+
+
+def fuzzy_matches(shortages, products):
+    """
+    Best product of each shortage by company and generic name
+
+    A candidate product needs a labeler scoring at least MIN_COMPANY_SCORE
+    (share of the shorter name's words in common) and a generic name
+    starting with the shortage's first generic word and scoring at least
+    MIN_GENERIC_SCORE (share of its words in the shortage's generic name).
+    The best candidate has the highest average of both; ties go to the
+    lowest product_ndc.
+
+    Args:
+        shortages: DataFrame with generic_name, company_name
+        products: DataFrame with product_ndc, generic_name, labeler_name
+
+    Returns:
+        DataFrame: row (position in shortages), product_ndc, score (0-100)
+    """
+    empty = pd.DataFrame({'row': pd.Series(dtype='int64'), 'product_ndc': pd.Series(dtype=object),
+                          'score': pd.Series(dtype='int64')})
+    shortage_generics = [name_words(name, GENERIC_STOP_WORDS) for name in shortages['generic_name']]
+    blocks = {words[0] for words in shortage_generics if words}
+    if not blocks:
+        return empty
+
+    # Products whose generic name starts with a wanted word, worked out once per distinct name
+    generic_codes, generic_names = pd.factorize(products['generic_name'])
+    generic_words = [name_words(name, GENERIC_STOP_WORDS) for name in generic_names]
+    generic_blocks = np.array([words[0] if words else None for words in generic_words], dtype=object)
+    wanted = np.append(pd.Series(generic_blocks, dtype=object).isin(blocks).to_numpy(), False)
+    rows = np.flatnonzero(wanted[generic_codes])  # code -1 (no name) picks the trailing False
+    candidates = pd.DataFrame({
+        'product_ndc': products['product_ndc'].to_numpy()[rows],
+        'generic': generic_codes[rows],
+        'block': generic_blocks[generic_codes[rows]],
+    })
+
+    # Their labelers, indexed by company name word
+    labeler_codes, labeler_names = pd.factorize(products['labeler_name'].to_numpy()[rows])
+    candidates['labeler'] = labeler_codes
+    labeler_words = [company_words(name) for name in labeler_names]
+    postings = defaultdict(list)
+    for code, words in enumerate(labeler_words):
+        for word in words:
+            postings[word].append(code)
+
+    labelers_of = {}
+    pairs = []
+    for row, (company, generic) in enumerate(zip(shortages['company_name'], shortage_generics)):
+        if not generic:
+            continue
+        if company not in labelers_of:
+            words = company_words(company)
+            labelers_of[company] = []
+            for code in labeler_candidates(words, postings):
+                score = len(words & labeler_words[code]) / min(len(words), len(labeler_words[code]))
+                if score >= MIN_COMPANY_SCORE:
+                    labelers_of[company].append((code, score))
+        pairs.extend((row, code, generic[0], score) for code, score in labelers_of[company])
+    if not pairs:
+        return empty
+
+    joined = pd.DataFrame(pairs, columns=['row', 'labeler', 'block', 'company_score']).merge(
+        candidates, on=['labeler', 'block'])
+    distinct = joined[['row', 'generic']].drop_duplicates()
+    distinct['generic_score'] = [
+        len(set(generic_words[code]) & set(shortage_generics[row])) / len(generic_words[code])
+        for row, code in zip(distinct['row'], distinct['generic'])
+    ]
+    joined = joined.merge(distinct, on=['row', 'generic'])
+    joined = joined[joined['generic_score'] >= MIN_GENERIC_SCORE]
+    if joined.empty:
+        return empty
+
+    joined['score'] = ((joined['company_score'] + joined['generic_score']) * 50).round().astype('int64')
+    best = joined.sort_values(['row', 'score', 'product_ndc'], ascending=[True, False, True])
+    return best.drop_duplicates('row')[['row', 'product_ndc', 'score']].reset_index(drop=True)
+
+
+# ============================================
+# Matching
+# ============================================
+
+def match_shortages(shortages, packaging, products):
+    """
+    Match shortage records to the NDC catalog (see the module docstring)
+
+    Args:
+        shortages: DataFrame with package_ndc, generic_name, company_name
+        packaging: DataFrame with package_ndc, product_ndc
+        products: DataFrame with product_ndc, generic_name, labeler_name
+
+    Returns:
+        DataFrame: One row per matched shortage package_ndc, with MATCH_COLUMNS
+    """
+    shortages = shortages[shortages['package_ndc'].notna()].drop_duplicates('package_ndc').reset_index(drop=True)
+    keys = pd.Series(shortages['package_ndc'], dtype=object)
+    ndc11 = canonical_ndcs(keys).to_numpy(dtype=object, copy=True)
+    index = NdcIndex(packaging['package_ndc'])
+
+    position = index.find_exact(keys)
+    method = np.where(position >= 0, 'exact', None).astype(object)
+
+    todo = position < 0
+    position[todo] = index.find(ndc11[todo])
+
+    # 10 digits without hyphens: whichever layout is in the catalog, if only one is
+    ten = np.flatnonzero((position < 0) & keys.str.fullmatch(r'\d{10}', na=False).to_numpy())
+    if len(ten):
+        forms = ndc10_forms(keys.iloc[ten])
+        found = np.stack([index.find(form) for form in forms])
+        unique = (found >= 0).sum(axis=0) == 1
+        layout = found.argmax(axis=0)
+        position[ten[unique]] = found.max(axis=0)[unique]
+        ndc11[ten[unique]] = [forms[k].iloc[i] for i, k in zip(np.flatnonzero(unique), layout[unique])]
+    method[(position >= 0) & pd.isna(method)] = 'normalized'
+
+    matched = position >= 0
+    matches = pd.DataFrame({
+        'package_ndc': keys,
+        'ndc11': ndc11,
+        'matched_package_ndc': None,
+        'product_ndc': None,
+        'match_method': method,
+        'match_score': pd.array(np.where(matched, 100, 0), dtype='Int64'),
+    }, columns=MATCH_COLUMNS)
+    matches.loc[matched, 'matched_package_ndc'] = packaging['package_ndc'].to_numpy()[position[matched]]
+    matches.loc[matched, 'product_ndc'] = packaging['product_ndc'].to_numpy()[position[matched]]
+
+    # Company and generic name for the rest
+    rest = np.flatnonzero(~matched)
+    fuzzy = fuzzy_matches(shortages.iloc[rest], products)
+    fuzzy_rows = rest[fuzzy['row'].to_numpy()]
+    matches.loc[fuzzy_rows, 'product_ndc'] = fuzzy['product_ndc'].to_numpy()
+    matches.loc[fuzzy_rows, 'match_method'] = 'fuzzy'
+    matches.loc[fuzzy_rows, 'match_score'] = fuzzy['score'].to_numpy()
+
+    return matches[matches['match_method'].notna()].reset_index(drop=True)
+
+
+def run_matching(fmt='csv'):
+    """
+    Match the processed shortages to the processed NDC tables and write shortage_ndc_matches
+
+    Returns:
+        dict: {'rows_in': shortages, 'rows_out': matches, 'tables': {table: rows}, 'methods': {method: rows}}
+    """
+    shortages = read_table('drug_shortages_core', fmt, columns=['package_ndc', 'generic_name', 'company_name'])
+    packaging = read_table('ndc_packaging', fmt, columns=['package_ndc', 'product_ndc'])
+    products = read_table('ndc_core', fmt, columns=['product_ndc', 'generic_name', 'labeler_name'])
+
+    matches = match_shortages(shortages, packaging, products)
+    write_table(matches, MATCH_TABLE, fmt)
+
+    methods = {method: int((matches['match_method'] == method).sum()) for method in MATCH_METHODS}
+    print(f"   ✓ Created {os.path.basename(table_path(MATCH_TABLE, fmt))} "
+          f"({len(matches)} of {len(shortages)} shortages matched: "
+          f"{', '.join(f'{rows} {method}' for method, rows in methods.items())})")
+    return {'rows_in': len(shortages), 'rows_out': len(matches), 'tables': {MATCH_TABLE: len(matches)},
+            'methods': methods}
+
+
+def run_matching_measured(fmt='csv'):
+    """
+    run_matching() under instrumentation.measure(), e.g. in a worker process
+
+    Returns:
+        tuple: (matching result, stage metrics as a dict)
+    """
+    return measured_call('match_ndc', run_matching, (fmt,),
+                         inputs=[table_path(name, fmt) for name in MATCH_INPUTS],
+                         outputs=[table_path(MATCH_TABLE, fmt)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Match the drug shortages to the NDC catalog")
+    parser.add_argument('--format', choices=FORMATS, default='csv',
+                        help="file format of the processed tables (default: csv)")
+    args = parser.parse_args()
+
+    print("Matching shortage NDCs to the NDC catalog...")
+    report = RunReport('ndc_matching', {'format': args.format})
+    try:
+        report.add(run_matching_measured(args.format)[1])
+    except Exception as e:
+        print(f"   ✗ Error matching shortage NDCs: {e}")
+        report.add_status('match_ndc', 'failed', detail=e)
+        sys.exit(1)
+    finally:
+        print(f"Run report: {report.write()}")
+
+
+if __name__ == "__main__":
+    main()
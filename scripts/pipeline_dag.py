@@ -0,0 +1,252 @@
+"""
+Pipeline Task Graph
+Runs pipeline tasks in dependency order, independent tasks in parallel, and
+skips tasks whose inputs have not changed since their last successful run.
+
+A task's fingerprint is a SHA-256 over:
+  - its parameters (e.g. the intermediate file format),
+  - the content of its input files (data files and the code that reads them),
+  - the fingerprints of the tasks it depends on.
+
+Fingerprints of successful runs are kept in a small state file
+(data/.pipeline_state.json). A task is skipped when its fingerprint matches
+the stored one and its output files still exist. File hashes are cached by
+(size, mtime), so an unchanged rerun reads stat() only, not file contents.
+
+Tasks without declared inputs (e.g. downloads, whose input is a remote URL)
+always run; their fingerprint is taken from the files they produce, so
+downstream tasks still skip when a download brought nothing new.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+STATE_FILE = os.path.join('data', '.pipeline_state.json')
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class Task:
+    """
+    One node of the pipeline graph
+
+    Args:
+        name: Unique task name
+        func: Callable run with no arguments; its return value is reported
+        deps: Names of tasks that must succeed first
+        inputs: Files whose content determines the task's fingerprint, or
+            None for a task that always runs
+        outputs: Files the task produces (a skip requires them to exist)
+        params: JSON-serializable settings that also change the output
+    """
+
+    def __init__(self, name, func, deps=(), inputs=(), outputs=(), params=None):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.inputs = None if inputs is None else list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+
+
+class TaskResult:
+    """Outcome of one task in a run"""
+
+    def __init__(self, name, status, seconds=0.0, detail=None):
+        self.name = name
+        self.status = status  # 'ran', 'skipped', 'failed' or 'blocked'
+        self.seconds = seconds
+        self.detail = detail
+
+    def __str__(self):
+        text = f"{self.name}: {self.status} ({self.seconds:.2f}s)"
+        return f"{text} - {self.detail}" if self.detail is not None else text
+
+
+# ============================================
+# Fingerprints
+# ============================================
+
+class FingerprintStore:
+    """Task fingerprints and cached file hashes, persisted as JSON"""
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        self.tasks = state.get('tasks', {})
+        self.files = state.get('files', {})
+
+    def file_hash(self, path):
+        """SHA-256 of a file, or None if it does not exist (cached by size and mtime)"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = [stat.st_size, stat.st_mtime_ns]
+        with self._lock:
+            cached = self.files.get(path)
+        if cached and cached[:2] == key:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        with self._lock:
+            self.files[path] = key + [digest.hexdigest()]
+        return digest.hexdigest()
+
+    def fingerprint(self, params, files, dep_fingerprints):
+        """Combine parameters, file contents and upstream fingerprints into one hash"""
+        payload = {
+            'params': params,
+            'files': {path: self.file_hash(path) for path in files},
+            'deps': dep_fingerprints,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, task_name):
+        with self._lock:
+            return self.tasks.get(task_name, {}).get('fingerprint')
+
+    def record(self, task_name, fingerprint):
+        with self._lock:
+            self.tasks[task_name] = {
+                'fingerprint': fingerprint,
+                'completed_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            }
+            self._save()
+
+    def forget(self, task_names):
+        """Drop stored fingerprints so these tasks run next time"""
+        with self._lock:
+            for name in task_names:
+                self.tasks.pop(name, None)
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_file = self.path + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'tasks': self.tasks, 'files': self.files}, f, indent=2)
+        os.replace(tmp_file, self.path)
+
+
+# ============================================
+# Runner
+# ============================================
+
+def check_graph(tasks):
+    """Raise ValueError for unknown dependencies or cycles"""
+    by_name = {task.name: task for task in tasks}
+    for task in tasks:
+        missing = [dep for dep in task.deps if dep not in by_name]
+        if missing:
+            raise ValueError(f"Task '{task.name}' depends on unknown task(s): {', '.join(missing)}")
+
+    visiting, done = set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle through task '{name}'")
+        visiting.add(name)
+        for dep in by_name[name].deps:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+
+    for task in tasks:
+        visit(task.name)
+
+
+def run_dag(tasks, store=None, force=False, workers=4, on_event=None):
+    """
+    Run a task graph
+
+    A task starts as soon as all of its dependencies succeeded (ran or were
+    skipped), so independent branches run at the same time. When a task
+    fails, everything downstream of it is reported as 'blocked'.
+
+    Args:
+        tasks: List of Task objects
+        store: FingerprintStore (default: STATE_FILE)
+        force: Run every task regardless of fingerprints
+        workers: Maximum number of tasks running at the same time
+        on_event: Optional callback(event, task_name, TaskResult or None),
+            event being 'start' or 'done'
+
+    Returns:
+        dict: Task name -> TaskResult, in completion order
+    """
+    check_graph(tasks)
+    store = store or FingerprintStore()
+    by_name = {task.name: task for task in tasks}
+    results = {}
+    fingerprints = {}
+
+    def notify(event, name, result=None):
+        if on_event is not None:
+            on_event(event, name, result)
+
+    def execute(task):
+        start = time.perf_counter()
+        dep_fingerprints = {dep: fingerprints[dep] for dep in task.deps}
+
+        fingerprint = None
+        if task.inputs is not None:
+            fingerprint = store.fingerprint(task.params, task.inputs, dep_fingerprints)
+            outputs_present = all(os.path.exists(path) for path in task.outputs)
+            if not force and outputs_present and fingerprint == store.get(task.name):
+                return TaskResult(task.name, 'skipped', time.perf_counter() - start,
+                                  'inputs unchanged'), fingerprint
+
+        notify('start', task.name)
+        detail = task.func()
+        if fingerprint is None:
+            # Always-run task: downstream tasks key on what it produced
+            fingerprint = store.fingerprint(task.params, task.outputs, dep_fingerprints)
+        store.record(task.name, fingerprint)
+        return TaskResult(task.name, 'ran', time.perf_counter() - start, detail), fingerprint
+
+    pending = {task.name for task in tasks}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            for name in sorted(pending):
+                task = by_name[name]
+                dep_status = [results[dep].status if dep in results else None for dep in task.deps]
+                if any(status in ('failed', 'blocked') for status in dep_status):
+                    pending.discard(name)
+                    results[name] = TaskResult(name, 'blocked', detail='upstream task failed')
+                    notify('done', name, results[name])
+                elif all(status in ('ran', 'skipped') for status in dep_status):
+                    pending.discard(name)
+                    running[pool.submit(execute, task)] = name
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    results[name], fingerprints[name] = future.result()
+                except Exception as e:
+                    results[name] = TaskResult(name, 'failed', detail=e)
+                notify('done', name, results[name])
+
+    return results
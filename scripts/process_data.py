@@ -1,86 +1,456 @@
 """
 FDA Data Processing Script
-Cleans and normalizes the downloaded FDA datasets into structured CSV tables
+Cleans and normalizes the downloaded FDA datasets into structured tables
+(CSV by default, or Parquet/Feather with --format; see table_formats.py)
+
+The NDC file can be processed in three ways:
+  - default:     json.load() the whole file and transform it in one DataFrame
+  - --streaming: parse results[*] incrementally and transform/write it in
+                 batches of --batch-size records, so memory depends on the
+                 batch size rather than on the file size
+  - --workers N: like --streaming, but the batches (shards) are transformed
+                 by N worker processes and merged back in file order
+
+Every product also gets a labeler_id: an integer key derived from its
+normalized labeler_name (see labeler_ids), so shards and reruns agree on
+it without coordinating. The distinct labelers are written to the
+labelers table, the labeler dimension that analyses join on instead of
+matching labeler_name text.
+
+With --workers N the shortage stage also runs in its own process, next to
+the NDC stage. Each stage is a plain function (see run_stage), so
+run_pipeline.py can run them in its own process pool.
+
+Finally the shortages are matched to the NDC catalog (see
+ndc_matching.py), which needs the output of both stages.
+
+Usage:
+    python scripts/process_data.py
+    python scripts/process_data.py --streaming --batch-size 20000
+    python scripts/process_data.py --workers 4
+    python scripts/process_data.py --format parquet
 """
 
 import pandas as pd
+import numpy as np
+import argparse
+import hashlib
 import json
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from instrumentation import RunReport, measured_call, peak_rss_mb
+from ndc_matching import MATCH_TABLE, run_matching_measured
+from table_formats import FORMATS, TableWriter, table_path, write_table
+
+NDC_FILE = 'data/drug-ndc-0001-of-0001.json'
+SHORTAGES_FILE = 'data/drug-shortages-0001-of-0001.json'
+
+DEFAULT_BATCH_SIZE = 10000
+
+# Columns of the core NDC products table
+NDC_CORE_COLUMNS = [
+    'product_ndc', 'generic_name', 'labeler_name', 'brand_name',
+    'finished', 'marketing_category', 'dosage_form', 'route',
+    'product_type', 'marketing_start_date', 'application_number'
+]
+
+# Columns of the labeler dimension table
+LABELER_COLUMNS = ['labeler_id', 'labeler_name']
+
+# Columns of the NDC packaging table
+NDC_PACKAGING_COLUMNS = ['product_ndc', 'package_ndc', 'description', 'marketing_start_date']
+
+# Date formats used by openFDA: YYYYMMDD in the NDC data, MM/DD/YYYY in the
+# shortage data. Each format is tried in turn on the values still unparsed.
+DATE_FORMATS = ('%Y%m%d', '%m/%d/%Y')
+
+
+# ============================================
+# Helpers
+# ============================================
+
+def iter_json_array(path, key='results', read_size=1024 * 1024):
+    """
+    Yield the elements of a top-level array in a JSON object one at a time
+
+    Only the current element (plus one read buffer) is held in memory.
+    Other top-level values (e.g. openFDA's 'meta' block) are decoded and
+    discarded, so a 'results' key nested inside them is never mistaken for
+    the one we want.
+
+    Args:
+        path: Path of a JSON file shaped like {"meta": {...}, "results": [...]}
+        key: Top-level key holding the array
+        read_size: Number of characters to read from the file at a time
+    """
+    decoder = json.JSONDecoder()
+
+    with open(path, 'r', encoding='utf-8') as f:
+        buf = ''
+        pos = 0
+        eof = False
+
+        def fill():
+            # Drop consumed text and append the next block from the file
+            nonlocal buf, pos, eof
+            chunk = f.read(read_size)
+            if not chunk:
+                eof = True
+            buf = buf[pos:] + chunk
+            pos = 0
+
+        def skip_ws():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in ' \t\r\n':
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        def expect(chars):
+            nonlocal pos
+            skip_ws()
+            if pos >= len(buf) or buf[pos] not in chars:
+                found = buf[pos] if pos < len(buf) else 'end of file'
+                raise ValueError(f"Malformed JSON in {path}: expected {chars!r}, found {found!r}")
+            pos += 1
+            return buf[pos - 1]
+
+        def decode():
+            # raw_decode the next value, reading more until it is complete.
+            # A value ending exactly at the buffer end might be a truncated
+            # number, so we only accept it once more data (or EOF) follows.
+            nonlocal pos
+            skip_ws()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                    if end < len(buf) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        expect('{')
+        skip_ws()
+        if buf[pos:pos + 1] == '}':
+            return
+
+        while True:
+            name = decode()
+            expect(':')
+            if name != key:
+                decode()
+            else:
+                expect('[')
+                skip_ws()
+                if buf[pos:pos + 1] == ']':
+                    pos += 1
+                else:
+                    while True:
+                        yield decode()
+                        if expect(',]') == ']':
+                            break
+            if expect(',}') == '}':
+                return
+
+
+def parse_dates(values):
+    """
+    Parse openFDA date strings once, so MySQL can store them as DATE
+
+    Missing or unrecognized values become NaT (written as NULL).
+
+    Returns:
+        Series: datetime64 values with the same index
+    """
+    values = pd.Series(values, dtype=object)
+    parsed = pd.to_datetime(values, format=DATE_FORMATS[0], errors='coerce')
+    for date_format in DATE_FORMATS[1:]:
+        unparsed = parsed.isna() & values.notna()
+        if not unparsed.any():
+            break
+        parsed[unparsed] = pd.to_datetime(values[unparsed], format=date_format, errors='coerce')
+    return parsed
+
+
+def labeler_key(name):
+    """Normalized labeler name: case-folded, with whitespace collapsed"""
+    return ' '.join(str(name).split()).upper()
+
+
+def labeler_ids(names):
+    """
+    Integer labeler_id of each labeler name (missing names get no id)
+
+    The id is the first 60 bits of the MD5 of the normalized name, so it
+    is the same in every shard and every run, and spelling variants such
+    as 'Pfizer  Inc' and 'PFIZER INC' share one id.
+
+    Returns:
+        Series: Int64 values with the same index
+    """
+    names = pd.Series(names, dtype=object)
+    ids = {name: int(hashlib.md5(labeler_key(name).encode('utf-8')).hexdigest()[:15], 16)
+           for name in names.dropna().unique()}
+    # Not names.map(ids): with a missing name it goes through float64,
+    # which rounds 60-bit ids
+    return pd.Series(pd.array([ids.get(name) for name in names], dtype='Int64'), index=names.index)
+
+
+def iter_batches(iterable, batch_size):
+    """Group an iterable into lists of at most batch_size items"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-print("Starting data processing...")
 
 # ============================================
-# Process NDC Dataset
+# NDC Transformations
 # ============================================
-print("\n1. Processing NDC dataset...")
 
-try:
+def build_ndc_core(df_ndc, columns=None):
+    """
+    Select the core NDC product columns and drop duplicate product_ndc values
+
+    Args:
+        df_ndc: DataFrame of raw NDC results
+        columns: Columns to keep (default: those of NDC_CORE_COLUMNS present in df_ndc)
+    """
+    if columns is None:
+        # Only keep columns that exist
+        columns = [col for col in NDC_CORE_COLUMNS if col in df_ndc.columns]
+    ndc_core = df_ndc.reindex(columns=columns)
+    if 'marketing_start_date' in ndc_core.columns:
+        ndc_core['marketing_start_date'] = parse_dates(ndc_core['marketing_start_date'])
+    if 'labeler_name' in ndc_core.columns:
+        ndc_core.insert(ndc_core.columns.get_loc('labeler_name') + 1, 'labeler_id',
+                        labeler_ids(ndc_core['labeler_name']))
+
+    # Remove duplicates (keep first occurrence)
+    return ndc_core.drop_duplicates(subset=['product_ndc'], keep='first')
+
+
+def collect_labelers(ndc_core, labelers):
+    """Add the labelers of a batch of products to labelers (labeler_id -> first name seen)"""
+    if 'labeler_id' not in ndc_core.columns:
+        return
+    named = ndc_core[ndc_core['labeler_id'].notna()]
+    for labeler_id, name in zip(named['labeler_id'].to_numpy(dtype=object), named['labeler_name']):
+        labelers.setdefault(int(labeler_id), name)
+
+
+def write_labelers(labelers, fmt='csv'):
+    """Write the labeler dimension table; returns its row count"""
+    df = pd.DataFrame(list(labelers.items()), columns=LABELER_COLUMNS)
+    df['labeler_id'] = df['labeler_id'].astype('Int64')
+    write_table(df, 'labelers', fmt)
+    print(f"   ✓ Created {os.path.basename(table_path('labelers', fmt))} ({len(df)} labelers)")
+    return len(df)
+
+
+def build_ndc_packaging(df_ndc):
+    """
+    Flatten the nested packaging lists (one-to-many) into one row per package
+
+    Uses explode + from_records instead of a per-row loop; rows whose
+    packaging is missing or an empty list produce no packages.
+    """
+    if 'packaging' not in df_ndc.columns:
+        return pd.DataFrame(columns=NDC_PACKAGING_COLUMNS)
+
+    products = df_ndc.reindex(columns=['product_ndc', 'packaging'])
+    has_list = products['packaging'].map(lambda value: isinstance(value, list))
+
+    # One row per package, keeping the parent product_ndc alongside
+    exploded = products[has_list].explode('packaging')
+    exploded = exploded[exploded['packaging'].notna()]
+
+    ndc_packaging = pd.DataFrame.from_records(
+        exploded['packaging'].tolist(),
+        columns=NDC_PACKAGING_COLUMNS[1:]
+    )
+    ndc_packaging.insert(0, 'product_ndc', exploded['product_ndc'].to_numpy())
+    ndc_packaging['marketing_start_date'] = parse_dates(ndc_packaging['marketing_start_date'])
+
+    # Remove duplicates (keep first occurrence)
+    return ndc_packaging.drop_duplicates(subset=['package_ndc'], keep='first')
+
+
+def process_ndc(ndc_file=NDC_FILE, fmt='csv'):
+    """Load the whole NDC file into memory and write ndc_core/ndc_packaging"""
     # Load the NDC JSON file
-    with open('data/drug-ndc-0001-of-0001.json', 'r') as f:
+    with open(ndc_file, 'r') as f:
         ndc_data = json.load(f)
-    
+
     # Extract results into DataFrame
     df_ndc = pd.DataFrame(ndc_data['results'])
     print(f"   Loaded {len(df_ndc)} NDC records")
-    
+
     # Create core NDC products table
-    ndc_core_columns = [
-        'product_ndc', 'generic_name', 'labeler_name', 'brand_name',
-        'finished', 'marketing_category', 'dosage_form', 'route',
-        'product_type', 'marketing_start_date', 'application_number'
-    ]
-    
-    # Only keep columns that exist
-    available_columns = [col for col in ndc_core_columns if col in df_ndc.columns]
-    ndc_core = df_ndc[available_columns].copy()
-    
-    # Remove duplicates (keep first occurrence)
-    ndc_core = ndc_core.drop_duplicates(subset=['product_ndc'], keep='first')
-    
+    ndc_core = build_ndc_core(df_ndc)
+
     # Save core NDC table
-    ndc_core.to_csv('data/ndc_core.csv', index=False)
-    print(f"   ✓ Created ndc_core.csv ({len(ndc_core)} products)")
-    
+    write_table(ndc_core, 'ndc_core', fmt)
+    print(f"   ✓ Created {os.path.basename(table_path('ndc_core', fmt))} ({len(ndc_core)} products)")
+
+    # Labeler dimension
+    labelers = {}
+    collect_labelers(ndc_core, labelers)
+    labeler_count = write_labelers(labelers, fmt)
+
     # Extract packaging information (one-to-many relationship)
-    packaging_records = []
-    for idx, row in df_ndc.iterrows():
-        product_ndc = row.get('product_ndc')
-        packaging_list = row.get('packaging', [])
-        
-        if isinstance(packaging_list, list):
-            for pkg in packaging_list:
-                packaging_records.append({
-                    'product_ndc': product_ndc,
-                    'package_ndc': pkg.get('package_ndc'),
-                    'description': pkg.get('description'),
-                    'marketing_start_date': pkg.get('marketing_start_date')
-                })
-    
-    ndc_packaging = pd.DataFrame(packaging_records)
-    
-    # Remove duplicates (keep first occurrence)
-    ndc_packaging = ndc_packaging.drop_duplicates(subset=['package_ndc'], keep='first')
-    
-    ndc_packaging.to_csv('data/ndc_packaging.csv', index=False)
-    print(f"   ✓ Created ndc_packaging.csv ({len(ndc_packaging)} packages)")
-    
-except Exception as e:
-    print(f"   ✗ Error processing NDC dataset: {e}")
+    ndc_packaging = build_ndc_packaging(df_ndc)
+
+    write_table(ndc_packaging, 'ndc_packaging', fmt)
+    print(f"   ✓ Created {os.path.basename(table_path('ndc_packaging', fmt))} ({len(ndc_packaging)} packages)")
+    return stage_result(len(df_ndc), {'labelers': labeler_count, 'ndc_core': len(ndc_core),
+                                      'ndc_packaging': len(ndc_packaging)})
+
+
+def process_ndc_streaming(ndc_file=NDC_FILE, batch_size=DEFAULT_BATCH_SIZE, fmt='csv'):
+    """
+    Parse the NDC file incrementally and write ndc_core/ndc_packaging in batches
+
+    Duplicates are removed across batches by remembering the keys already
+    written, which keeps drop_duplicates(keep='first') semantics. All
+    NDC_CORE_COLUMNS are written since the header must be known up front.
+    """
+    seen_products = set()
+    seen_packages = set()
+    labelers = {}
+    total_records = 0
+
+    with TableWriter('ndc_core', fmt) as core_writer, \
+            TableWriter('ndc_packaging', fmt) as packaging_writer:
+        for batch in iter_batches(iter_json_array(ndc_file), batch_size):
+            df_ndc = pd.DataFrame(batch)
+            total_records += len(df_ndc)
+
+            ndc_core = build_ndc_core(df_ndc, NDC_CORE_COLUMNS)
+            ndc_core = ndc_core[~ndc_core['product_ndc'].isin(seen_products)]
+            seen_products.update(ndc_core['product_ndc'])
+            collect_labelers(ndc_core, labelers)
+            core_writer.write(ndc_core)
+
+            ndc_packaging = build_ndc_packaging(df_ndc)
+            ndc_packaging = ndc_packaging[~ndc_packaging['package_ndc'].isin(seen_packages)]
+            seen_packages.update(ndc_packaging['package_ndc'])
+            packaging_writer.write(ndc_packaging)
+
+    print(f"   Streamed {total_records} NDC records in batches of {batch_size}")
+    print(f"   ✓ Created {os.path.basename(core_writer.path)} ({core_writer.rows} products)")
+    print(f"   ✓ Created {os.path.basename(packaging_writer.path)} ({packaging_writer.rows} packages)")
+    labeler_count = write_labelers(labelers, fmt)
+    return stage_result(total_records, {'labelers': labeler_count, 'ndc_core': core_writer.rows,
+                                        'ndc_packaging': packaging_writer.rows})
+
+
+def build_ndc_shard(records):
+    """
+    Transform one shard of NDC results (runs in a worker process)
+
+    Returns:
+        tuple: (ndc_core, ndc_packaging) with duplicates removed within the shard
+    """
+    df_ndc = pd.DataFrame(records)
+    return build_ndc_core(df_ndc, NDC_CORE_COLUMNS), build_ndc_packaging(df_ndc)
+
+
+def process_ndc_parallel(ndc_file=NDC_FILE, workers=2, batch_size=DEFAULT_BATCH_SIZE, fmt='csv'):
+    """
+    Transform shards of the NDC results on several processes and merge them
+
+    The parent parses the file incrementally and hands out consecutive
+    shards of batch_size records. Shard results are merged strictly in
+    shard order, dropping keys already written, so the first occurrence
+    in the file always wins, as with drop_duplicates(keep='first') over
+    the whole file. At most 2 * workers shards are in flight.
+    """
+    seen_products = set()
+    seen_packages = set()
+    labelers = {}
+    total_records = 0
+
+    with TableWriter('ndc_core', fmt) as core_writer, \
+            TableWriter('ndc_packaging', fmt) as packaging_writer, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+
+        def merge(future):
+            ndc_core, ndc_packaging = future.result()
+
+            ndc_core = ndc_core[~ndc_core['product_ndc'].isin(seen_products)]
+            seen_products.update(ndc_core['product_ndc'])
+            collect_labelers(ndc_core, labelers)
+            core_writer.write(ndc_core)
+
+            ndc_packaging = ndc_packaging[~ndc_packaging['package_ndc'].isin(seen_packages)]
+            seen_packages.update(ndc_packaging['package_ndc'])
+            packaging_writer.write(ndc_packaging)
+
+        in_flight = deque()
+        for batch in iter_batches(iter_json_array(ndc_file), batch_size):
+            total_records += len(batch)
+            in_flight.append(pool.submit(build_ndc_shard, batch))
+            if len(in_flight) >= 2 * workers:
+                merge(in_flight.popleft())
+        while in_flight:
+            merge(in_flight.popleft())
+
+    print(f"   Processed {total_records} NDC records in shards of {batch_size} on {workers} workers")
+    print(f"   ✓ Created {os.path.basename(core_writer.path)} ({core_writer.rows} products)")
+    print(f"   ✓ Created {os.path.basename(packaging_writer.path)} ({packaging_writer.rows} packages)")
+    labeler_count = write_labelers(labelers, fmt)
+    return stage_result(total_records, {'labelers': labeler_count, 'ndc_core': core_writer.rows,
+                                        'ndc_packaging': packaging_writer.rows})
+
 
 # ============================================
-# Process Drug Shortages Dataset
+# Drug Shortage Transformations
 # ============================================
-print("\n2. Processing Drug Shortages dataset...")
 
-try:
+def build_shortage_contacts(df_shortages):
+    """
+    Build one contact row per shortage record that has contact information
+
+    Columns are built directly as arrays. A value is kept when it is truthy
+    and written as str(value), exactly like the original per-row loop (so a
+    missing value in a partly-filled column is kept as 'nan').
+    """
+    if 'contact_info' not in df_shortages.columns:
+        return pd.DataFrame(columns=['package_ndc', 'contact_info'])
+
+    contact_info = df_shortages['contact_info'].to_numpy(dtype=object)
+    keep = np.fromiter((bool(value) for value in contact_info), dtype=bool, count=len(contact_info))
+
+    package_ndc = df_shortages.reindex(columns=['package_ndc'])['package_ndc'].to_numpy(dtype=object)
+
+    return pd.DataFrame({
+        'package_ndc': package_ndc[keep],
+        'contact_info': [str(value) for value in contact_info[keep]]
+    })
+
+
+def process_shortages(shortages_file=SHORTAGES_FILE, fmt='csv'):
+    """Write drug_shortages_core/shortage_contacts from the shortage JSON file"""
     # Load the drug shortage JSON file
-    with open('data/drug-shortages-0001-of-0001.json', 'r') as f:
+    with open(shortages_file, 'r') as f:
         shortage_data = json.load(f)
-    
+
     # Extract results into DataFrame
     df_shortages = pd.DataFrame(shortage_data['results'])
     print(f"   Loaded {len(df_shortages)} shortage records")
-    
+
     # Create core shortage table with fields that actually exist
     shortage_core = pd.DataFrame({
         'package_ndc': df_shortages.get('package_ndc'),
@@ -93,47 +463,180 @@ try:
         'dosage_form': df_shortages.get('presentation'),  # Use presentation field
         'reason': None  # Not available in FDA data
     })
-    
+    for col in ('initial_posting_date', 'update_date'):
+        shortage_core[col] = parse_dates(shortage_core[col])
+
     # Remove duplicates based on package_ndc (keep first occurrence)
     shortage_core = shortage_core.drop_duplicates(subset=['package_ndc'], keep='first')
-    
+
     # Save core shortage table
-    shortage_core.to_csv('data/drug_shortages_core.csv', index=False)
-    print(f"   ✓ Created drug_shortages_core.csv ({len(shortage_core)} shortages)")
-    
-    # Extract contact information
-    contact_records = []
-    for idx, row in df_shortages.iterrows():
-        package_ndc = row.get('package_ndc')
-        contact_info = row.get('contact_info')
-        
-        if contact_info:
-            contact_records.append({
-                'package_ndc': package_ndc,
-                'contact_info': str(contact_info)
-            })
-    
-    if len(contact_records) > 0:
-        shortage_contacts = pd.DataFrame(contact_records)
-        
+    write_table(shortage_core, 'drug_shortages_core', fmt)
+    print(f"   ✓ Created {os.path.basename(table_path('drug_shortages_core', fmt))} ({len(shortage_core)} shortages)")
+
+    # Extract contact information (rows with a truthy contact_info)
+    shortage_contacts = build_shortage_contacts(df_shortages)
+
+    if len(shortage_contacts) > 0:
         # Remove duplicates
         shortage_contacts = shortage_contacts.drop_duplicates(subset=['package_ndc'], keep='first')
-        
-        shortage_contacts.to_csv('data/shortage_contacts.csv', index=False)
-        print(f"   ✓ Created shortage_contacts.csv ({len(shortage_contacts)} contacts)")
+
+        write_table(shortage_contacts, 'shortage_contacts', fmt)
+        print(f"   ✓ Created {os.path.basename(table_path('shortage_contacts', fmt))} ({len(shortage_contacts)} contacts)")
     else:
         # Create empty template if no contacts
         shortage_contacts = pd.DataFrame(columns=['package_ndc', 'contact_info'])
-        shortage_contacts.to_csv('data/shortage_contacts.csv', index=False)
-        print(f"   ✓ Created shortage_contacts.csv (empty - no contacts in data)")
-    
-except Exception as e:
-    print(f"   ✗ Error processing Drug Shortages dataset: {e}")
-
-print("\n✓ Data processing complete!")
-print("\nGenerated files in data/ directory:")
-print("  - ndc_core.csv")
-print("  - ndc_packaging.csv")
-print("  - drug_shortages_core.csv")
-print("  - shortage_contacts.csv")
-print("\nNext step: Load these CSV files into MySQL")
+        write_table(shortage_contacts, 'shortage_contacts', fmt)
+        print(f"   ✓ Created {os.path.basename(table_path('shortage_contacts', fmt))} (empty - no contacts in data)")
+
+    return stage_result(len(df_shortages), {'drug_shortages_core': len(shortage_core),
+                                            'shortage_contacts': len(shortage_contacts)})
+
+
+# ============================================
+# Stages
+# ============================================
+
+STAGES = ('ndc', 'shortages')
+
+# Input file and output tables of each stage
+STAGE_FILES = {
+    'ndc': (NDC_FILE, ('labelers', 'ndc_core', 'ndc_packaging')),
+    'shortages': (SHORTAGES_FILE, ('drug_shortages_core', 'shortage_contacts')),
+}
+
+
+def stage_result(records, tables):
+    """
+    Result of a processing stage
+
+    Returns:
+        dict: {'rows_in': source records, 'rows_out': rows written, 'tables': {table: rows}}
+    """
+    return {'rows_in': records, 'rows_out': sum(tables.values()), 'tables': tables}
+
+
+def run_stage(stage, fmt='csv', streaming=False, batch_size=DEFAULT_BATCH_SIZE, workers=1):
+    """
+    Run one processing stage; module-level so it can be sent to a process pool
+
+    Args:
+        stage: 'ndc' or 'shortages'
+        fmt: Output format
+        streaming: Parse the NDC file incrementally (ignored for shortages)
+        batch_size: NDC records per batch/shard
+        workers: NDC shard workers; more than 1 implies shard-parallel processing
+
+    Returns:
+        dict: See stage_result
+    """
+    if stage == 'shortages':
+        return process_shortages(SHORTAGES_FILE, fmt)
+    if stage != 'ndc':
+        raise ValueError(f"Unknown stage '{stage}'. Choose from: {', '.join(STAGES)}")
+    if workers > 1:
+        return process_ndc_parallel(NDC_FILE, workers, batch_size, fmt)
+    if streaming:
+        return process_ndc_streaming(NDC_FILE, batch_size, fmt)
+    return process_ndc(NDC_FILE, fmt)
+
+
+def run_stage_measured(stage, fmt='csv', streaming=False, batch_size=DEFAULT_BATCH_SIZE, workers=1):
+    """
+    run_stage() under instrumentation.measure(), e.g. in a worker process
+
+    Returns:
+        tuple: (stage result, stage metrics as a dict)
+    """
+    input_file, tables = STAGE_FILES[stage]
+    return measured_call(f'process_{stage}', run_stage, (stage, fmt, streaming, batch_size, workers),
+                         inputs=[input_file], outputs=[table_path(name, fmt) for name in tables])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean and normalize the FDA datasets into tables")
+    parser.add_argument('--streaming', action='store_true',
+                        help="parse the NDC file incrementally instead of loading it all at once")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"NDC records per batch in streaming mode (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes for the NDC shards; above 1 the shortage stage also "
+                             "runs in parallel (default: 1)")
+    parser.add_argument('--format', choices=FORMATS, default='csv',
+                        help="file format of the processed tables (default: csv)")
+    args = parser.parse_args()
+
+    print("Starting data processing...")
+
+    report = RunReport('process_data', {'format': args.format, 'streaming': args.streaming,
+                                        'batch_size': args.batch_size, 'workers': args.workers})
+    stage_args = (args.format, args.streaming, args.batch_size, args.workers)
+
+    # With several workers the small shortage stage runs in its own process
+    # while this process coordinates the NDC shards
+    shortage_pool = ProcessPoolExecutor(max_workers=1) if args.workers > 1 else None
+    shortage_future = (shortage_pool.submit(run_stage_measured, 'shortages', *stage_args)
+                       if shortage_pool else None)
+
+    # ============================================
+    # Process NDC Dataset
+    # ============================================
+    print("\n1. Processing NDC dataset...")
+
+    try:
+        report.add(run_stage_measured('ndc', *stage_args)[1])
+    except Exception as e:
+        print(f"   ✗ Error processing NDC dataset: {e}")
+        report.add_status('process_ndc', 'failed', detail=e)
+
+    peak = peak_rss_mb()
+    if peak is not None:
+        print(f"   Peak memory (RSS high-water mark): {peak:.1f} MB")
+
+    # ============================================
+    # Process Drug Shortages Dataset
+    # ============================================
+    print("\n2. Processing Drug Shortages dataset...")
+
+    try:
+        if shortage_future is not None:
+            report.add(shortage_future.result()[1])
+        else:
+            report.add(run_stage_measured('shortages', *stage_args)[1])
+    except Exception as e:
+        print(f"   ✗ Error processing Drug Shortages dataset: {e}")
+        report.add_status('process_shortages', 'failed', detail=e)
+    finally:
+        if shortage_pool is not None:
+            shortage_pool.shutdown()
+
+    # ============================================
+    # Match Shortages to the NDC Catalog
+    # ============================================
+    print("\n3. Matching shortage NDCs to the NDC catalog...")
+
+    if any(stage['status'] != 'ok' for stage in report.stages):
+        print("   ✗ Skipped: a processing stage failed")
+        report.add_status('match_ndc', 'skipped', detail='a processing stage failed')
+    else:
+        try:
+            report.add(run_matching_measured(args.format)[1])
+        except Exception as e:
+            print(f"   ✗ Error matching shortage NDCs: {e}")
+            report.add_status('match_ndc', 'failed', detail=e)
+
+    print("\nStage metrics:")
+    for stage in report.stages:
+        if stage['status'] == 'ok':
+            print(f"  {stage['name']}: {stage['wall_seconds']:.2f}s wall, {stage['cpu_seconds']:.2f}s CPU, "
+                  f"{stage['rows_in']} rows in, {stage['rows_out']} rows out")
+    print(f"  Run report: {report.write()}")
+
+    print("\n✓ Data processing complete!")
+    print("\nGenerated files in data/ directory:")
+    for name in ('labelers', 'ndc_core', 'ndc_packaging', 'drug_shortages_core', 'shortage_contacts', MATCH_TABLE):
+        print(f"  - {os.path.basename(table_path(name, args.format))}")
+    print("\nNext step: Load these files into MySQL")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+Query Plan Capture
+Records the execution plan and run time of every query in
+sql/03_analysis_queries.sql and every load_* query in scripts/dashboard.py,
+flags the expensive plan steps, and compares them with a baseline.
+
+Flags:
+  - full_scan:<table>  the table is read row by row without an index
+  - filesort           rows are sorted after reading (no index gives the order)
+  - temporary          a temporary table is built (GROUP BY, DISTINCT, UNION)
+
+On MySQL the plan comes from EXPLAIN FORMAT=JSON, plus EXPLAIN ANALYZE for
+actual row counts and timings. On DuckDB it comes from
+EXPLAIN (FORMAT JSON); DuckDB scans columns rather than using indexes, so
+its baseline is mostly full scans and a regression there is a new join,
+sort or aggregation step. On SQLite (e.g. the benchmark's stand-in
+database) it comes from EXPLAIN QUERY PLAN.
+
+The accepted flags per backend and query are kept in
+sql/query_plan_baseline.json, next to the SQL they describe, so plan
+changes show up in code review. A query that gains a flag has regressed;
+the run fails (exit code 1), and so does a benchmark run (benchmark.py
+checks the plans at every scale). After an intended change, accept the new
+plans with --update-baseline.
+
+Usage:
+    python scripts/query_plans.py                          # fda_shortage_db on MySQL
+    python scripts/query_plans.py --sqlite data/benchmarks/1x/bench.sqlite
+    python scripts/query_plans.py --duckdb data/fda_shortage_db.duckdb
+    python scripts/query_plans.py --update-baseline
+"""
+
+import argparse
+import ast
+import json
+import os
+import re
+import sys
+import time
+
+from database import DB_BACKEND, DB_NAME, DB_PATH, duckdb_file_engine, get_engine, sqlite_engine
+from instrumentation import RunReport
+from sql_dialects import translate
+from sql_runner import named_queries
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ANALYSIS_SQL = os.path.join(ROOT_DIR, 'sql', '03_analysis_queries.sql')
+DASHBOARD_PY = os.path.join(ROOT_DIR, 'scripts', 'dashboard.py')
+BASELINE_FILE = os.path.join(ROOT_DIR, 'sql', 'query_plan_baseline.json')
+
+
+# ============================================
+# Queries
+# ============================================
+
+def dashboard_queries(path=DASHBOARD_PY):
+    """
+    The SQL of every load_* function in dashboard.py, read without importing it
+
+    The query is the string assigned to `query` in the function. Placeholders
+    of an f-string, and :name bind parameters, are filled with the
+    function's default argument values.
+
+    Returns:
+        list: (name, sql) tuples in file order
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+
+    queries = []
+    for node in tree.body:
+        if not (isinstance(node, ast.FunctionDef) and node.name.startswith('load_')):
+            continue
+        args = node.args.args
+        defaults = {arg.arg: ast.literal_eval(default)
+                    for arg, default in zip(args[len(args) - len(node.args.defaults):], node.args.defaults)}
+        for statement in ast.walk(node):
+            if (isinstance(statement, ast.Assign)
+                    and any(isinstance(target, ast.Name) and target.id == 'query' for target in statement.targets)):
+                sql = _render_string(statement.value, defaults)
+                sql = re.sub(r'(?<![:\w]):(\w+)',
+                             lambda m: _sql_literal(defaults[m.group(1)]) if m.group(1) in defaults else m.group(0),
+                             sql)
+                queries.append((node.name, sql))
+                break
+    return queries
+
+
+def _render_string(node, values):
+    """Text of a string constant or f-string, with placeholders filled from values"""
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for part in node.values:
+            if isinstance(part, ast.Constant):
+                parts.append(part.value)
+            elif isinstance(part, ast.FormattedValue) and isinstance(part.value, ast.Name):
+                parts.append(str(values[part.value.id]))
+            else:
+                raise ValueError("Only plain {name} placeholders are supported in dashboard queries")
+        return ''.join(parts)
+    raise ValueError("Dashboard queries must be string literals")
+
+
+def _sql_literal(value):
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+
+def all_queries():
+    """
+    Every query whose plan is captured
+
+    Returns:
+        list: (name, title, sql) tuples, e.g. ('analysis/query_10', 'Manufacturer ...', 'SELECT ...')
+    """
+    queries = [(f"analysis/query_{number:02d}", title, sql) for number, title, sql in named_queries(ANALYSIS_SQL)]
+    queries += [(f"dashboard/{name}", name, sql.strip()) for name, sql in dashboard_queries()]
+    return queries
+
+
+# ============================================
+# Plans
+# ============================================
+
+def mysql_plan(conn, sql):
+    """
+    EXPLAIN FORMAT=JSON and EXPLAIN ANALYZE of one query
+
+    Returns:
+        tuple: (plan dict, sorted list of flags)
+    """
+    plan = json.loads(conn.exec_driver_sql(f"EXPLAIN FORMAT=JSON {sql}").scalar())
+    flags = set()
+
+    def walk(node):
+        if isinstance(node, dict):
+            if node.get('access_type') == 'ALL':
+                flags.add(f"full_scan:{node.get('table_name')}")
+            if node.get('using_filesort'):
+                flags.add('filesort')
+            if node.get('using_temporary_table'):
+                flags.add('temporary')
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(plan)
+    analyzed = conn.exec_driver_sql(f"EXPLAIN ANALYZE {sql}").scalar()
+    return {'json': plan, 'analyze': analyzed}, sorted(flags)
+
+
+def sqlite_plan(conn, sql):
+    """
+    EXPLAIN QUERY PLAN of one query
+
+    Returns:
+        tuple: (plan as a list of detail lines, sorted list of flags)
+    """
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    details = [row[-1] for row in rows]
+    flags = set()
+    for detail in details:
+        scan = re.match(r'SCAN (\w+)$', detail)
+        if scan and scan.group(1) != 'CONSTANT':
+            flags.add(f"full_scan:{scan.group(1)}")
+        if re.match(r'USE TEMP B-TREE FOR (.* )?ORDER BY', detail):
+            flags.add('filesort')
+        elif detail.startswith('USE TEMP B-TREE FOR') or detail.startswith('MATERIALIZE'):
+            flags.add('temporary')
+    return details, sorted(flags)
+
+
+def duckdb_plan(conn, sql):
+    """
+    EXPLAIN (FORMAT JSON) of one query
+
+    Returns:
+        tuple: (plan as a list of operator trees, sorted list of flags)
+    """
+    plan = json.loads(conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}").fetchall()[0][-1])
+    flags = set()
+
+    def walk(node):
+        name = node.get('name', '')
+        if name in ('SEQ_SCAN', 'TABLE_SCAN'):
+            table = str(node.get('extra_info', {}).get('Table', ''))
+            flags.add(f"full_scan:{table.split('.')[-1]}")
+        elif name in ('ORDER_BY', 'TOP_N'):
+            flags.add('filesort')
+        elif name.endswith('GROUP_BY') or name in ('CTE', 'WINDOW'):
+            flags.add('temporary')
+        for child in node.get('children', []):
+            walk(child)
+
+    for node in plan:
+        walk(node)
+    return plan, sorted(flags)
+
+
+PLANNERS = {'mysql': mysql_plan, 'duckdb': duckdb_plan, 'sqlite': sqlite_plan}
+
+
+def capture(engine, queries=None):
+    """
+    Plan, flags, row count and run time of every query
+
+    Returns:
+        dict: Query name -> {'title', 'flags', 'plan', 'seconds', 'rows'}
+    """
+    dialect = engine.dialect.name
+    explain = PLANNERS[dialect]
+    results = {}
+    with engine.connect() as conn:
+        for name, title, sql in queries or all_queries():
+            (sql,) = translate(sql, dialect)
+            plan, flags = explain(conn, sql)
+            start = time.perf_counter()
+            rows = len(conn.exec_driver_sql(sql).fetchall())
+            results[name] = {'title': title, 'flags': flags, 'plan': plan,
+                             'seconds': round(time.perf_counter() - start, 6), 'rows': rows}
+    return results
+
+
+# ============================================
+# Baseline
+# ============================================
+
+def load_baseline(path=BASELINE_FILE):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except OSError:
+        return {}
+
+
+def save_baseline(backend, results, path=BASELINE_FILE):
+    """Accept the current flags of every query as the baseline for a backend"""
+    baseline = load_baseline(path)
+    baseline[backend] = {name: result['flags'] for name, result in sorted(results.items())}
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(backend, results, baseline=None):
+    """
+    Compare flags with the baseline
+
+    Returns:
+        dict: {'regressed': {query: [new flags]}, 'improved': {query: [flags gone]},
+               'unknown': [queries without a baseline]}
+    """
+    accepted = (load_baseline() if baseline is None else baseline).get(backend, {})
+    comparison = {'regressed': {}, 'improved': {}, 'unknown': []}
+    for name, result in results.items():
+        if name not in accepted:
+            comparison['unknown'].append(name)
+            continue
+        new = sorted(set(result['flags']) - set(accepted[name]))
+        gone = sorted(set(accepted[name]) - set(result['flags']))
+        if new:
+            comparison['regressed'][name] = new
+        if gone:
+            comparison['improved'][name] = gone
+    return comparison
+
+
+def print_comparison(comparison):
+    """Print regressions loudly; returns True when there are none"""
+    for name, flags in comparison['improved'].items():
+        print(f"  ✓ {name} no longer needs: {', '.join(flags)} (run with --update-baseline to accept)")
+    for name in comparison['unknown']:
+        print(f"  ⚠ {name} has no baseline plan (run with --update-baseline to accept)")
+    if not comparison['regressed']:
+        return True
+    print("\n" + "!" * 70)
+    print("  QUERY PLAN REGRESSION")
+    for name, flags in comparison['regressed'].items():
+        print(f"  ✗ {name} now needs: {', '.join(flags)}")
+    print("!" * 70)
+    return False
+
+
+def print_slowest(results):
+    """Queries by run time, slowest first, with their flags"""
+    print(f"\n{'query':<45}{'ms':>10}{'rows':>8}  flags")
+    for name, result in sorted(results.items(), key=lambda item: -item[1]['seconds']):
+        print(f"{name:<45}{result['seconds'] * 1000:>10.1f}{result['rows']:>8}  {', '.join(result['flags']) or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture and check the plans of the analysis and dashboard queries")
+    parser.add_argument('--sqlite', metavar='PATH',
+                        help="inspect a SQLite database (e.g. a benchmark's bench.sqlite) instead of MySQL")
+    parser.add_argument('--duckdb', metavar='PATH',
+                        help="inspect a DuckDB database (e.g. a benchmark's bench.duckdb) instead of MySQL")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help=f"accept the current plans as the baseline ({os.path.relpath(BASELINE_FILE, ROOT_DIR)})")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        engine = sqlite_engine(args.sqlite)
+        print(f"Capturing query plans from {args.sqlite}...")
+    elif args.duckdb:
+        engine = duckdb_file_engine(args.duckdb)
+        print(f"Capturing query plans from {args.duckdb}...")
+    elif DB_BACKEND != 'mysql':
+        engine = get_engine()
+        print(f"Capturing query plans from {DB_PATH}...")
+    else:
+        engine = get_engine(pool_size=1)
+        print(f"Capturing query plans from MySQL database {DB_NAME}...")
+    backend = engine.dialect.name
+
+    report = RunReport('query_plans', {'backend': backend})
+    try:
+        with report.stage('capture') as stage:
+            results = capture(engine)
+            stage.rows_out = len(results)
+            stage.extra['queries'] = results
+    except Exception as e:
+        print(f"  ✗ Error capturing query plans: {e}")
+        print(f"Run report: {report.write()}")
+        sys.exit(1)
+    finally:
+        engine.dispose()
+
+    print_slowest(results)
+    print()
+    if args.update_baseline:
+        save_baseline(backend, results)
+        print(f"  ✓ Saved {len(results)} {backend} plans as the baseline in {os.path.relpath(BASELINE_FILE, ROOT_DIR)}")
+        print(f"Run report: {report.write()}")
+        return
+
+    comparison = compare(backend, results)
+    ok = print_comparison(comparison)
+    report.add_status('plan_check', 'ok' if ok else 'failed', detail=comparison)
+    print(f"Run report: {report.write()}")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
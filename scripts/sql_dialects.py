@@ -0,0 +1,293 @@
+"""
+SQL Dialect Translation
+Rewrites the MySQL statements in sql/ for the embedded backends, SQLite and
+DuckDB (see database.py), so the same scripts build and query an embedded
+database file when no MySQL server is available.
+
+Only the MySQL features the scripts in sql/ actually use are translated:
+  - inline INDEX / UNIQUE KEY definitions, index prefix lengths and
+    ENGINE/CHARSET table options
+  - AUTO_INCREMENT, ON UPDATE CURRENT_TIMESTAMP, CURRENT_TIMESTAMP(3)
+  - STORED generated columns and ON DELETE CASCADE foreign keys (DuckDB)
+  - CREATE TABLE ... LIKE, RENAME TABLE, CREATE OR REPLACE VIEW and
+    DROP TABLE/VIEW with several names
+  - INSERT ... ON DUPLICATE KEY UPDATE (as INSERT OR REPLACE; the scripts
+    only upsert complete rows)
+  - DATEDIFF() and CURDATE(), and case-insensitive LIKE (DuckDB)
+MD5() is registered as a SQL function by database.sqlite_engine(). Statements
+with no embedded equivalent (CREATE DATABASE, USE, SHOW, DESCRIBE, CREATE
+FULLTEXT INDEX) are dropped.
+
+SQLite index names are global to the database and survive a table rename,
+so every translated index gets a unique suffix; otherwise rebuilding a
+table under a temporary name would collide with the live table's indexes.
+"""
+
+import re
+import uuid
+
+DIALECTS = ('mysql', 'sqlite', 'duckdb')
+
+# Statements that only make sense on a MySQL server
+MYSQL_ONLY = ('CREATE DATABASE', 'USE ', 'SHOW ', 'DESCRIBE ', 'CREATE FULLTEXT INDEX')
+
+
+# ============================================
+# Helpers
+# ============================================
+
+def _matching_paren(text, start):
+    """Index of the ')' closing the '(' at text[start]"""
+    depth = 0
+    quote = None
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"', '`'):
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError(f"Unbalanced parentheses in: {text[start:start + 80]}...")
+
+
+def _split_top_level(text):
+    """Split on commas that are not inside parentheses or quotes"""
+    parts = []
+    depth = 0
+    quote = None
+    current = []
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"', '`'):
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(''.join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    if ''.join(current).strip():
+        parts.append(''.join(current).strip())
+    return parts
+
+
+def _index_name(name, table_name):
+    return f"{table_name}__{name}__{uuid.uuid4().hex[:8]}"
+
+
+def _strip_prefix_lengths(columns):
+    """'(status(50), company_name)' -> '(status, company_name)'"""
+    return re.sub(r'(\w+)\s*\(\d+\)', r'\1', columns)
+
+
+def _replace_function(sql, name, render):
+    """Replace every call name(args...) with render(list of argument strings)"""
+    pattern = re.compile(rf'\b{name}\s*\(', re.IGNORECASE)
+    while True:
+        match = pattern.search(sql)
+        if match is None:
+            return sql
+        open_paren = match.end() - 1
+        close_paren = _matching_paren(sql, open_paren)
+        args = _split_top_level(sql[open_paren + 1:close_paren])
+        sql = sql[:match.start()] + render(args) + sql[close_paren + 1:]
+
+
+# ============================================
+# SQLite and DuckDB
+# ============================================
+
+def _is_table(conn, name, dialect):
+    """True if name is an existing table (not a view)"""
+    if dialect == 'sqlite':
+        sql = f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = '{name}'"
+    else:
+        sql = f"SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = '{name}'"
+    return conn.exec_driver_sql(sql).scalar() > 0
+
+
+def _create_table(statement, dialect):
+    """
+    Rewrite a CREATE TABLE's column and index definitions for SQLite or DuckDB
+
+    SQLite: inline indexes become CREATE INDEX statements and AUTO_INCREMENT
+    keys become INTEGER PRIMARY KEY AUTOINCREMENT.
+
+    DuckDB: UNIQUE KEYs become UNIQUE constraints and plain indexes are
+    dropped (see to_duckdb). AUTO_INCREMENT keys take their default from a
+    sequence, generated columns are computed on read (DuckDB has no STORED
+    columns) and foreign keys are dropped (DuckDB has no ON DELETE CASCADE).
+    """
+    match = re.match(r'CREATE TABLE (IF NOT EXISTS )?(\w+)\s*\(', statement, re.IGNORECASE)
+    if match is None:
+        return [statement]
+    if_not_exists = match.group(1) or ''
+    table_name = match.group(2)
+    open_paren = match.end() - 1
+    close_paren = _matching_paren(statement, open_paren)
+
+    before = []
+    definitions = []
+    indexes = []
+    for item in _split_top_level(statement[open_paren + 1:close_paren]):
+        index = re.match(r'(UNIQUE\s+)?(?:INDEX|KEY)\s+(\w+)\s*(\(.*\))$', item, re.IGNORECASE | re.DOTALL)
+        if index:
+            unique = 'UNIQUE ' if index.group(1) else ''
+            columns = _strip_prefix_lengths(index.group(3))
+            if dialect == 'sqlite':
+                indexes.append(f"CREATE {unique}INDEX {_index_name(index.group(2), table_name)} "
+                               f"ON {table_name} {columns}")
+            elif unique:
+                definitions.append(f"UNIQUE {columns}")
+            continue
+        item = re.sub(r'\s+ON UPDATE CURRENT_TIMESTAMP\b', '', item, flags=re.IGNORECASE)
+
+        if dialect == 'sqlite':
+            item = re.sub(r'\b(?:BIG)?INT\s+AUTO_INCREMENT\s+PRIMARY KEY\b', 'INTEGER PRIMARY KEY AUTOINCREMENT',
+                          item, flags=re.IGNORECASE)
+        else:
+            if re.match(r'FOREIGN KEY\b', item, re.IGNORECASE):
+                continue
+            auto = re.match(r'(\w+)\s+(?:BIG)?INT\s+AUTO_INCREMENT\s+PRIMARY KEY\b', item, re.IGNORECASE)
+            if auto:
+                sequence = f"{table_name}_{auto.group(1)}_seq"
+                replace = 'SEQUENCE IF NOT EXISTS' if if_not_exists else 'OR REPLACE SEQUENCE'
+                before.append(f"CREATE {replace} {sequence}")
+                item = f"{auto.group(1)} BIGINT PRIMARY KEY DEFAULT nextval('{sequence}')" + item[auto.end():]
+            item = re.sub(r'\)\s*STORED\b', ')', item, flags=re.IGNORECASE)
+        definitions.append(item)
+
+    head = statement[:open_paren + 1]
+    body = ',\n    '.join(definitions)
+    return before + [f"{head}\n    {body}\n)"] + indexes
+
+
+def _translate_embedded(statement, dialect, conn=None):
+    """Translate one MySQL statement for SQLite or DuckDB (see to_sqlite / to_duckdb)"""
+    stripped = statement.strip()
+    upper = stripped.upper()
+
+    if upper.startswith(MYSQL_ONLY):
+        return []
+
+    # DROP TABLE/VIEW [IF EXISTS] a, b, c -> one statement per name. Like MySQL,
+    # DROP VIEW IF EXISTS skips names that are tables (if conn is given to check).
+    match = re.match(r'DROP (TABLE|VIEW) (IF EXISTS )?(.+)$', stripped, re.IGNORECASE | re.DOTALL)
+    if match:
+        kind, if_exists = match.group(1).upper(), match.group(2) or ''
+        names = [name.strip() for name in match.group(3).split(',')]
+        if kind == 'VIEW' and if_exists and conn is not None:
+            names = [name for name in names if not _is_table(conn, name, dialect)]
+        return [f"DROP {kind} {if_exists}{name}" for name in names]
+
+    # RENAME TABLE a TO b, c TO d -> one ALTER TABLE per pair (the DDL is transactional)
+    match = re.match(r'RENAME TABLE (.+)$', stripped, re.IGNORECASE | re.DOTALL)
+    if match:
+        pairs = [re.split(r'\s+TO\s+', pair.strip(), flags=re.IGNORECASE) for pair in match.group(1).split(',')]
+        return [f"ALTER TABLE {old} RENAME TO {new}" for old, new in pairs]
+
+    # CREATE TABLE [IF NOT EXISTS] a LIKE b -> empty copy of the columns
+    match = re.match(r'CREATE TABLE (IF NOT EXISTS )?(\w+) LIKE (\w+)$', stripped, re.IGNORECASE)
+    if match:
+        return [f"CREATE TABLE {match.group(1) or ''}{match.group(2)} AS SELECT * FROM {match.group(3)} WHERE 1 = 0"]
+
+    match = re.match(r'CREATE OR REPLACE VIEW (\w+)', stripped, re.IGNORECASE)
+    if match and dialect == 'sqlite':
+        return [f"DROP VIEW IF EXISTS {match.group(1)}",
+                'CREATE VIEW' + stripped[len('CREATE OR REPLACE VIEW'):]]
+
+    match = re.match(r'CREATE (UNIQUE )?INDEX (\w+) ON (\w+)\s*(\(.*\))$', stripped, re.IGNORECASE | re.DOTALL)
+    if match:
+        if dialect == 'duckdb':
+            return []
+        return [f"CREATE {match.group(1) or ''}INDEX {_index_name(match.group(2), match.group(3))} "
+                f"ON {match.group(3)} {_strip_prefix_lengths(match.group(4))}"]
+
+    # Expressions
+    stripped = re.sub(r'\bCURRENT_TIMESTAMP\(\d*\)', 'CURRENT_TIMESTAMP', stripped, flags=re.IGNORECASE)
+    if dialect == 'sqlite':
+        stripped = re.sub(r'\bCURDATE\(\)', "date('now')", stripped, flags=re.IGNORECASE)
+        stripped = _replace_function(
+            stripped, 'DATEDIFF',
+            lambda args: f"CAST(julianday({args[0]}) - julianday({args[1]}) AS INTEGER)"
+        )
+    else:
+        stripped = re.sub(r'\bCURDATE\(\)', 'current_date', stripped, flags=re.IGNORECASE)
+        stripped = _replace_function(
+            stripped, 'DATEDIFF',
+            lambda args: f"date_diff('day', {args[1]}, {args[0]})"
+        )
+        # MySQL's default collation compares case-insensitively
+        stripped = re.sub(r'\bLIKE\b', 'ILIKE', stripped, flags=re.IGNORECASE)
+
+    if upper.startswith('CREATE TABLE'):
+        stripped = re.sub(r'\)\s*ENGINE\s*=.*$', ')', stripped, flags=re.IGNORECASE | re.DOTALL)
+        if not re.match(r'CREATE TABLE (IF NOT EXISTS )?\w+ AS\b', stripped, re.IGNORECASE):
+            return _create_table(stripped, dialect)
+        return [stripped]
+
+    # INSERT ... ON DUPLICATE KEY UPDATE (full-row upserts) -> INSERT OR REPLACE
+    match = re.search(r'\s+ON DUPLICATE KEY UPDATE\b', stripped, re.IGNORECASE)
+    if match and upper.startswith('INSERT INTO'):
+        return ['INSERT OR REPLACE INTO' + stripped[len('INSERT INTO'):match.start()]]
+
+    return [stripped]
+
+
+def to_sqlite(statement, conn=None):
+    """
+    Translate one MySQL statement from sql/ to SQLite
+
+    Args:
+        statement: MySQL statement
+        conn: Optional connection, used to look up existing views
+
+    Returns:
+        list: Zero or more SQLite statements
+    """
+    return _translate_embedded(statement, 'sqlite', conn)
+
+
+def to_duckdb(statement, conn=None):
+    """
+    Translate one MySQL statement from sql/ to DuckDB
+
+    Secondary indexes are not created: DuckDB scans columns with min/max
+    zone maps, its ART indexes only speed up point lookups, and a table
+    with an index cannot be renamed, which the atomic swaps rely on.
+
+    Args:
+        statement: MySQL statement
+        conn: Optional connection, used to look up existing views
+
+    Returns:
+        list: Zero or more DuckDB statements
+    """
+    return _translate_embedded(statement, 'duckdb', conn)
+
+
+def translate(statement, dialect, conn=None):
+    """
+    Translate one MySQL statement for the given dialect (conn: see to_sqlite)
+
+    Returns:
+        list: Statements to run instead (the statement itself for MySQL)
+    """
+    if dialect == 'mysql':
+        return [statement]
+    if dialect == 'sqlite':
+        return to_sqlite(statement, conn)
+    if dialect == 'duckdb':
+        return to_duckdb(statement, conn)
+    raise ValueError(f"Unsupported SQL dialect '{dialect}'. Choose from: {', '.join(DIALECTS)}")
@@ -0,0 +1,112 @@
+"""
+SQL Script Runner
+Runs the files in sql/ from Python, statement by statement, so pipeline
+steps that used to be manual MySQL Workbench steps can be automated.
+
+On an engine other than MySQL (e.g. the SQLite stand-in used by
+benchmark.py) each statement is translated first; see sql_dialects.py.
+"""
+
+import re
+
+from sql_dialects import translate
+
+
+def split_sql(text):
+    """
+    Split a SQL script into statements
+
+    Statements end with ';'. Semicolons inside quoted strings or
+    identifiers and '--' / '#' line comments are handled; the scripts in
+    sql/ do not use DELIMITER blocks.
+
+    Returns:
+        list: Statements without their trailing ';'
+    """
+    statements = []
+    current = []
+    quote = None
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if quote:
+            current.append(char)
+            if char == '\\' and quote != '`' and i + 1 < len(text):
+                current.append(text[i + 1])
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in ("'", '"', '`'):
+            quote = char
+            current.append(char)
+        elif text.startswith('--', i) or char == '#':
+            # Skip to the end of the line
+            end = text.find('\n', i)
+            i = len(text) if end == -1 else end
+            continue
+        elif char == ';':
+            statement = ''.join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+        else:
+            current.append(char)
+        i += 1
+
+    statement = ''.join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+def run_sql_file(engine, path, skip=()):
+    """
+    Execute every statement in a SQL file
+
+    Result sets (e.g. the verification SELECTs at the end of each script)
+    are read and discarded.
+
+    Args:
+        engine: SQLAlchemy engine
+        path: Path of the .sql file
+        skip: Statement prefixes to skip (case-insensitive), e.g. ('USE ',)
+
+    Returns:
+        int: Number of statements executed
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        statements = split_sql(f.read())
+
+    skip = tuple(prefix.upper() for prefix in skip)
+    executed = 0
+    with engine.begin() as conn:
+        for statement in statements:
+            if skip and statement.upper().startswith(skip):
+                continue
+            for translated in translate(statement, engine.dialect.name, conn):
+                result = conn.exec_driver_sql(translated)
+                if result.returns_rows:
+                    result.fetchall()
+            executed += 1
+    return executed
+
+
+def named_queries(path):
+    """
+    The numbered queries of a script like sql/03_analysis_queries.sql
+
+    Each query follows a '-- QUERY <n>: <title>' comment; only the first
+    statement after the comment belongs to the query.
+
+    Returns:
+        list: (number, title, statement) tuples in file order
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        parts = re.split(r'^-- QUERY (\d+): (.*)$', f.read(), flags=re.MULTILINE)
+
+    queries = []
+    for i in range(1, len(parts) - 2, 3):
+        statements = split_sql(parts[i + 2])
+        if statements:
+            queries.append((int(parts[i]), parts[i + 1].strip(), statements[0]))
+    return queries
@@ -0,0 +1,304 @@
+"""
+Synthetic openFDA Data Generator
+Writes NDC and drug shortage JSON files shaped like the openFDA downloads
+(see data/DATA_SOURCE.md), at a multiple of the current real data size, so
+the pipeline can be benchmarked before the real data grows.
+
+At scale 1 the files hold about as many records as the real downloads:
+  - 131,118 NDC products (~1.8% duplicate product_ndc values), with
+    about 1.9 packages per product
+  - 1,838 shortage records (~1.5% duplicate package_ndc values); about 90%
+    of them name a package that exists in the NDC data, one in ten of
+    those written another way (without hyphens or leading zeros)
+Labeler (company) portfolio sizes are skewed, with a few large labelers and
+many small ones, as in the real data.
+
+Output is deterministic for a given scale and seed, so benchmark runs on
+different days or machines process the same records. Records are written
+one at a time, so even scale 100 needs little memory.
+
+Usage:
+    python scripts/synthetic_data.py --scale 10 --out bench/10x/data
+    python scripts/synthetic_data.py --scale 0.1 --seed 7
+"""
+
+import argparse
+import json
+import os
+import random
+
+from process_data import NDC_FILE, SHORTAGES_FILE
+
+# Record counts of the real downloads (see README.md)
+BASE_NDC_PRODUCTS = 131118
+BASE_SHORTAGES = 1838
+
+# Bumped whenever the generated records change shape, so benchmark results
+# from different generator versions are not compared with each other
+GENERATOR_VERSION = 2
+
+DEFAULT_SEED = 42
+
+DUPLICATE_PRODUCT_RATE = 0.018
+DUPLICATE_SHORTAGE_RATE = 0.015
+SHORTAGE_MATCH_RATE = 0.9
+SHORTAGE_NDC_VARIANT_RATE = 0.1
+MULTI_PACKAGE_RATE = 0.4
+
+INGREDIENTS = [
+    'ACETAMINOPHEN', 'AMOXICILLIN', 'ATORVASTATIN CALCIUM', 'BUPIVACAINE HYDROCHLORIDE', 'CEFAZOLIN SODIUM',
+    'DEXAMETHASONE SODIUM PHOSPHATE', 'EPINEPHRINE', 'FENTANYL CITRATE', 'FUROSEMIDE', 'HEPARIN SODIUM',
+    'IBUPROFEN', 'LIDOCAINE HYDROCHLORIDE', 'LISINOPRIL', 'METFORMIN HYDROCHLORIDE', 'METHYLPHENIDATE',
+    'MORPHINE SULFATE', 'ONDANSETRON', 'POTASSIUM CHLORIDE', 'SODIUM BICARBONATE', 'VANCOMYCIN HYDROCHLORIDE',
+]
+
+ROUTES = [
+    (['ORAL'], 50), (['INTRAVENOUS'], 12), (['INTRAMUSCULAR', 'INTRAVENOUS'], 6), (['SUBCUTANEOUS'], 5),
+    (['TOPICAL'], 12), (['RESPIRATORY (INHALATION)'], 3), (['OPHTHALMIC'], 3), (['NASAL'], 2),
+    (['TRANSDERMAL'], 2), (['RECTAL'], 1),
+]
+
+DOSAGE_FORMS = {
+    'ORAL': ['TABLET', 'TABLET, FILM COATED', 'CAPSULE', 'SOLUTION', 'SUSPENSION'],
+    'INTRAVENOUS': ['INJECTION, SOLUTION', 'INJECTION, POWDER, LYOPHILIZED, FOR SOLUTION'],
+    'TOPICAL': ['CREAM', 'OINTMENT', 'GEL', 'LOTION'],
+}
+OTHER_DOSAGE_FORMS = ['INJECTION, SOLUTION', 'SPRAY', 'PATCH', 'SUPPOSITORY', 'AEROSOL, METERED']
+
+CONTAINERS = [('BOTTLE', 45), ('VIAL', 15), ('BLISTER PACK', 10), ('CARTON', 15), ('KIT', 2),
+              ('TUBE', 6), ('BAG', 4), ('SYRINGE', 3)]
+
+MARKETING_CATEGORIES = [('ANDA', 40), ('NDA', 12), ('OTC MONOGRAPH DRUG', 25), ('BLA', 5),
+                        ('UNAPPROVED DRUG OTHER', 8), ('NDA AUTHORIZED GENERIC', 4), ('BULK INGREDIENT', 6)]
+
+SHORTAGE_STATUSES = [('Current', 45), ('Resolved', 40), ('To Be Discontinued', 15)]
+
+THERAPEUTIC_CATEGORIES = ['Anesthesia', 'Analgesia', 'Cardiovascular', 'Endocrinology', 'Infectious Disease',
+                          'Neurology', 'Oncology', 'Pediatric', 'Psychiatry', 'Pulmonary/Allergy']
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _ndc_date(rng):
+    """openFDA NDC date (YYYYMMDD)"""
+    return f"{rng.randint(1985, 2025)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}"
+
+
+def _shortage_date(rng):
+    """openFDA shortage date (MM/DD/YYYY)"""
+    return f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{rng.randint(2012, 2025)}"
+
+
+class Catalog:
+    """Labelers and products of one synthetic dataset"""
+
+    def __init__(self, scale, seed=DEFAULT_SEED):
+        self.scale = scale
+        self.seed = seed
+        self.products = max(int(BASE_NDC_PRODUCTS * scale), 1)
+        self.shortages = max(int(BASE_SHORTAGES * scale), 1)
+        self.labelers = max(self.products // 20, 1)
+
+    def labeler_name(self, index):
+        return f"Synthetic Pharma {index:05d} Inc."
+
+    def labeler_of(self, index):
+        """Labeler of the index-th product (fixed, so shortages can name it too)"""
+        # Cubing a well-mixed fraction favours low indexes: a few labelers own most products
+        fraction = (index * 2654435761 % 2 ** 32) / 2 ** 32
+        return int(self.labelers * fraction ** 3)
+
+    def product_ndc(self, index):
+        """Unique product_ndc of the index-th distinct product (labeler-product format)"""
+        return f"{70000 + index // 10000:05d}-{index % 10000:04d}"
+
+    def package_count(self, index):
+        # Mean ~1.9 packages per product, some products have none
+        return (0, 1, 1, 1, 2, 2, 3, 4, 2, 3)[index % 10]
+
+
+def ndc_record(catalog, index, rng):
+    """One openFDA NDC product record"""
+    route = _weighted(rng, ROUTES)
+    ingredient = rng.choice(INGREDIENTS)
+    labeler = catalog.labeler_of(index)
+    product_ndc = catalog.product_ndc(index)
+    category = _weighted(rng, MARKETING_CATEGORIES)
+
+    record = {
+        'product_ndc': product_ndc,
+        'generic_name': ingredient,
+        'labeler_name': catalog.labeler_name(labeler),
+        'dosage_form': rng.choice(DOSAGE_FORMS.get(route[0], OTHER_DOSAGE_FORMS)),
+        'route': route,
+        'product_type': 'HUMAN OTC DRUG' if category.startswith('OTC') else 'HUMAN PRESCRIPTION DRUG',
+        'marketing_category': category,
+        'finished': category != 'BULK INGREDIENT',
+        'marketing_start_date': _ndc_date(rng),
+        'product_id': f"{product_ndc}_{rng.getrandbits(64):016x}",
+        'spl_id': f"{rng.getrandbits(128):032x}",
+        'active_ingredients': [{'name': ingredient, 'strength': f"{rng.choice((5, 10, 25, 50, 100, 500))} mg/1"}],
+        'openfda': {
+            'manufacturer_name': [catalog.labeler_name(labeler)],
+            'is_original_packager': [rng.random() < 0.8],
+        },
+    }
+    if rng.random() < 0.6:
+        record['brand_name'] = f"{ingredient.split()[0].title()}{rng.choice(('', ' XR', ' Plus', 'ex'))}"
+    if not category.startswith(('OTC', 'UNAPPROVED', 'BULK')):
+        record['application_number'] = f"{category.split()[0]}{rng.randint(10000, 219999):06d}"
+
+    packages = catalog.package_count(index)
+    if packages or rng.random() < 0.5:
+        record['packaging'] = [
+            {
+                'package_ndc': f"{product_ndc}-{k:02d}",
+                'description': f"{rng.choice((10, 30, 90, 100, 500))} {record['dosage_form'].split(',')[0]} "
+                               f"in 1 {_weighted(rng, CONTAINERS)} ({product_ndc}-{k:02d})",
+                'marketing_start_date': record['marketing_start_date'],
+                'sample': False,
+            }
+            for k in range(1, packages + 1)
+        ]
+    return record
+
+
+def _ndc_variant(package_ndc, rng):
+    """The same package NDC written another way: without hyphens, or without leading zeros"""
+    labeler, product, package = package_ndc.split('-')
+    if rng.random() < 0.5:
+        return labeler + product + package
+    return f"{labeler}-{product.lstrip('0') or '0'}-{package.lstrip('0') or '0'}"
+
+
+def shortage_record(catalog, index, rng):
+    """One openFDA drug shortage record"""
+    if rng.random() < MULTI_PACKAGE_RATE:
+        # Neighbouring records share a product, so some shortages span several of its packages
+        product = index // 2 * 7919 % catalog.products
+    else:
+        product = rng.randrange(catalog.products)
+    if rng.random() < SHORTAGE_MATCH_RATE:
+        # Points at an existing package (packages are numbered from 01)
+        while catalog.package_count(product) == 0:
+            product = (product + 1) % catalog.products
+        package_ndc = f"{catalog.product_ndc(product)}-{rng.randint(1, catalog.package_count(product)):02d}"
+        if rng.random() < SHORTAGE_NDC_VARIANT_RATE:
+            package_ndc = _ndc_variant(package_ndc, rng)
+    else:
+        package_ndc = f"{90000 + index // 10000:05d}-{index % 10000:04d}-01"
+
+    record = {
+        'package_ndc': package_ndc,
+        'generic_name': f"{INGREDIENTS[product % len(INGREDIENTS)].title()} Injection",
+        'company_name': catalog.labeler_name(catalog.labeler_of(product)),
+        'status': _weighted(rng, SHORTAGE_STATUSES),
+        'therapeutic_category': rng.sample(THERAPEUTIC_CATEGORIES, rng.randint(1, 2)),
+        'update_date': _shortage_date(rng),
+        'presentation': f"{rng.choice(INGREDIENTS).title()}, {rng.choice(('Injection', 'Tablet', 'Solution'))}",
+        'update_type': rng.choice(('Reverified', 'Revised', 'New')),
+    }
+    if rng.random() < 0.95:
+        record['initial_posting_date'] = _shortage_date(rng)
+    if rng.random() < 0.8:
+        record['contact_info'] = f"Customer Service: 1-800-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}"
+    return record
+
+
+def write_results(path, records, total):
+    """Write {"meta": {...}, "results": [...]} one record at a time"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    meta = {'disclaimer': 'Synthetic data generated by scripts/synthetic_data.py',
+            'results': {'skip': 0, 'limit': total, 'total': total}}
+    tmp_file = path + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write('{"meta": ' + json.dumps(meta) + ', "results": [\n')
+        for i, record in enumerate(records):
+            if i:
+                f.write(',\n')
+            f.write(json.dumps(record))
+        f.write('\n]}\n')
+    os.replace(tmp_file, path)
+
+
+def generate_ndc(catalog, path):
+    """Write the NDC file; returns the number of records"""
+    rng = random.Random(f"ndc-{catalog.seed}")
+    duplicates = int(catalog.products * DUPLICATE_PRODUCT_RATE)
+    total = catalog.products + duplicates
+
+    def records():
+        # Duplicates repeat an earlier product_ndc with fresh attributes and
+        # are spread evenly through the file
+        next_product = 0
+        for i in range(total):
+            new_products = catalog.products - next_product
+            if next_product and rng.random() >= new_products / (total - i):
+                yield ndc_record(catalog, rng.randrange(next_product), rng)
+            else:
+                yield ndc_record(catalog, next_product, rng)
+                next_product += 1
+
+    write_results(path, records(), total)
+    return total
+
+
+def generate_shortages(catalog, path):
+    """Write the drug shortage file; returns the number of records"""
+    rng = random.Random(f"shortages-{catalog.seed}")
+    total = catalog.shortages
+    seen = []
+
+    def records():
+        for i in range(total):
+            if seen and rng.random() < DUPLICATE_SHORTAGE_RATE:
+                record = shortage_record(catalog, i, rng)
+                record['package_ndc'] = rng.choice(seen)
+            else:
+                record = shortage_record(catalog, i, rng)
+                seen.append(record['package_ndc'])
+            yield record
+
+    write_results(path, records(), total)
+    return total
+
+
+def generate(scale, out_dir='data', seed=DEFAULT_SEED):
+    """
+    Write both openFDA-shaped files into out_dir (same file names as the downloads)
+
+    Returns:
+        dict: Generator settings and record counts, e.g. for a benchmark report
+    """
+    catalog = Catalog(scale, seed)
+    ndc_path = os.path.join(out_dir, os.path.basename(NDC_FILE))
+    shortages_path = os.path.join(out_dir, os.path.basename(SHORTAGES_FILE))
+    return {
+        'scale': scale,
+        'seed': seed,
+        'generator_version': GENERATOR_VERSION,
+        'ndc_records': generate_ndc(catalog, ndc_path),
+        'shortage_records': generate_shortages(catalog, shortages_path),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic openFDA NDC and drug shortage files")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="multiple of the current real data size (default: 1)")
+    parser.add_argument('--out', default='data',
+                        help="output directory (default: data, replacing downloaded files)")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED,
+                        help=f"random seed (default: {DEFAULT_SEED})")
+    args = parser.parse_args()
+
+    print(f"Generating synthetic openFDA data at {args.scale}x into {args.out}/...")
+    info = generate(args.scale, args.out, args.seed)
+    print(f"  ✓ {info['ndc_records']} NDC records, {info['shortage_records']} shortage records")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+Intermediate Table Formats
+Reads and writes the processed tables handed from process_data.py to
+load_to_mysql.py in one of three formats:
+
+  - csv:     plain text, always available (default, compatible with older runs)
+  - parquet: columnar and compressed, read back with memory mapping
+  - feather: uncompressed Arrow IPC, memory-mapped so fixed-width columns
+             are read without copying
+
+Parquet and Feather need pyarrow (pip install pyarrow). Their Arrow schemas
+mirror the column types in sql/01_create_tables.sql, so nothing has to be
+re-parsed or re-inferred between the two stages. Dates are parsed once by
+process_data.py: CSV files hold them as YYYY-MM-DD text, which MySQL reads
+into DATE columns directly, and the columnar formats store them as date32.
+"""
+
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+FORMATS = ('csv', 'parquet', 'feather')
+
+FILE_EXTENSIONS = {
+    'csv': '.csv',
+    'parquet': '.parquet',
+    'feather': '.feather',
+}
+
+# MySQL table -> processed file name (without extension), in load order
+TABLE_FILES = {
+    'labelers': 'labelers',
+    'raw_ndc': 'ndc_core',
+    'raw_ndc_packaging': 'ndc_packaging',
+    'raw_drug_shortages': 'drug_shortages_core',
+    'shortage_contacts': 'shortage_contacts',
+    'shortage_ndc_matches': 'shortage_ndc_matches',
+}
+
+# Column types of each processed table, matching sql/01_create_tables.sql.
+# VARCHAR/TEXT columns are strings, BIGINT columns are ints, BOOLEAN
+# columns are bools and DATE columns are dates; the AUTO_INCREMENT ids and
+# generated columns are assigned by MySQL and are not part of the files.
+TABLE_COLUMNS = {
+    'labelers': {
+        'labeler_id': 'int',
+        'labeler_name': 'string',
+    },
+    'ndc_core': {
+        'product_ndc': 'string',
+        'generic_name': 'string',
+        'labeler_name': 'string',
+        'labeler_id': 'int',
+        'brand_name': 'string',
+        'finished': 'bool',
+        'marketing_category': 'string',
+        'dosage_form': 'string',
+        'route': 'string',
+        'product_type': 'string',
+        'marketing_start_date': 'date',
+        'application_number': 'string',
+    },
+    'ndc_packaging': {
+        'product_ndc': 'string',
+        'package_ndc': 'string',
+        'description': 'string',
+        'marketing_start_date': 'date',
+    },
+    'drug_shortages_core': {
+        'package_ndc': 'string',
+        'generic_name': 'string',
+        'company_name': 'string',
+        'status': 'string',
+        'therapeutic_category': 'string',
+        'initial_posting_date': 'date',
+        'update_date': 'date',
+        'dosage_form': 'string',
+        'reason': 'string',
+    },
+    'shortage_contacts': {
+        'package_ndc': 'string',
+        'contact_info': 'string',
+    },
+    'shortage_ndc_matches': {
+        'package_ndc': 'string',
+        'ndc11': 'string',
+        'matched_package_ndc': 'string',
+        'product_ndc': 'string',
+        'match_method': 'string',
+        'match_score': 'int',
+    },
+}
+
+
+def require_pyarrow(fmt):
+    """Raise a helpful error if a columnar format is requested without pyarrow"""
+    if fmt != 'csv' and pa is None:
+        raise ImportError(f"The '{fmt}' format requires pyarrow. Install it with: pip install pyarrow")
+
+
+def table_path(name, fmt='csv', data_dir='data'):
+    """Path of a processed table, e.g. table_path('ndc_core', 'parquet')"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'. Choose from: {', '.join(FORMATS)}")
+    return os.path.join(data_dir, name + FILE_EXTENSIONS[fmt])
+
+
+def arrow_schema(name):
+    """Arrow schema of a processed table"""
+    types = {'string': pa.string(), 'int': pa.int64(), 'bool': pa.bool_(), 'date': pa.date32()}
+    return pa.schema([(col, types[kind]) for col, kind in TABLE_COLUMNS[name].items()])
+
+
+def _as_text(value):
+    """Return value as a string, keeping missing values (None/NaN/NA) as None"""
+    if value is None or isinstance(value, str):
+        return value
+    if value is pd.NA or (isinstance(value, float) and value != value):
+        return None
+    return str(value)
+
+
+def _as_date(value):
+    """Return value as a datetime.date, keeping missing values (None/NaT) as None"""
+    if value is None or pd.isna(value):
+        return None
+    return pd.Timestamp(value).date()
+
+
+def to_arrow(df, name):
+    """
+    Convert a processed DataFrame to an Arrow table with the table's schema
+
+    Nested values (e.g. route or therapeutic_category lists) are stored as
+    str(value), which is the same text the CSV format writes.
+    """
+    columns = TABLE_COLUMNS[name]
+    df = df.reindex(columns=list(columns))
+    # Object columns, so an empty batch does not turn into float64
+    for col, kind in columns.items():
+        if kind == 'string':
+            df[col] = pd.Series([_as_text(value) for value in df[col].to_numpy(dtype=object)],
+                                index=df.index, dtype=object)
+        elif kind == 'int':
+            df[col] = df[col].astype('Int64')
+        elif kind == 'date':
+            df[col] = pd.Series([_as_date(value) for value in df[col].to_numpy(dtype=object)],
+                                index=df.index, dtype=object)
+    return pa.Table.from_pandas(df, schema=arrow_schema(name), preserve_index=False)
+
+
+class TableWriter:
+    """
+    Write a processed table in one go or as a sequence of batches
+
+    Example:
+        with TableWriter('ndc_core', 'parquet') as writer:
+            for batch in batches:
+                writer.write(batch)
+    """
+
+    def __init__(self, name, fmt='csv', data_dir='data'):
+        require_pyarrow(fmt)
+        self.name = name
+        self.fmt = fmt
+        self.path = table_path(name, fmt, data_dir)
+        self.rows = 0
+        self._writer = None
+        self._columns = None
+
+    def write(self, df):
+        """Append a DataFrame to the table"""
+        if self.fmt == 'csv':
+            # First batch creates the file with a header, later batches append
+            first = self._columns is None
+            if first:
+                self._columns = list(df.columns)
+            df.to_csv(self.path, mode='w' if first else 'a', header=first, index=False,
+                      date_format='%Y-%m-%d')
+        else:
+            table = to_arrow(df, self.name)
+            if self._writer is None:
+                self._writer = self._open(table.schema)
+            self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        """Finish the file (an empty table still gets a header/schema)"""
+        if self.fmt == 'csv':
+            if self._columns is None:
+                pd.DataFrame(columns=list(TABLE_COLUMNS[self.name])).to_csv(self.path, index=False)
+        else:
+            if self._writer is None:
+                self._writer = self._open(arrow_schema(self.name))
+            self._writer.close()
+
+    def _open(self, schema):
+        if self.fmt == 'parquet':
+            return pq.ParquetWriter(self.path, schema)
+        # Uncompressed so the loader can memory-map it without copying
+        options = pa.ipc.IpcWriteOptions(compression=None)
+        return pa.ipc.new_file(self.path, schema, options=options)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def write_table(df, name, fmt='csv', data_dir='data'):
+    """Write a whole processed table"""
+    with TableWriter(name, fmt, data_dir) as writer:
+        writer.write(df)
+
+
+def read_arrow(name, fmt='csv', data_dir='data', columns=None):
+    """
+    Read a columnar processed table as an Arrow table using memory mapping
+
+    Feather files are uncompressed, so their buffers point straight into the
+    mapped file. With columns, Parquet only decodes those columns.
+    """
+    require_pyarrow(fmt)
+    path = table_path(name, fmt, data_dir)
+    if fmt == 'parquet':
+        return pq.read_table(path, columns=columns, memory_map=True)
+    if fmt == 'feather':
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        return table if columns is None else table.select(columns)
+    raise ValueError("read_arrow() only supports the parquet and feather formats")
+
+
+def read_schema(name, fmt, data_dir='data'):
+    """Arrow schema stored in a columnar processed file, without reading its data"""
+    require_pyarrow(fmt)
+    path = table_path(name, fmt, data_dir)
+    if fmt == 'parquet':
+        return pq.read_schema(path)
+    if fmt == 'feather':
+        return pa.ipc.open_file(pa.memory_map(path, 'r')).schema
+    raise ValueError("read_schema() only supports the parquet and feather formats")
+
+
+def read_csv(path, name, columns=None):
+    """Read a CSV file holding (part of) processed table name into a DataFrame"""
+    # Keep text columns as text (e.g. '00002-1234' must not become an int).
+    # Dates stay as their YYYY-MM-DD text, which MySQL accepts as is.
+    # Integer columns may be empty, so they use the nullable Int64 type.
+    dtypes = {col: 'Int64' if kind == 'int' else 'object' for col, kind in TABLE_COLUMNS[name].items()
+              if kind in ('string', 'int', 'date')}
+    return pd.read_csv(path, dtype=dtypes, usecols=columns)
+
+
+def read_table(name, fmt='csv', data_dir='data', columns=None):
+    """Read a processed table (or only some of its columns) into a DataFrame"""
+    if fmt == 'csv':
+        return read_csv(table_path(name, fmt, data_dir), name, columns)
+    return read_arrow(name, fmt, data_dir, columns).to_pandas()
@@ -0,0 +1,376 @@
+"""
+SQL Transformation Step
+Builds or refreshes the enriched shortages_with_ndc table from Python.
+
+  - Full rebuild: runs sql/02_transformations.sql (build under a temporary
+    name, then swap into place with RENAME TABLE).
+  - Incremental refresh: reads pipeline_change_log past the last watermark,
+    recomputes only the enriched rows whose shortage, NDC match, packaging
+    or NDC inputs changed, copies the rest, and swaps the result into place
+    the same way. Readers always see either the old or the new table.
+
+A full rebuild happens automatically when the table does not exist yet, no
+watermark is recorded, or a table was reloaded in full (append mode).
+After a successful refresh the change log rows already consumed are pruned.
+The embedded backends (FDA_DB_BACKEND=duckdb or sqlite) always rebuild in
+full: the incremental refresh relies on MySQL-only statements, and DuckDB
+rebuilds the table with a few column scans.
+
+Afterwards the summary tables the dashboard reads (manufacturer risk,
+multi-package shortages, key metrics) are rebuilt from the enriched table
+with sql/02b_summary_tables.sql, unless the enriched table was already up
+to date. A new data version (pipeline_data_version) is published only when
+the summaries' contents changed, so the dashboard keeps its caches across
+refreshes that change nothing.
+
+Usage:
+    python scripts/transform_data.py          # refresh only what changed
+    python scripts/transform_data.py --full   # force a full rebuild
+"""
+
+import argparse
+import hashlib
+import re
+import sys
+import time
+
+import pandas as pd
+
+from database import database_label, get_engine, pool_metrics
+from delta_load import prune_change_log
+from instrumentation import RunReport
+from sql_dialects import translate
+from sql_runner import run_sql_file, split_sql
+
+TRANSFORMATIONS_SQL = 'sql/02_transformations.sql'
+SUMMARY_SQL = 'sql/02b_summary_tables.sql'
+
+TARGET_TABLE = 'shortages_with_ndc'
+
+NEW_TABLE = f"{TARGET_TABLE}_new"
+
+# The enriched SELECT of sql/02_transformations.sql, split after the
+# shortage_id column and before the FROM clause
+ENRICHED_SELECT = re.compile(
+    rf"^CREATE TABLE {NEW_TABLE} AS\s+SELECT\s+ROW_NUMBER\(\) OVER \(ORDER BY s\.package_ndc\) AS shortage_id,"
+    r"(?P<columns>.+?)\s(?P<joins>FROM raw_drug_shortages s\s.+)$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def enriched_query(path=TRANSFORMATIONS_SQL):
+    """
+    Column list and FROM/JOIN clause of the enriched table, read from
+    sql/02_transformations.sql so the incremental refresh computes rows
+    exactly as a full rebuild does
+
+    Returns:
+        tuple: (columns after shortage_id, FROM ... JOIN ... clause)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        statements = split_sql(f.read())
+    for statement in statements:
+        match = ENRICHED_SELECT.match(statement)
+        if match:
+            return match.group('columns').strip(), match.group('joins').strip()
+    raise ValueError(f"{path} has no 'CREATE TABLE {NEW_TABLE} AS SELECT ROW_NUMBER() ... AS shortage_id, "
+                     f"... FROM raw_drug_shortages s ...' statement for the incremental refresh to reuse")
+
+
+# ============================================
+# Change Tracking
+# ============================================
+
+def table_exists(conn, table_name):
+    return conn.exec_driver_sql(
+        f"SELECT COUNT(*) FROM information_schema.tables "
+        f"WHERE table_schema = DATABASE() AND table_name = '{table_name}'"
+    ).scalar() > 0
+
+
+def get_watermark(conn, consumer=TARGET_TABLE):
+    """Last change_id the consumer has been refreshed up to (None if never)"""
+    return conn.exec_driver_sql(
+        f"SELECT last_change_id FROM pipeline_watermarks WHERE consumer = '{consumer}'"
+    ).scalar()
+
+
+def set_watermark(conn, change_id, consumer=TARGET_TABLE):
+    conn.exec_driver_sql(
+        f"INSERT INTO pipeline_watermarks (consumer, last_change_id) VALUES ('{consumer}', {int(change_id)}) "
+        f"AS new ON DUPLICATE KEY UPDATE last_change_id = new.last_change_id"
+    )
+
+
+def latest_change_id(conn):
+    return conn.exec_driver_sql("SELECT COALESCE(MAX(change_id), 0) FROM pipeline_change_log").scalar()
+
+
+def collect_affected_packages(conn, since, upto):
+    """
+    Fill the temporary table tmp_affected_packages with every package_ndc
+    whose enriched row may have changed between two change_ids
+
+    Returns:
+        int: Number of distinct affected package_ndc values
+    """
+    window = f"c.change_id > {int(since)} AND c.change_id <= {int(upto)}"
+
+    conn.exec_driver_sql("DROP TEMPORARY TABLE IF EXISTS tmp_affected_packages")
+    conn.exec_driver_sql("CREATE TEMPORARY TABLE tmp_affected_packages (package_ndc VARCHAR(30) PRIMARY KEY)")
+
+    # Shortage and match changes are keyed by the shortage's package_ndc directly
+    conn.exec_driver_sql(
+        f"INSERT IGNORE INTO tmp_affected_packages "
+        f"SELECT c.natural_key FROM pipeline_change_log c "
+        f"WHERE {window} AND c.table_name IN ('raw_drug_shortages', 'shortage_ndc_matches') "
+        f"AND c.natural_key IS NOT NULL"
+    )
+    # A catalog package change affects the shortages matched to it...
+    conn.exec_driver_sql(
+        f"INSERT IGNORE INTO tmp_affected_packages "
+        f"SELECT m.package_ndc FROM pipeline_change_log c "
+        f"JOIN shortage_ndc_matches m ON m.matched_package_ndc = c.natural_key "
+        f"WHERE {window} AND c.table_name = 'raw_ndc_packaging'"
+    )
+    # ...and a product change the shortages matched to the product...
+    conn.exec_driver_sql(
+        f"INSERT IGNORE INTO tmp_affected_packages "
+        f"SELECT m.package_ndc FROM pipeline_change_log c "
+        f"JOIN shortage_ndc_matches m ON m.product_ndc = c.natural_key "
+        f"WHERE {window} AND c.table_name = 'raw_ndc'"
+    )
+    # ...including packages already enriched from a product that is now gone
+    conn.exec_driver_sql(
+        f"INSERT IGNORE INTO tmp_affected_packages "
+        f"SELECT e.package_ndc FROM pipeline_change_log c "
+        f"JOIN {TARGET_TABLE} e ON e.product_ndc = c.natural_key "
+        f"WHERE {window} AND c.table_name = 'raw_ndc' AND e.package_ndc IS NOT NULL"
+    )
+    return conn.exec_driver_sql("SELECT COUNT(*) FROM tmp_affected_packages").scalar()
+
+
+# ============================================
+# Refresh
+# ============================================
+
+def swap_into_place(conn, new_table, table_name=TARGET_TABLE):
+    """Atomically replace table_name with new_table"""
+    conn.exec_driver_sql(f"DROP TABLE IF EXISTS {table_name}_old")
+    conn.exec_driver_sql(
+        f"RENAME TABLE {table_name} TO {table_name}_old, {new_table} TO {table_name}"
+    )
+    conn.exec_driver_sql(f"DROP TABLE {table_name}_old")
+
+
+def rebuild_full(engine):
+    """Rebuild the enriched table and views with sql/02_transformations.sql"""
+    run_sql_file(engine, TRANSFORMATIONS_SQL, skip=('USE ',))
+    with engine.connect() as conn:
+        return conn.exec_driver_sql(f"SELECT COUNT(*) FROM {TARGET_TABLE}").scalar()
+
+
+def refresh_summaries(engine):
+    """
+    Rebuild the summary tables with sql/02b_summary_tables.sql
+
+    Call publish_data_version() afterwards to let the dashboard see the
+    new summaries.
+
+    Returns:
+        dict: Summary table name -> row count
+    """
+    run_sql_file(engine, SUMMARY_SQL, skip=('USE ',))
+    with engine.connect() as conn:
+        return dict(conn.exec_driver_sql(
+            "SELECT table_name, row_count FROM summary_table_refresh ORDER BY table_name"
+        ).fetchall())
+
+
+def summary_fingerprint(conn, table_names):
+    """MD5 of the summary tables' contents, independent of row order"""
+    digest = hashlib.md5()
+    for table_name in sorted(table_names):
+        frame = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
+        frame = frame.sort_values(list(frame.columns), ignore_index=True)
+        digest.update(f"{table_name}:{','.join(frame.columns)}".encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def publish_data_version(engine, table_names):
+    """
+    Publish a new data version if the summary tables' contents changed
+
+    Returns:
+        int or None: The new refresh_id, or None when the contents match the
+        latest published version
+    """
+    with engine.begin() as conn:
+        content_hash = summary_fingerprint(conn, table_names)
+        latest = conn.exec_driver_sql(
+            "SELECT content_hash FROM pipeline_data_version ORDER BY refresh_id DESC LIMIT 1"
+        ).scalar()
+        if latest == content_hash:
+            return None
+        (insert,) = translate(
+            "INSERT INTO pipeline_data_version (refreshed_at, content_hash) "
+            f"VALUES (CURRENT_TIMESTAMP(3), '{content_hash}')",
+            engine.dialect.name,
+        )
+        conn.exec_driver_sql(insert)
+        return conn.exec_driver_sql("SELECT MAX(refresh_id) FROM pipeline_data_version").scalar()
+
+
+def refresh_incremental(conn, since, upto):
+    """
+    Recompute only the affected enriched rows and swap the result into place
+
+    Unaffected rows are copied as they are. Recomputed rows keep their
+    existing shortage_id; new rows are numbered after the current maximum.
+
+    Returns:
+        tuple: (enriched rows recomputed, distinct affected package_ndc values)
+    """
+    new_table = NEW_TABLE
+    columns, joins = enriched_query()
+
+    affected = collect_affected_packages(conn, since, upto)
+    max_id = conn.exec_driver_sql(f"SELECT COALESCE(MAX(shortage_id), 0) FROM {TARGET_TABLE}").scalar()
+
+    # Same columns and indexes as the live table
+    conn.exec_driver_sql(f"DROP TABLE IF EXISTS {new_table}")
+    conn.exec_driver_sql(f"CREATE TABLE {new_table} LIKE {TARGET_TABLE}")
+
+    # Copy every row whose inputs did not change
+    conn.exec_driver_sql(
+        f"INSERT INTO {new_table} "
+        f"SELECT e.* FROM {TARGET_TABLE} e "
+        f"LEFT JOIN tmp_affected_packages a ON a.package_ndc = e.package_ndc "
+        f"WHERE e.package_ndc IS NOT NULL AND a.package_ndc IS NULL"
+    )
+
+    # Recompute affected rows (and the few rows without a package_ndc)
+    recomputed = conn.exec_driver_sql(
+        f"INSERT INTO {new_table} "
+        f"SELECT COALESCE(old.shortage_id, {int(max_id)} + ROW_NUMBER() OVER (ORDER BY s.package_ndc)) "
+        f"AS shortage_id, {columns} {joins} "
+        f"LEFT JOIN {TARGET_TABLE} old ON old.package_ndc = s.package_ndc "
+        f"LEFT JOIN tmp_affected_packages a ON a.package_ndc = s.package_ndc "
+        f"WHERE s.package_ndc IS NULL OR a.package_ndc IS NOT NULL"
+    ).rowcount
+
+    swap_into_place(conn, new_table)
+    conn.exec_driver_sql("DROP TEMPORARY TABLE IF EXISTS tmp_affected_packages")
+    return recomputed, affected
+
+
+def refresh(engine, full=False):
+    """
+    Bring shortages_with_ndc up to date with the raw tables
+
+    Returns:
+        dict: {'mode': 'full' | 'incremental' | 'up-to-date', 'rows': int, 'seconds': float}
+    """
+    start = time.perf_counter()
+
+    if engine.dialect.name != 'mysql':
+        rows = rebuild_full(engine)
+        return {'mode': 'full', 'rows': rows, 'seconds': time.perf_counter() - start}
+
+    with engine.begin() as conn:
+        since = get_watermark(conn)
+        upto = latest_change_id(conn)
+        exists = table_exists(conn, TARGET_TABLE)
+        reloaded = since is not None and conn.exec_driver_sql(
+            f"SELECT COUNT(*) FROM pipeline_change_log "
+            f"WHERE change_id > {int(since)} AND change_type = 'reload'"
+        ).scalar() > 0
+
+    if full or since is None or not exists or reloaded:
+        rows = rebuild_full(engine)
+        with engine.begin() as conn:
+            prune_change_log(conn)
+        return {'mode': 'full', 'rows': rows, 'seconds': time.perf_counter() - start}
+
+    if upto <= since:
+        return {'mode': 'up-to-date', 'rows': 0, 'seconds': time.perf_counter() - start}
+
+    # Temporary tables are per connection, so the whole refresh uses one
+    with engine.begin() as conn:
+        rows, affected = refresh_incremental(conn, since, upto)
+        set_watermark(conn, upto)
+        prune_change_log(conn)
+
+    return {'mode': 'incremental', 'rows': rows, 'affected_packages': affected,
+            'seconds': time.perf_counter() - start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or refresh the enriched shortages_with_ndc table")
+    parser.add_argument('--full', action='store_true',
+                        help="rebuild everything with sql/02_transformations.sql")
+    parser.add_argument('--skip-summaries', action='store_true',
+                        help="do not rebuild the dashboard summary tables")
+    args = parser.parse_args()
+
+    print("Starting SQL transformations...")
+
+    try:
+        engine = get_engine(pool_size=1)
+        print(f"✓ Connected to {database_label()}")
+    except Exception as e:
+        print(f"✗ Error connecting to {database_label()}: {e}")
+        sys.exit(1)
+
+    report = RunReport('transform_data', {'full': args.full, 'skip_summaries': args.skip_summaries})
+
+    try:
+        with report.stage('transform') as stage:
+            result = refresh(engine, full=args.full)
+            stage.rows_out = result['rows']
+            stage.extra['mode'] = result['mode']
+        if result['mode'] == 'full':
+            print(f"  ✓ Rebuilt {TARGET_TABLE} ({result['rows']} rows) in {result['seconds']:.2f}s")
+        elif result['mode'] == 'incremental':
+            print(f"  ✓ Refreshed {result['rows']} changed rows of {TARGET_TABLE} "
+                  f"in {result['seconds']:.2f}s")
+        else:
+            print(f"  ✓ {TARGET_TABLE} is already up to date")
+    except Exception as e:
+        print(f"  ✗ Error refreshing {TARGET_TABLE}: {e}")
+        engine.dispose()
+        print(f"Run report: {report.write()}")
+        sys.exit(1)
+
+    try:
+        if args.skip_summaries:
+            pass
+        elif result['mode'] == 'up-to-date':
+            print("  ✓ Summary tables are already up to date")
+        else:
+            with report.stage('materialize') as stage:
+                counts = refresh_summaries(engine)
+                version = publish_data_version(engine, counts)
+                stage.rows_out = sum(counts.values())
+                stage.extra['tables'] = counts
+                stage.extra['data_version'] = version
+            for table_name, rows in counts.items():
+                print(f"  ✓ Refreshed summary table {table_name} ({rows} rows)")
+            if version is None:
+                print("  ✓ Summary contents unchanged; no new data version")
+            else:
+                print(f"  ✓ Published data version {version}")
+    except Exception as e:
+        print(f"  ✗ Error refreshing summary tables: {e}")
+        sys.exit(1)
+    finally:
+        report.extra['connections'] = pool_metrics(engine)
+        engine.dispose()
+        print(f"Run report: {report.write()}")
+
+    print("\nNext step: Run sql/03_analysis_queries.sql or launch the dashboard")
+
+
+if __name__ == "__main__":
+    main()
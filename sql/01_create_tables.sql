@@ -8,11 +8,34 @@ CREATE DATABASE IF NOT EXISTS fda_shortage_db;
 USE fda_shortage_db;
 
 -- Drop tables if they exist (for clean re-runs)
+DROP TABLE IF EXISTS pipeline_data_version;
+DROP TABLE IF EXISTS summary_table_refresh;
+DROP TABLE IF EXISTS labeler_portfolio;
+DROP TABLE IF EXISTS shortage_overview;
+DROP TABLE IF EXISTS current_manufacturer_risk;
+DROP TABLE IF EXISTS manufacturer_risk_analysis;
+DROP TABLE IF EXISTS multi_package_shortages;
+DROP TABLE IF EXISTS pipeline_watermarks;
+DROP TABLE IF EXISTS pipeline_change_log;
+DROP TABLE IF EXISTS shortage_ndc_matches;
 DROP TABLE IF EXISTS shortage_contacts;
 DROP TABLE IF EXISTS shortages_with_ndc;
 DROP TABLE IF EXISTS raw_drug_shortages;
 DROP TABLE IF EXISTS raw_ndc_packaging;
 DROP TABLE IF EXISTS raw_ndc;
+DROP TABLE IF EXISTS labelers;
+
+-- ============================================
+-- Table 0: Labeler Dimension
+-- One row per labeler (manufacturer). labeler_id is assigned by
+-- process_data.py from the normalized labeler name, so manufacturer
+-- analyses join on this integer key instead of comparing names.
+-- ============================================
+CREATE TABLE labelers (
+    labeler_id BIGINT PRIMARY KEY,
+    labeler_name TEXT,
+    row_hash CHAR(32) AS (MD5(JSON_ARRAY(labeler_id, labeler_name))) STORED
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- ============================================
 -- Table 1: Raw NDC Product Data
@@ -22,15 +45,36 @@ CREATE TABLE raw_ndc (
     product_ndc VARCHAR(20) PRIMARY KEY,
     generic_name TEXT,
     labeler_name TEXT,
+    labeler_id BIGINT,  -- labelers.labeler_id, derived from labeler_name
     brand_name TEXT,
     finished BOOLEAN,
     marketing_category VARCHAR(100),
     dosage_form VARCHAR(100),
     route TEXT,
     product_type VARCHAR(100),
-    marketing_start_date VARCHAR(20),
+    marketing_start_date DATE,
     application_number VARCHAR(50),
+    -- Content hash used by load_to_mysql.py --mode delta to find changed rows
+    row_hash CHAR(32) AS (MD5(JSON_ARRAY(
+        product_ndc, generic_name, labeler_name, brand_name, finished, marketing_category,
+        dosage_form, route, product_type, marketing_start_date, application_number
+    ))) STORED,
+    -- Classified once at load time so analyses group by these instead of LIKE '%...%'
+    route_group VARCHAR(20) AS (CASE
+        WHEN route IS NULL THEN NULL
+        WHEN route LIKE '%ORAL%' THEN 'Oral'
+        WHEN route LIKE '%INTRAVENOUS%' OR route LIKE '%IV%' THEN 'Intravenous'
+        WHEN route LIKE '%INJECTION%' THEN 'Injection'
+        WHEN route LIKE '%TOPICAL%' THEN 'Topical'
+        WHEN route LIKE '%INHALATION%' THEN 'Inhalation'
+        ELSE 'Other'
+    END) STORED,
+    drug_type VARCHAR(20) AS (CASE
+        WHEN brand_name IS NOT NULL AND brand_name != '' THEN 'Branded Drug'
+        ELSE 'Generic/Unbranded'
+    END) STORED,
     INDEX idx_labeler (labeler_name(255)),
+    INDEX idx_labeler_id (labeler_id),
     INDEX idx_brand (brand_name(255))
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
@@ -42,7 +86,20 @@ CREATE TABLE raw_ndc_packaging (
     package_ndc VARCHAR(30) PRIMARY KEY,
     product_ndc VARCHAR(20),
     description TEXT,
-    marketing_start_date VARCHAR(20),
+    marketing_start_date DATE,
+    row_hash CHAR(32) AS (MD5(JSON_ARRAY(
+        package_ndc, product_ndc, description, marketing_start_date
+    ))) STORED,
+    -- Classified once at load time (see raw_ndc.route_group)
+    package_type VARCHAR(20) AS (CASE
+        WHEN description IS NULL THEN NULL
+        WHEN description LIKE '%bottle%' THEN 'Bottle'
+        WHEN description LIKE '%vial%' THEN 'Vial'
+        WHEN description LIKE '%blister%' THEN 'Blister Pack'
+        WHEN description LIKE '%carton%' THEN 'Carton'
+        WHEN description LIKE '%kit%' THEN 'Kit'
+        ELSE 'Other/Unknown'
+    END) STORED,
     FOREIGN KEY (product_ndc) REFERENCES raw_ndc(product_ndc)
         ON DELETE CASCADE
         ON UPDATE CASCADE,
@@ -53,6 +110,8 @@ CREATE TABLE raw_ndc_packaging (
 -- Table 3: Drug Shortages Data
 -- FDA drug shortage information
 -- AUTO_INCREMENT primary key for shortage_id
+-- package_ndc is the natural key (unique after processing)
+-- Dates are parsed by process_data.py (openFDA uses MM/DD/YYYY here)
 -- ============================================
 CREATE TABLE raw_drug_shortages (
     shortage_id INT AUTO_INCREMENT PRIMARY KEY,
@@ -61,13 +120,22 @@ CREATE TABLE raw_drug_shortages (
     company_name VARCHAR(255),
     status VARCHAR(50),
     therapeutic_category TEXT,
-    initial_posting_date VARCHAR(20),
-    update_date VARCHAR(20),
+    initial_posting_date DATE,
+    update_date DATE,
     dosage_form TEXT,
     reason TEXT,
-    INDEX idx_package_ndc (package_ndc),
+    -- Start of the shortage: the initial posting date, copied into a stored
+    -- column so it is indexed with status. A later update date is not a
+    -- start date, so rows without a posting date have none.
+    shortage_start_date DATE AS (initial_posting_date) STORED,
+    row_hash CHAR(32) AS (MD5(JSON_ARRAY(
+        package_ndc, generic_name, company_name, status, therapeutic_category,
+        initial_posting_date, update_date, dosage_form, reason
+    ))) STORED,
+    UNIQUE KEY uq_package_ndc (package_ndc),
     INDEX idx_status (status(50)),
-    INDEX idx_company (company_name)
+    INDEX idx_company (company_name),
+    INDEX idx_status_start (status, shortage_start_date)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- ============================================
@@ -78,7 +146,54 @@ CREATE TABLE shortage_contacts (
     contact_id INT AUTO_INCREMENT PRIMARY KEY,
     package_ndc VARCHAR(30),
     contact_info TEXT,
-    INDEX idx_package_ndc (package_ndc)
+    row_hash CHAR(32) AS (MD5(JSON_ARRAY(package_ndc, contact_info))) STORED,
+    UNIQUE KEY uq_package_ndc (package_ndc)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ============================================
+-- Table 4b: Shortage to NDC Matches
+-- How each shortage package_ndc was matched to the NDC catalog, written by
+-- scripts/ndc_matching.py: exact string, normalized 11-digit NDC, or a
+-- fuzzy generic name + company match (a product, no package).
+-- Unmatched shortages have no row.
+-- ============================================
+CREATE TABLE shortage_ndc_matches (
+    package_ndc VARCHAR(30) PRIMARY KEY,  -- raw_drug_shortages.package_ndc
+    ndc11 CHAR(11),                       -- canonical 11-digit (5-4-2) NDC
+    matched_package_ndc VARCHAR(30),      -- raw_ndc_packaging.package_ndc
+    product_ndc VARCHAR(20),              -- raw_ndc.product_ndc
+    match_method VARCHAR(20) NOT NULL,    -- exact, normalized or fuzzy
+    match_score INT,                      -- 100 for NDC matches, 0-100 for fuzzy ones
+    row_hash CHAR(32) AS (MD5(JSON_ARRAY(
+        package_ndc, ndc11, matched_package_ndc, product_ndc, match_method, match_score
+    ))) STORED,
+    INDEX idx_matched_package (matched_package_ndc),
+    INDEX idx_product_ndc (product_ndc)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ============================================
+-- Table 5: Pipeline Change Log
+-- One row per raw-table row changed by load_to_mysql.py --mode delta,
+-- or one 'reload' row per table after a full (append) load.
+-- Lets the transformation step refresh only what changed.
+-- ============================================
+CREATE TABLE pipeline_change_log (
+    change_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    table_name VARCHAR(64) NOT NULL,
+    natural_key VARCHAR(30),
+    change_type VARCHAR(10) NOT NULL,  -- insert, update, delete or reload
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_table_key (table_name, natural_key)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ============================================
+-- Table 6: Pipeline Watermarks
+-- Last change_id each derived table has been refreshed up to
+-- ============================================
+CREATE TABLE pipeline_watermarks (
+    consumer VARCHAR(64) PRIMARY KEY,
+    last_change_id BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- ============================================
@@ -89,10 +204,14 @@ CREATE TABLE shortage_contacts (
 SHOW TABLES;
 
 -- Show structure of each table
+DESCRIBE labelers;
 DESCRIBE raw_ndc;
 DESCRIBE raw_ndc_packaging;
 DESCRIBE raw_drug_shortages;
 DESCRIBE shortage_contacts;
+DESCRIBE shortage_ndc_matches;
+DESCRIBE pipeline_change_log;
+DESCRIBE pipeline_watermarks;
 
 -- Success message
 SELECT 'Database schema created successfully!' AS status;
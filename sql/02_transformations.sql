@@ -10,11 +10,28 @@ USE fda_shortage_db;
 -- MAIN TRANSFORMATION: Join Shortages with NDC Data
 -- This LEFT JOIN enriches shortage data with product details
 -- Satisfies project requirement for SQL transformation
+--
+-- Shortages reach their package and product through shortage_ndc_matches
+-- (scripts/ndc_matching.py), which also matches NDCs written in another
+-- layout or without leading zeros, and falls back to generic name + company.
+--
+-- The table is built under a temporary name and swapped into place with
+-- RENAME TABLE, so dashboard readers never see a half-built table.
+-- (scripts/transform_data.py refreshes only the changed rows between full
+-- rebuilds, reusing the column list and joins of this SELECT.)
 -- ============================================
 
-DROP TABLE IF EXISTS shortages_with_ndc;
+DROP TABLE IF EXISTS shortages_with_ndc_new;
+DROP TABLE IF EXISTS shortages_with_ndc_old;
 
-CREATE TABLE shortages_with_ndc AS
+-- Every change logged so far is in the table built below; changes logged
+-- while it builds are not. Remember the bound now and move the watermark
+-- to it after the swap.
+DELETE FROM pipeline_watermarks WHERE consumer = 'shortages_with_ndc_new';
+INSERT INTO pipeline_watermarks (consumer, last_change_id)
+SELECT 'shortages_with_ndc_new', COALESCE(MAX(change_id), 0) FROM pipeline_change_log;
+
+CREATE TABLE shortages_with_ndc_new AS
 SELECT 
     -- Generate row ID
     ROW_NUMBER() OVER (ORDER BY s.package_ndc) as shortage_id,
@@ -27,35 +44,82 @@ SELECT
     s.therapeutic_category,
     s.initial_posting_date,
     s.update_date,
+    s.shortage_start_date,
     s.dosage_form AS shortage_dosage_form,
     s.reason,
     
     -- Packaging information
-    p.product_ndc,
+    m.product_ndc,
     p.description AS package_description,
     p.marketing_start_date AS package_marketing_start_date,
+    p.package_type,
+    
+    -- How the shortage was matched to the NDC data (NULL = unmatched)
+    m.match_method AS ndc_match_method,
+    m.match_score AS ndc_match_score,
     
     -- Product information from NDC
     n.generic_name AS ndc_generic_name,
     n.labeler_name AS manufacturer,
+    n.labeler_id,
     n.brand_name,
     n.finished,
     n.marketing_category,
     n.dosage_form AS ndc_dosage_form,
     n.route,
     n.product_type,
-    n.application_number
+    n.application_number,
+    
+    -- Pre-classified categories (generated columns of the raw tables)
+    n.route_group,
+    COALESCE(n.drug_type, 'Generic/Unbranded') AS drug_type
     
 FROM raw_drug_shortages s
+LEFT JOIN shortage_ndc_matches m
+    ON m.package_ndc = s.package_ndc
 LEFT JOIN raw_ndc_packaging p 
-    ON s.package_ndc = p.package_ndc
+    ON p.package_ndc = m.matched_package_ndc
 LEFT JOIN raw_ndc n 
-    ON p.product_ndc = n.product_ndc;
+    ON n.product_ndc = m.product_ndc;
 
 -- Add indexes for better query performance
-CREATE INDEX idx_status ON shortages_with_ndc(status(50));
-CREATE INDEX idx_company ON shortages_with_ndc(company_name(100));
-CREATE INDEX idx_product_ndc ON shortages_with_ndc(product_ndc);
+CREATE INDEX idx_status ON shortages_with_ndc_new(status(50));
+CREATE INDEX idx_company ON shortages_with_ndc_new(company_name(100));
+CREATE INDEX idx_product_ndc ON shortages_with_ndc_new(product_ndc);
+CREATE INDEX idx_package_ndc ON shortages_with_ndc_new(package_ndc);
+-- Covering index for the match rate by match method (Query 7)
+CREATE INDEX idx_match_method ON shortages_with_ndc_new(ndc_match_method, product_ndc);
+-- Top-N by shortage duration and "longest active" become index range scans;
+-- shortage_id makes them the keyset order of the dashboard's shortage explorer
+CREATE INDEX idx_status_start ON shortages_with_ndc_new(status, shortage_start_date, shortage_id);
+-- Explorer filters: manufacturer pages keep the keyset order, a therapeutic
+-- category is looked up and its (few) rows sorted
+CREATE INDEX idx_status_company_start ON shortages_with_ndc_new(status, company_name, shortage_start_date, shortage_id);
+CREATE INDEX idx_status_category ON shortages_with_ndc_new(status, therapeutic_category(100));
+-- Explorer search on generic and brand names (MySQL only; the embedded backends scan)
+CREATE FULLTEXT INDEX ft_names ON shortages_with_ndc_new(shortage_generic_name, brand_name);
+-- Covering indexes for the route / package type / brand breakdowns of current shortages
+CREATE INDEX idx_status_route ON shortages_with_ndc_new(status, route_group, product_ndc);
+CREATE INDEX idx_status_package_type ON shortages_with_ndc_new(status, package_type, company_name);
+CREATE INDEX idx_status_drug_type ON shortages_with_ndc_new(status, drug_type, company_name);
+-- Covering index for the per-manufacturer portfolio comparison (Query 10)
+CREATE INDEX idx_status_company_labeler ON shortages_with_ndc_new(status, company_name, labeler_id, product_ndc);
+
+-- Atomic swap (the empty placeholder only matters on the very first run)
+CREATE TABLE IF NOT EXISTS shortages_with_ndc LIKE shortages_with_ndc_new;
+RENAME TABLE shortages_with_ndc TO shortages_with_ndc_old,
+             shortages_with_ndc_new TO shortages_with_ndc;
+DROP TABLE shortages_with_ndc_old;
+
+-- The table now reflects every change logged before the build: move the
+-- watermark forward to the bound read then
+INSERT INTO pipeline_watermarks (consumer, last_change_id)
+SELECT * FROM (
+    SELECT 'shortages_with_ndc' AS consumer, last_change_id AS upto
+    FROM pipeline_watermarks WHERE consumer = 'shortages_with_ndc_new'
+) AS new
+ON DUPLICATE KEY UPDATE last_change_id = new.upto;
+DELETE FROM pipeline_watermarks WHERE consumer = 'shortages_with_ndc_new';
 
 -- ============================================
 -- ANALYSIS VIEW 1: Current Package Shortages
@@ -78,54 +142,12 @@ WHERE status = 'Current'
 ORDER BY company_name, generic_name;
 
 -- ============================================
--- ANALYSIS VIEW 2: Multi-Package Shortage Products
--- Identifies products with shortages affecting multiple packages
--- ============================================
-
-CREATE OR REPLACE VIEW multi_package_shortages AS
-SELECT 
-    product_ndc,
-    shortage_generic_name AS generic_name,
-    company_name AS manufacturer,
-    COUNT(DISTINCT package_ndc) AS affected_packages
-FROM shortages_with_ndc
-WHERE product_ndc IS NOT NULL
-GROUP BY product_ndc, shortage_generic_name, company_name
-HAVING COUNT(DISTINCT package_ndc) > 1
-ORDER BY affected_packages DESC, company_name;
-
--- ============================================
--- ANALYSIS VIEW 3: Manufacturer Risk Assessment
--- Counts affected packages and products per manufacturer
+-- Manufacturer and package summaries
+-- multi_package_shortages, manufacturer_risk_analysis and
+-- current_manufacturer_risk are materialized summary tables rather than
+-- views: run sql/02b_summary_tables.sql next to build them.
 -- ============================================
 
-CREATE OR REPLACE VIEW manufacturer_risk_analysis AS
-SELECT 
-    company_name,
-    COUNT(DISTINCT package_ndc) AS affected_packages,
-    COUNT(DISTINCT product_ndc) AS affected_products,
-    COUNT(DISTINCT CASE WHEN status = 'Current' THEN package_ndc END) AS current_shortage_packages
-FROM shortages_with_ndc
-WHERE company_name IS NOT NULL
-GROUP BY company_name
-ORDER BY affected_packages DESC;
-
--- ============================================
--- ANALYSIS VIEW 4: Current Manufacturer Risk
--- Focus only on currently active shortages by manufacturer
--- ============================================
-
-CREATE OR REPLACE VIEW current_manufacturer_risk AS
-SELECT 
-    company_name,
-    COUNT(DISTINCT package_ndc) AS current_affected_packages,
-    COUNT(DISTINCT product_ndc) AS current_affected_products
-FROM shortages_with_ndc
-WHERE status = 'Current' 
-    AND company_name IS NOT NULL
-GROUP BY company_name
-ORDER BY current_affected_packages DESC;
-
 -- ============================================
 -- Verification Queries
 -- ============================================
@@ -0,0 +1,210 @@
+-- ============================================
+-- Summary Tables
+-- Materializes the manufacturer and package aggregates the dashboard and
+-- 03_analysis_queries.sql read, so they are not recomputed with
+-- COUNT(DISTINCT ...) GROUP BYs over shortages_with_ndc (or raw_ndc) on
+-- every query.
+--
+-- Run after 02_transformations.sql (scripts/transform_data.py runs both).
+-- Every table is built under a temporary name and all of them are swapped
+-- into place with one RENAME TABLE, so readers never see a mix of old and
+-- new summaries. summary_table_refresh records when each was last built.
+-- scripts/transform_data.py then publishes a new data version in
+-- pipeline_data_version, but only if the summaries' contents changed.
+-- ============================================
+
+USE fda_shortage_db;
+
+-- These used to be views; the first refresh replaces them with tables
+DROP VIEW IF EXISTS multi_package_shortages, manufacturer_risk_analysis, current_manufacturer_risk;
+
+DROP TABLE IF EXISTS multi_package_shortages_new, manufacturer_risk_analysis_new,
+                     current_manufacturer_risk_new, shortage_overview_new, labeler_portfolio_new;
+DROP TABLE IF EXISTS multi_package_shortages_old, manufacturer_risk_analysis_old,
+                     current_manufacturer_risk_old, shortage_overview_old, labeler_portfolio_old;
+
+CREATE TABLE IF NOT EXISTS summary_table_refresh (
+    table_name VARCHAR(64) PRIMARY KEY,
+    row_count INT NOT NULL,
+    refreshed_at TIMESTAMP(3) NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- One row per published change to the summaries (content_hash fingerprints
+-- their contents); the dashboard polls the latest refresh_id and keys its
+-- caches on it
+CREATE TABLE IF NOT EXISTS pipeline_data_version (
+    refresh_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    refreshed_at TIMESTAMP(3) NOT NULL,
+    content_hash CHAR(32) NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ============================================
+-- SUMMARY 1: Multi-Package Shortage Products
+-- Products with shortages affecting multiple packages.
+-- rank_no follows the old view's ORDER BY, so "top N" is a primary key range read.
+-- ============================================
+
+CREATE TABLE multi_package_shortages_new (
+    rank_no INT PRIMARY KEY,
+    product_ndc VARCHAR(20) NOT NULL,
+    generic_name TEXT,
+    manufacturer VARCHAR(255),
+    affected_packages INT NOT NULL,
+    INDEX idx_product_ndc (product_ndc),
+    INDEX idx_manufacturer (manufacturer)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT INTO multi_package_shortages_new
+SELECT
+    ROW_NUMBER() OVER (ORDER BY COUNT(DISTINCT package_ndc) DESC, company_name, product_ndc) AS rank_no,
+    product_ndc,
+    shortage_generic_name AS generic_name,
+    company_name AS manufacturer,
+    COUNT(DISTINCT package_ndc) AS affected_packages
+FROM shortages_with_ndc
+WHERE product_ndc IS NOT NULL
+GROUP BY product_ndc, shortage_generic_name, company_name
+HAVING COUNT(DISTINCT package_ndc) > 1;
+
+-- ============================================
+-- SUMMARY 2: Manufacturer Risk Assessment
+-- Affected packages and products per manufacturer
+-- ============================================
+
+CREATE TABLE manufacturer_risk_analysis_new (
+    rank_no INT PRIMARY KEY,
+    company_name VARCHAR(255) NOT NULL,
+    affected_packages INT NOT NULL,
+    affected_products INT NOT NULL,
+    current_shortage_packages INT NOT NULL,
+    UNIQUE KEY uq_company (company_name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT INTO manufacturer_risk_analysis_new
+SELECT
+    ROW_NUMBER() OVER (ORDER BY COUNT(DISTINCT package_ndc) DESC, company_name) AS rank_no,
+    company_name,
+    COUNT(DISTINCT package_ndc) AS affected_packages,
+    COUNT(DISTINCT product_ndc) AS affected_products,
+    COUNT(DISTINCT CASE WHEN status = 'Current' THEN package_ndc END) AS current_shortage_packages
+FROM shortages_with_ndc
+WHERE company_name IS NOT NULL
+GROUP BY company_name;
+
+-- ============================================
+-- SUMMARY 3: Current Manufacturer Risk
+-- Currently active shortages by manufacturer
+-- ============================================
+
+CREATE TABLE current_manufacturer_risk_new (
+    rank_no INT PRIMARY KEY,
+    company_name VARCHAR(255) NOT NULL,
+    current_affected_packages INT NOT NULL,
+    current_affected_products INT NOT NULL,
+    UNIQUE KEY uq_company (company_name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT INTO current_manufacturer_risk_new
+SELECT
+    ROW_NUMBER() OVER (ORDER BY COUNT(DISTINCT package_ndc) DESC, company_name) AS rank_no,
+    company_name,
+    COUNT(DISTINCT package_ndc) AS current_affected_packages,
+    COUNT(DISTINCT product_ndc) AS current_affected_products
+FROM shortages_with_ndc
+WHERE status = 'Current'
+    AND company_name IS NOT NULL
+GROUP BY company_name;
+
+-- ============================================
+-- SUMMARY 4: Shortage Overview
+-- The dashboard's key metrics as a single row
+-- ============================================
+
+CREATE TABLE shortage_overview_new (
+    overview_id TINYINT PRIMARY KEY,
+    total_shortages INT NOT NULL,
+    affected_manufacturers INT NOT NULL,
+    affected_products INT NOT NULL,
+    current_shortages INT NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT INTO shortage_overview_new
+SELECT
+    1 AS overview_id,
+    COUNT(*) AS total_shortages,
+    COUNT(DISTINCT company_name) AS affected_manufacturers,
+    COUNT(DISTINCT product_ndc) AS affected_products,
+    COALESCE(SUM(CASE WHEN status = 'Current' THEN 1 ELSE 0 END), 0) AS current_shortages
+FROM shortages_with_ndc;
+
+-- ============================================
+-- SUMMARY 5: Labeler Portfolio
+-- Size of each labeler's NDC product portfolio, keyed by labeler_id
+-- (the labelers dimension), so portfolio comparisons join one small row
+-- per labeler instead of every raw_ndc product with the same name
+-- ============================================
+
+CREATE TABLE labeler_portfolio_new (
+    labeler_id BIGINT PRIMARY KEY,
+    labeler_name TEXT,
+    product_count INT NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT INTO labeler_portfolio_new
+SELECT
+    n.labeler_id,
+    MAX(l.labeler_name) AS labeler_name,
+    COUNT(*) AS product_count
+FROM raw_ndc n
+LEFT JOIN labelers l ON l.labeler_id = n.labeler_id
+WHERE n.labeler_id IS NOT NULL
+GROUP BY n.labeler_id;
+
+-- ============================================
+-- Swap all summaries into place at once
+-- (the empty placeholders only matter on the very first run)
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS multi_package_shortages LIKE multi_package_shortages_new;
+CREATE TABLE IF NOT EXISTS manufacturer_risk_analysis LIKE manufacturer_risk_analysis_new;
+CREATE TABLE IF NOT EXISTS current_manufacturer_risk LIKE current_manufacturer_risk_new;
+CREATE TABLE IF NOT EXISTS shortage_overview LIKE shortage_overview_new;
+CREATE TABLE IF NOT EXISTS labeler_portfolio LIKE labeler_portfolio_new;
+
+RENAME TABLE multi_package_shortages TO multi_package_shortages_old,
+             multi_package_shortages_new TO multi_package_shortages,
+             manufacturer_risk_analysis TO manufacturer_risk_analysis_old,
+             manufacturer_risk_analysis_new TO manufacturer_risk_analysis,
+             current_manufacturer_risk TO current_manufacturer_risk_old,
+             current_manufacturer_risk_new TO current_manufacturer_risk,
+             shortage_overview TO shortage_overview_old,
+             shortage_overview_new TO shortage_overview,
+             labeler_portfolio TO labeler_portfolio_old,
+             labeler_portfolio_new TO labeler_portfolio;
+
+DROP TABLE multi_package_shortages_old, manufacturer_risk_analysis_old,
+           current_manufacturer_risk_old, shortage_overview_old, labeler_portfolio_old;
+
+-- Record the refresh
+INSERT INTO summary_table_refresh (table_name, row_count, refreshed_at)
+SELECT * FROM (
+    SELECT 'multi_package_shortages' AS table_name, COUNT(*) AS row_count, CURRENT_TIMESTAMP(3) AS refreshed_at
+    FROM multi_package_shortages
+    UNION ALL
+    SELECT 'manufacturer_risk_analysis', COUNT(*), CURRENT_TIMESTAMP(3) FROM manufacturer_risk_analysis
+    UNION ALL
+    SELECT 'current_manufacturer_risk', COUNT(*), CURRENT_TIMESTAMP(3) FROM current_manufacturer_risk
+    UNION ALL
+    SELECT 'shortage_overview', COUNT(*), CURRENT_TIMESTAMP(3) FROM shortage_overview
+    UNION ALL
+    SELECT 'labeler_portfolio', COUNT(*), CURRENT_TIMESTAMP(3) FROM labeler_portfolio
+) AS refreshed
+ON DUPLICATE KEY UPDATE row_count = refreshed.row_count, refreshed_at = refreshed.refreshed_at;
+
+-- ============================================
+-- Verification Queries
+-- ============================================
+
+SELECT * FROM summary_table_refresh ORDER BY table_name;
+
+SELECT 'Summary tables refreshed successfully!' AS status;
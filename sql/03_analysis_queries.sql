@@ -6,6 +6,11 @@
 
 USE fda_shortage_db;
 
+-- Queries 1 and 3 read the summary tables built by 02b_summary_tables.sql.
+-- drug_type, package_type and route_group are classified once at load time
+-- (generated columns in 01_create_tables.sql), so Queries 2, 5 and 6 are
+-- plain GROUP BYs over the covering (status, ...) indexes.
+
 -- ============================================
 -- QUERY 1: Top Manufacturers by Current Shortage Risk
 -- Uses: product_ndc count (requires join to packaging and NDC)
@@ -17,6 +22,7 @@ SELECT
     current_affected_packages,
     current_affected_products
 FROM current_manufacturer_risk
+ORDER BY rank_no
 LIMIT 10;
 
 -- ============================================
@@ -26,16 +32,13 @@ LIMIT 10;
 -- ============================================
 
 SELECT 
-    CASE 
-        WHEN brand_name IS NOT NULL AND brand_name != '' THEN 'Branded Drug'
-        ELSE 'Generic/Unbranded'
-    END AS drug_type,
+    drug_type,
     COUNT(*) AS shortage_count,
     COUNT(DISTINCT company_name) AS manufacturers_affected,
-    ROUND(AVG(DATEDIFF(CURDATE(), STR_TO_DATE(initial_posting_date, '%Y%m%d'))), 0) AS avg_days_in_shortage
+    ROUND(AVG(DATEDIFF(CURDATE(), shortage_start_date)), 0) AS avg_days_in_shortage
 FROM shortages_with_ndc
 WHERE status = 'Current'
-    AND initial_posting_date IS NOT NULL
+    AND shortage_start_date IS NOT NULL
 GROUP BY drug_type
 ORDER BY shortage_count DESC;
 
@@ -51,6 +54,7 @@ SELECT
     affected_packages,
     product_ndc
 FROM multi_package_shortages
+ORDER BY rank_no
 LIMIT 15;
 
 -- ============================================
@@ -63,12 +67,12 @@ SELECT
     product_type,
     COUNT(*) AS current_shortages,
     COUNT(DISTINCT company_name) AS manufacturers,
-    ROUND(AVG(DATEDIFF(CURDATE(), STR_TO_DATE(initial_posting_date, '%Y%m%d'))), 0) AS avg_days_active,
-    MAX(DATEDIFF(CURDATE(), STR_TO_DATE(initial_posting_date, '%Y%m%d'))) AS longest_active_days
+    ROUND(AVG(DATEDIFF(CURDATE(), shortage_start_date)), 0) AS avg_days_active,
+    DATEDIFF(CURDATE(), MIN(shortage_start_date)) AS longest_active_days
 FROM shortages_with_ndc
 WHERE status = 'Current'
     AND product_type IS NOT NULL
-    AND initial_posting_date IS NOT NULL
+    AND shortage_start_date IS NOT NULL
 GROUP BY product_type
 ORDER BY current_shortages DESC;
 
@@ -79,19 +83,12 @@ ORDER BY current_shortages DESC;
 -- ============================================
 
 SELECT 
-    CASE 
-        WHEN package_description LIKE '%bottle%' THEN 'Bottle'
-        WHEN package_description LIKE '%vial%' THEN 'Vial'
-        WHEN package_description LIKE '%blister%' THEN 'Blister Pack'
-        WHEN package_description LIKE '%carton%' THEN 'Carton'
-        WHEN package_description LIKE '%kit%' THEN 'Kit'
-        ELSE 'Other/Unknown'
-    END AS package_type,
+    package_type,
     COUNT(*) AS shortage_count,
     COUNT(DISTINCT company_name) AS manufacturers
 FROM shortages_with_ndc
 WHERE status = 'Current'
-    AND package_description IS NOT NULL
+    AND package_type IS NOT NULL
 GROUP BY package_type
 ORDER BY shortage_count DESC;
 
@@ -102,26 +99,21 @@ ORDER BY shortage_count DESC;
 -- ============================================
 
 SELECT 
-    CASE 
-        WHEN route LIKE '%ORAL%' THEN 'Oral'
-        WHEN route LIKE '%INTRAVENOUS%' OR route LIKE '%IV%' THEN 'Intravenous'
-        WHEN route LIKE '%INJECTION%' THEN 'Injection'
-        WHEN route LIKE '%TOPICAL%' THEN 'Topical'
-        WHEN route LIKE '%INHALATION%' THEN 'Inhalation'
-        ELSE 'Other'
-    END AS administration_route,
+    route_group AS administration_route,
     COUNT(*) AS shortage_count,
     COUNT(DISTINCT product_ndc) AS products_affected
 FROM shortages_with_ndc
 WHERE status = 'Current'
-    AND route IS NOT NULL
-GROUP BY administration_route
+    AND route_group IS NOT NULL
+GROUP BY route_group
 ORDER BY shortage_count DESC;
 
 -- ============================================
 -- QUERY 7: Match Rate Analysis
--- Uses: Join success metrics
--- Value: Shows data quality and join effectiveness
+-- Uses: Join success metrics, ndc_match_method (scripts/ndc_matching.py)
+-- Value: Shows data quality and join effectiveness: shortages matched by
+--        the same package NDC, by the normalized 11-digit NDC, or only by
+--        generic name + company, and the shortages still unmatched
 -- ============================================
 
 SELECT 
@@ -141,6 +133,20 @@ WHERE product_ndc IS NOT NULL
 
 UNION ALL
 
+SELECT 
+    CASE ndc_match_method
+        WHEN 'exact' THEN '  - Same package NDC'
+        WHEN 'normalized' THEN '  - Normalized 11-digit NDC'
+        ELSE '  - Generic name + company (fuzzy)'
+    END AS metric,
+    COUNT(*) AS count,
+    ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM shortages_with_ndc), 2) AS percentage
+FROM shortages_with_ndc
+WHERE product_ndc IS NOT NULL
+GROUP BY ndc_match_method
+
+UNION ALL
+
 SELECT 
     'Unmatched (No NDC Found)' AS metric,
     COUNT(*) AS count,
@@ -181,31 +187,49 @@ SELECT
     package_description,
     product_type,
     initial_posting_date AS posted_date,
-    DATEDIFF(CURDATE(), STR_TO_DATE(initial_posting_date, '%Y%m%d')) AS days_active
+    DATEDIFF(CURDATE(), shortage_start_date) AS days_active
 FROM shortages_with_ndc
 WHERE status = 'Current'
     AND product_ndc IS NOT NULL
-ORDER BY days_active DESC
+    AND shortage_start_date IS NOT NULL
+ORDER BY shortage_start_date  -- oldest first = longest active; walks idx_status_start
 LIMIT 50;
 
 -- ============================================
 -- QUERY 10: Manufacturer Portfolio Size vs Shortage Risk
--- Uses: product_ndc to count total NDC portfolio vs shortages
+-- Uses: labeler_id to look up each manufacturer's NDC portfolio size
 -- Value: Tests if larger manufacturers have proportionally more shortages
--- ============================================
-
+-- (portfolio sizes come from the labeler_portfolio summary table; a
+-- company's portfolio is the sum over the distinct labelers its shortages
+-- matched, since every NDC product has exactly one labeler)
+-- ============================================
+
+WITH current_shortages AS (
+    SELECT company_name, labeler_id, product_ndc
+    FROM shortages_with_ndc
+    WHERE status = 'Current'
+        AND company_name IS NOT NULL
+),
+shortage_products AS (
+    SELECT company_name, COUNT(DISTINCT product_ndc) AS products_with_shortages
+    FROM current_shortages
+    GROUP BY company_name
+),
+portfolios AS (
+    SELECT c.company_name, SUM(p.product_count) AS total_ndc_portfolio
+    FROM (SELECT DISTINCT company_name, labeler_id FROM current_shortages) c
+    JOIN labeler_portfolio p ON p.labeler_id = c.labeler_id
+    GROUP BY c.company_name
+)
 SELECT 
     s.company_name,
-    COUNT(DISTINCT s.product_ndc) AS products_with_shortages,
-    COUNT(DISTINCT n.product_ndc) AS total_ndc_portfolio,
-    ROUND(COUNT(DISTINCT s.product_ndc) * 100.0 / COUNT(DISTINCT n.product_ndc), 2) AS shortage_rate_percent
-FROM shortages_with_ndc s
-LEFT JOIN raw_ndc n ON s.manufacturer = n.labeler_name
-WHERE s.status = 'Current'
-    AND s.company_name IS NOT NULL
-GROUP BY s.company_name
-HAVING COUNT(DISTINCT n.product_ndc) >= 5  -- Only manufacturers with 5+ products
-ORDER BY products_with_shortages DESC
+    s.products_with_shortages,
+    p.total_ndc_portfolio,
+    ROUND(s.products_with_shortages * 100.0 / p.total_ndc_portfolio, 2) AS shortage_rate_percent
+FROM shortage_products s
+JOIN portfolios p ON p.company_name = s.company_name
+WHERE p.total_ndc_portfolio >= 5  -- Only manufacturers with 5+ products
+ORDER BY s.products_with_shortages DESC, s.company_name
 LIMIT 20;
 
 -- ============================================
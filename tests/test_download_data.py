@@ -0,0 +1,167 @@
+"""
+Resumable downloads in scripts/download_data.py, against a local HTTP server
+
+The stand-in server serves one body with an ETag and implements Range,
+If-Range and If-None-Match the way download.open.fda.gov does. It can
+also cut a response off part way through, to leave a partial download.
+"""
+
+import http.server
+import os
+import sys
+import threading
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from download_data import download_to_file, load_validator, validator_path  # noqa: E402
+
+BODY = bytes(range(256)) * 400
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    """Serves BODY (or another body) and records the headers of every request"""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.body = BODY
+        self.etag = '"v1"'
+        self.cut_off_at = None
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/archive.zip"
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        headers = dict(self.headers)
+        server.requests.append(headers)
+        body = server.body
+
+        if headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.send_header('ETag', server.etag)
+            self.end_headers()
+            return
+
+        status, start = 200, 0
+        byte_range = headers.get('Range')
+        if byte_range and headers.get('If-Range', server.etag) == server.etag:
+            start = int(byte_range.removeprefix('bytes=').rstrip('-'))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(body)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        content = body[start:]
+        self.send_response(status)
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(len(content)))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{len(body) - 1}/{len(body)}')
+        self.end_headers()
+        if server.cut_off_at is not None:
+            self.wfile.write(content[:server.cut_off_at])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(content)
+
+
+@pytest.fixture
+def server():
+    server = StandInServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def part_file(tmp_path):
+    return str(tmp_path / 'archive.zip.part')
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_interrupted_download_resumes(server, part_file):
+    server.cut_off_at = 10000
+    with pytest.raises(requests.exceptions.RequestException):
+        download_to_file(server.url, part_file, chunk_size=1024)
+    partial = read(part_file)
+    assert 0 < len(partial) < len(BODY) and BODY.startswith(partial)
+    assert load_validator(part_file) == '"v1"'
+
+    server.cut_off_at = None
+    response = download_to_file(server.url, part_file)
+
+    assert response.status_code == 206
+    assert server.requests[-1]['Range'] == f'bytes={len(partial)}-'
+    assert server.requests[-1]['If-Range'] == '"v1"'
+    assert read(part_file) == BODY
+
+
+def test_changed_file_is_downloaded_again(server, part_file):
+    server.cut_off_at = 10000
+    with pytest.raises(requests.exceptions.RequestException):
+        download_to_file(server.url, part_file, chunk_size=1024)
+
+    # Upstream publishes a new archive before the resume
+    server.cut_off_at = None
+    server.body = BODY[::-1]
+    server.etag = '"v2"'
+    response = download_to_file(server.url, part_file, headers={'If-None-Match': '"v0"'})
+
+    assert response.status_code == 200
+    assert server.requests[-1]['If-Range'] == '"v1"'
+    assert read(part_file) == BODY[::-1]
+    assert load_validator(part_file) == '"v2"'
+
+
+def test_partial_without_validator_starts_over(server, part_file):
+    with open(part_file, 'wb') as f:
+        f.write(b'left over from an older version')
+
+    response = download_to_file(server.url, part_file)
+
+    assert response.status_code == 200
+    assert 'Range' not in server.requests[-1]
+    assert 'If-Range' not in server.requests[-1]
+    assert read(part_file) == BODY
+
+
+def test_range_not_satisfiable_starts_over_with_conditional_headers(server, part_file):
+    with open(part_file, 'wb') as f:
+        f.write(BODY + b'extra')
+    with open(validator_path(part_file), 'w') as f:
+        f.write('{"etag": "\\"v1\\"", "last_modified": null}')
+
+    response = download_to_file(server.url, part_file, headers={'If-None-Match': '"v0"'})
+
+    assert [r.get('Range') for r in server.requests] == [f'bytes={len(BODY) + 5}-', None]
+    assert server.requests[-1]['If-None-Match'] == '"v0"'
+    assert response.status_code == 200
+    assert read(part_file) == BODY
+
+
+def test_unchanged_file_is_not_downloaded(server, part_file):
+    response = download_to_file(server.url, part_file, headers={'If-None-Match': '"v1"'})
+
+    assert response.status_code == 304
+    assert not os.path.exists(part_file)
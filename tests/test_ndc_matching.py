@@ -0,0 +1,127 @@
+"""
+Shortage to NDC matching in scripts/ndc_matching.py
+
+Covers the package NDC normalization (the 4-4-2, 5-3-2 and 5-4-1 layouts,
+hyphen-less and 11-digit NDCs, codes that are not NDCs) and how
+match_shortages() picks exact, normalized and fuzzy matches on a small
+hand-made catalog.
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from ndc_matching import MATCH_COLUMNS, canonical_ndcs, match_shortages, ndc10_forms  # noqa: E402
+
+PACKAGING = pd.DataFrame({
+    'package_ndc': ['0409-4888-02', '12345-678-90', '54321-9876-1', '1111-2222-33', '11112-222-33'],
+    'product_ndc': ['0409-4888', '12345-678', '54321-9876', '1111-2222', '11112-222'],
+})
+
+PRODUCTS = pd.DataFrame({
+    'product_ndc': ['0409-4888', '12345-678', '54321-9876', '60505-0101'],
+    'generic_name': ['Heparin Sodium', 'Cisplatin', 'Lidocaine', 'Amoxicillin'],
+    'labeler_name': ['Hospira, Inc.', 'Acme Labs', 'Fresenius Kabi USA, LLC', 'Apotex Corp.'],
+})
+
+
+def shortages(*rows):
+    return pd.DataFrame(rows, columns=['package_ndc', 'generic_name', 'company_name'])
+
+
+def matched(matches, package_ndc):
+    return matches.set_index('package_ndc').loc[package_ndc]
+
+
+@pytest.mark.parametrize('ndc, expected', [
+    ('0409-4888-02', '00409488802'),   # 4-4-2
+    ('12345-678-90', '12345067890'),   # 5-3-2
+    ('54321-9876-1', '54321987601'),   # 5-4-1
+    ('409-4888-2', '00409488802'),     # dropped leading zeros
+    (' 0409-4888-02 ', '00409488802'),
+    ('00409488802', '00409488802'),    # 11 digits without hyphens
+])
+def test_canonical_ndcs_pads_every_segment(ndc, expected):
+    assert canonical_ndcs([ndc]).tolist() == [expected]
+
+
+@pytest.mark.parametrize('ndc', [
+    '0409488802',       # 10 digits without hyphens: the layout is unknown
+    '123456-1234-12',   # labeler segment too long
+    '0409-4888',        # product NDC, no package segment
+    '0409-4888-02-1',
+    'NDC 0409-4888-02',
+    'not an ndc',
+    '',
+    None,
+])
+def test_canonical_ndcs_leaves_other_codes_missing(ndc):
+    assert canonical_ndcs([ndc]).isna().all()
+
+
+def test_canonical_ndcs_keeps_the_index():
+    values = pd.Series(['0409-4888-02', 'bad'], index=[7, 3])
+    assert canonical_ndcs(values).index.tolist() == [7, 3]
+
+
+def test_ndc10_forms_lists_the_three_layouts():
+    forms = ndc10_forms(['1234567890'])
+    assert [form.iloc[0] for form in forms] == ['01234567890', '12345067890', '12345678900']
+
+
+def test_exact_and_normalized_matches():
+    matches = match_shortages(shortages(
+        ('0409-4888-02', 'Heparin Sodium Injection', 'Hospira, Inc.'),   # same string
+        ('409-4888-2', 'Heparin Sodium Injection', 'Hospira, Inc.'),     # dropped zeros
+        ('12345067890', 'Cisplatin Injection', 'Acme Labs'),             # 11 digits
+        ('5432198761', 'Lidocaine', 'Fresenius Kabi'),                   # 10 digits, 5-4-1 only
+    ), PACKAGING, PRODUCTS)
+
+    assert list(matches.columns) == MATCH_COLUMNS
+    exact = matched(matches, '0409-4888-02')
+    assert (exact['match_method'], exact['matched_package_ndc'], exact['match_score']) == ('exact', '0409-4888-02', 100)
+
+    for package_ndc, catalog_ndc, ndc11 in [('409-4888-2', '0409-4888-02', '00409488802'),
+                                            ('12345067890', '12345-678-90', '12345067890'),
+                                            ('5432198761', '54321-9876-1', '54321987601')]:
+        row = matched(matches, package_ndc)
+        assert row['match_method'] == 'normalized'
+        assert row['matched_package_ndc'] == catalog_ndc
+        assert row['ndc11'] == ndc11
+        assert row['match_score'] == 100
+
+
+def test_ambiguous_ten_digit_ndc_is_not_normalized():
+    # 1111222233 is 01111222233 (4-4-2) and 11112022233 (5-3-2), both in the catalog
+    matches = match_shortages(shortages(('1111222233', 'Unknown Drug', 'Nobody')), PACKAGING, PRODUCTS)
+    assert matches.empty
+
+
+def test_invalid_and_empty_codes_do_not_match():
+    matches = match_shortages(shortages(
+        ('not an ndc', 'Unknown Drug', 'Nobody'),
+        ('', 'Unknown Drug', 'Nobody'),
+        (None, 'Heparin Sodium', 'Hospira, Inc.'),
+    ), PACKAGING, PRODUCTS)
+    assert matches.empty
+
+
+def test_fuzzy_match_stays_within_its_generic_name_block():
+    matches = match_shortages(shortages(
+        # Not in the catalog, but the company and generic name are
+        ('60505-0101-99', 'Amoxicillin Capsules', 'Apotex Corp'),
+        # Same company and generic words, but the name starts with another
+        # word, so Amoxicillin products are in a different block
+        ('60505-0101-98', 'Clavulanate Potassium and Amoxicillin', 'Apotex Corp'),
+    ), PACKAGING, PRODUCTS)
+
+    assert matches['package_ndc'].tolist() == ['60505-0101-99']
+    fuzzy = matched(matches, '60505-0101-99')
+    assert fuzzy['match_method'] == 'fuzzy'
+    assert fuzzy['product_ndc'] == '60505-0101'
+    assert pd.isna(fuzzy['matched_package_ndc'])
+    assert fuzzy['match_score'] == 100  # every distinctive company and generic word in common
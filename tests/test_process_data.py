@@ -0,0 +1,113 @@
+"""
+NDC processing paths in scripts/process_data.py
+
+The streaming (--streaming) and shard-parallel (--workers) paths must write
+the same tables as the baseline in-memory path. A small NDC file is
+processed in batches of 2 records, so duplicate products and packages
+fall in different batches from their first occurrence.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from process_data import process_ndc, process_ndc_parallel, process_ndc_streaming  # noqa: E402
+from table_formats import read_arrow, table_path  # noqa: E402
+
+TABLES = ('labelers', 'ndc_core', 'ndc_packaging')
+
+
+def product(product_ndc, labeler_name, packages, **fields):
+    record = {
+        'product_ndc': product_ndc,
+        'generic_name': 'Heparin Sodium',
+        'labeler_name': labeler_name,
+        'brand_name': 'Heparin',
+        'finished': True,
+        'marketing_category': 'NDA',
+        'dosage_form': 'INJECTION, SOLUTION',
+        'route': ['INTRAVENOUS', 'SUBCUTANEOUS'],
+        'product_type': 'HUMAN PRESCRIPTION DRUG',
+        'marketing_start_date': '20200131',
+        'application_number': 'NDA017029',
+        'packaging': [{'package_ndc': package_ndc, 'description': f'1 VIAL in 1 CARTON ({package_ndc})',
+                       'marketing_start_date': '20200201'} for package_ndc in packages],
+    }
+    record.update(fields)
+    return record
+
+
+RECORDS = [
+    product('0409-4888', 'Hospira, Inc.', ['0409-4888-02', '0409-4888-10']),
+    product('63323-540', 'Fresenius Kabi USA, LLC', ['63323-540-11'], route=['INTRAVENOUS']),
+    product('0409-1234', 'HOSPIRA INC', [], brand_name=None),
+    # Repeats the first product (a later label version): the first one wins
+    product('0409-4888', 'Hospira, Inc.', ['0409-4888-02', '0409-4888-20'], brand_name='Later'),
+    product('25021-400', 'Sagent Pharmaceuticals', ['25021-400-10'], marketing_start_date='bad date'),
+    {'product_ndc': '70121-1568', 'generic_name': 'Cisplatin', 'labeler_name': None},
+    product('0143-9876', 'Hikma Pharmaceuticals USA Inc.', ['0143-9876-01', '63323-540-11'],
+            application_number=None, packaging=None) | {'finished': False},
+]
+
+
+@pytest.fixture
+def ndc_file(tmp_path, monkeypatch):
+    # The processed tables are written to data/ under the working directory
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    path = os.path.join('data', 'drug-ndc-0001-of-0001.json')
+    with open(path, 'w') as f:
+        json.dump({'meta': {'results': {'total': len(RECORDS)}}, 'results': RECORDS}, f)
+    return path
+
+
+def written(fmt):
+    """Bytes of every table written in fmt"""
+    files = {}
+    for name in TABLES:
+        with open(table_path(name, fmt), 'rb') as f:
+            files[name] = f.read()
+    return files
+
+
+def run_path(path, ndc_file, fmt):
+    if path == 'streaming':
+        return process_ndc_streaming(ndc_file, batch_size=2, fmt=fmt)
+    if path == 'parallel':
+        return process_ndc_parallel(ndc_file, workers=2, batch_size=2, fmt=fmt)
+    return process_ndc(ndc_file, fmt)
+
+
+@pytest.mark.parametrize('path', ['streaming', 'parallel'])
+def test_csv_files_match_the_baseline(ndc_file, path):
+    baseline = run_path('baseline', ndc_file, 'csv')
+    expected = written('csv')
+
+    result = run_path(path, ndc_file, 'csv')
+
+    assert result == baseline
+    assert result['tables'] == {'labelers': 5, 'ndc_core': 6, 'ndc_packaging': 5}
+    assert written('csv') == expected
+
+
+@pytest.mark.parametrize('path', ['streaming', 'parallel'])
+def test_parquet_tables_match_the_baseline(ndc_file, path):
+    pytest.importorskip('pyarrow')
+    baseline = run_path('baseline', ndc_file, 'parquet')
+    expected = {name: read_arrow(name, 'parquet') for name in TABLES}
+
+    result = run_path(path, ndc_file, 'parquet')
+
+    assert result == baseline
+    # The batched paths write one row group per batch, so the files differ
+    # in layout only: the Arrow schema and contents must be identical (the
+    # pandas metadata records the first batch's NumPy dtypes, e.g. bool
+    # rather than object for a column without missing values)
+    for name in TABLES:
+        table = read_arrow(name, 'parquet')
+        assert table.schema.equals(expected[name].schema), name
+        assert table.equals(expected[name]), name